@@ -0,0 +1,129 @@
+import time
+import threading
+from rate_limiter import TokenBucket, AimdController
+
+STRATEGIES = ('round_robin', 'quota')
+
+class Account:
+    """
+    A sending account (see gmail_core.account_token_path) with its own rate limit and daily quota.
+    With a controller, the rate adapts to the account's send outcomes (see rate_limiter.AimdController).
+    """
+    def __init__(self, name, limiter, controller=None):
+        self.name = name
+        self.limiter = limiter
+        self.controller = controller
+
+    def to_dict(self):
+        return {
+            'name': self.name, 'rate': round(self.limiter.rate, 2), 'sent': self.limiter.sent, 'remaining': self.limiter.remaining,
+            'in_flight': self.limiter.in_flight, 'daily_limit': self.limiter.daily_limit,
+            'exhausted': self.limiter.wait_time() is None,
+        }
+
+class AccountPool:
+    """
+    The accounts a batch sends from. acquire() picks an account with daily quota left - in turn
+    ('round_robin') or the one with the most quota left ('quota') - skipping accounts still waiting on
+    their rate limit, and reserves a slot on it; the caller settles the slot with
+    account.limiter.commit() or release(). Shared by concurrent jobs like a single TokenBucket.
+    With rate_range=(floor, ceiling), each account's rate starts at rate and adapts within that range.
+    """
+    def __init__(self, names=(), rate=0.0, daily_limit=None, capacity=1, strategy='round_robin', rate_range=None):
+        if strategy not in STRATEGIES: raise ValueError(f"Unknown account strategy: {strategy!r}")
+        self.rate = rate
+        self.daily_limit = daily_limit
+        self.capacity = capacity
+        self.strategy = strategy
+        self.rate_range = rate_range
+        self._accounts = {}  # name -> Account, in rotation order
+        self._next = 0
+        self._lock = threading.Lock()
+        self.sync(names)
+
+    @classmethod
+    def single(cls, limiter, name, rate_range=None):
+        """Pool of one account using an existing TokenBucket."""
+        pool = cls(daily_limit=limiter.daily_limit, rate_range=rate_range)
+        pool._accounts[name] = pool._account(name, limiter)
+        return pool
+
+    def _account(self, name, limiter):
+        controller = None
+        if self.rate_range and limiter.rate > 0:  # An unlimited rate (0) stays unlimited
+            controller = AimdController(limiter, *self.rate_range, name=name)
+        return Account(name, limiter, controller)
+
+    def sync(self, names):
+        """Adds new accounts and drops the ones no longer listed; known accounts keep their counters."""
+        with self._lock:
+            current = dict(self._accounts)
+            self._accounts = {}
+            for name in names:
+                self._accounts[name] = current.get(name) or self._account(
+                    name, TokenBucket(self.rate, capacity=self.capacity, daily_limit=self.daily_limit))
+        return self
+
+    def get(self, name):
+        return self._accounts.get(name)
+
+    @property
+    def names(self):
+        return list(self._accounts)
+
+    def __len__(self):
+        return len(self._accounts)
+
+    def __iter__(self):
+        return iter(list(self._accounts.values()))
+
+    @property
+    def sent(self):
+        return sum(a.limiter.sent for a in self)
+
+    @property
+    def remaining(self):
+        """Daily slots left across all accounts (None when any account is unlimited)."""
+        remaining = [a.limiter.remaining for a in self]
+        return None if None in remaining else sum(remaining)
+
+    def has_quota(self, exclude=()):
+        return any(a.limiter.wait_time() is not None for a in self if a.name not in exclude)
+
+    def exhaust(self, name):
+        """Takes an account out of rotation for the rest of the day (its quota ran out server-side)."""
+        account = self.get(name)
+        if account: account.limiter.exhaust()
+
+    def new_day(self):
+        for account in self: account.limiter.new_day()
+
+    def acquire(self, exclude=()):
+        """Blocks until an account can send; returns it, or None once no account has daily quota left."""
+        while True:
+            with self._lock:
+                accounts = list(self._accounts.values())
+                start = self._next % len(accounts) if accounts else 0
+            candidates = []
+            for account in accounts[start:] + accounts[:start]:
+                if account.name in exclude: continue
+                wait = account.limiter.wait_time()
+                if wait is not None: candidates.append((account, wait))
+
+            if not candidates:
+                # In-flight sends may still fail and hand their slot back
+                if any(a.limiter.in_flight for a in accounts if a.name not in exclude):
+                    time.sleep(0.05)
+                    continue
+                return None
+            if self.strategy == 'quota':
+                candidates.sort(key=lambda c: -c[0].limiter.remaining if c[0].limiter.remaining is not None else float('-inf'))
+            ready = [account for account, wait in candidates if wait == 0]
+            if not ready:
+                time.sleep(min(wait for _, wait in candidates))
+                continue
+
+            account = ready[0]
+            if account.limiter.acquire():
+                with self._lock: self._next = accounts.index(account) + 1
+                return account
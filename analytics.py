@@ -0,0 +1,200 @@
+import os
+import sqlite3
+import hashlib
+import logging
+import datetime
+import threading
+from log_writer import SENT_FIELDS, TRACK_FIELDS, parse_line, log_files
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ANALYTICS_PATH = os.path.join(BASE_DIR, 'log', 'analytics.db')
+INGEST_CHUNK = 10000  # Lines applied per transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (log TEXT, key TEXT, name TEXT, offset INTEGER, PRIMARY KEY (log, key));
+CREATE TABLE IF NOT EXISTS sends (uid TEXT PRIMARY KEY, time TEXT, subject TEXT);
+CREATE TABLE IF NOT EXISTS opens (uid TEXT PRIMARY KEY, first_open TEXT, opens INTEGER);
+CREATE TABLE IF NOT EXISTS totals (
+    kind TEXT,
+    key TEXT,
+    sent INTEGER DEFAULT 0,
+    opens INTEGER DEFAULT 0,
+    unique_opens INTEGER DEFAULT 0,
+    open_seconds REAL DEFAULT 0,
+    PRIMARY KEY (kind, key)
+);
+"""
+KINDS = ('subject', 'day')
+
+class CampaignStats:
+    """
+    Open-rate statistics joining sent_history.log and track_history.log by uid, kept in a SQLite file.
+    refresh() reads only the lines appended to either log since the last call and folds them into
+    per-subject and per-day totals (sent, opens, unique opens, time to first open), so its cost follows
+    the new lines, not the history. Every sent line counts as a send; opens are attributed to the day and
+    subject of the first send of their uid, and an open whose send isn't ingested yet is held by uid and
+    counted once the send arrives.
+    Files are tracked by a hash of their first line, so rotated logs are not read twice; a log that
+    shrank triggers a full rebuild.
+    """
+    def __init__(self, sent_path, track_path, db_path=ANALYTICS_PATH):
+        self.logs = {'sent': (sent_path, SENT_FIELDS), 'track': (track_path, TRACK_FIELDS)}
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def refresh(self):
+        """Ingests new lines of both logs (sends first); returns the number of lines read."""
+        with self._lock:
+            try:
+                return self._refresh()
+            except _Rebuild as e:
+                logging.info(f"Analytics out of sync with {e}; rebuilding.")
+                self._reset()
+                return self._refresh()
+
+    def rebuild(self):
+        with self._lock:
+            self._reset()
+            return self._refresh()
+
+    def _reset(self):
+        for table in ('files', 'sends', 'opens', 'totals'): self._conn.execute(f"DELETE FROM {table}")
+        self._conn.commit()
+
+    def _refresh(self):
+        read = 0
+        for log in ('sent', 'track'):
+            path, fields = self.logs[log]
+            known = dict(self._conn.execute("SELECT key, offset FROM files WHERE log=?", (log,)).fetchall())
+            for file_path in log_files(path):
+                key = _first_line_key(file_path)
+                if key is None: continue
+                offset = known.get(key, 0)
+                try:
+                    size = os.path.getsize(file_path)
+                except OSError:
+                    continue
+                if size < offset: raise _Rebuild(file_path)
+                if size > offset: read += self._ingest(log, key, file_path, fields, offset)
+        return read
+
+    def _ingest(self, log, key, path, fields, offset):
+        apply = self._add_send if log == 'sent' else self._add_open
+        read, batch = 0, []
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b'\n'): break  # Partial line still being written
+                offset += len(raw)
+                read += 1
+                batch.append(raw)
+                if len(batch) >= INGEST_CHUNK:
+                    self._apply(apply, batch, fields, log, key, path, offset)
+                    batch = []
+        self._apply(apply, batch, fields, log, key, path, offset)
+        return read
+
+    def _apply(self, apply, batch, fields, log, key, path, offset):
+        """Applies a chunk of lines and records the new offset in the same transaction."""
+        with self._conn:
+            for raw in batch:
+                entry = dict(zip(fields, parse_line(raw.decode('utf-8', errors='replace'), fields)))
+                if entry.get('uid') and entry.get('time'): apply(entry)
+            self._conn.execute("INSERT OR REPLACE INTO files (log, key, name, offset) VALUES (?,?,?,?)",
+                               (log, key, os.path.basename(path), offset))
+
+    def _add_send(self, entry):
+        uid, sent_at, subject = entry['uid'], entry['time'], entry.get('subject', '')
+        if not self._conn.execute("INSERT OR IGNORE INTO sends (uid, time, subject) VALUES (?,?,?)",
+                                  (uid, sent_at, subject)).rowcount:
+            # A uid sent again still counts as a send; its opens stay joined to the first one
+            self._bump(subject, sent_at, sent=1)
+            return
+        opened = self._conn.execute("SELECT first_open, opens FROM opens WHERE uid=?", (uid,)).fetchone()
+        if opened: self._bump(subject, sent_at, 1, opened[1], 1, _seconds(sent_at, opened[0]))
+        else: self._bump(subject, sent_at, sent=1)
+
+    def _add_open(self, entry):
+        uid, opened_at = entry['uid'], entry['time']
+        known = self._conn.execute("SELECT first_open FROM opens WHERE uid=?", (uid,)).fetchone()
+        if known:
+            self._conn.execute("UPDATE opens SET opens = opens + 1, first_open = MIN(first_open, ?) WHERE uid=?", (opened_at, uid))
+        else:
+            self._conn.execute("INSERT INTO opens (uid, first_open, opens) VALUES (?,?,1)", (uid, opened_at))
+        send = self._conn.execute("SELECT time, subject FROM sends WHERE uid=?", (uid,)).fetchone()
+        if not send: return
+        if not known: self._bump(send[1], send[0], 0, 1, 1, _seconds(send[0], opened_at))
+        elif opened_at < known[0]:  # Out-of-order line: an earlier first open
+            self._bump(send[1], send[0], 0, 1, 0, _seconds(send[0], opened_at) - _seconds(send[0], known[0]))
+        else: self._bump(send[1], send[0], opens=1)
+
+    def _bump(self, subject, sent_at, sent=0, opens=0, unique_opens=0, open_seconds=0.0):
+        for kind, key in (('subject', subject), ('day', sent_at[:10])):
+            self._conn.execute(
+                "INSERT INTO totals (kind, key, sent, opens, unique_opens, open_seconds) VALUES (?,?,?,?,?,?) "
+                "ON CONFLICT (kind, key) DO UPDATE SET sent = sent + excluded.sent, opens = opens + excluded.opens, "
+                "unique_opens = unique_opens + excluded.unique_opens, open_seconds = open_seconds + excluded.open_seconds",
+                (kind, key, sent, opens, unique_opens, open_seconds))
+
+    def stats(self, by='day', since=None, until=None, subject=None, limit=100):
+        """
+        Rows of totals per day (newest first) or per subject (most sent first), each with the open rate
+        (unique opens / sent) and the average time to first open in seconds. Days filter with since/until
+        (YYYY-MM-DD, inclusive), subjects with a substring. Call refresh() first to include new lines.
+        """
+        if by not in KINDS: raise ValueError(f"by must be one of {KINDS}")
+        sql, args = "SELECT key, sent, opens, unique_opens, open_seconds FROM totals WHERE kind=?", [by]
+        if since and by == 'day':
+            sql += " AND key >= ?"
+            args.append(since)
+        if until and by == 'day':
+            sql += " AND key <= ?"
+            args.append(until)
+        if subject and by == 'subject':
+            sql += " AND key LIKE ? ESCAPE '\\'"
+            args.append('%' + subject.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        sql += " ORDER BY key DESC" if by == 'day' else " ORDER BY sent DESC, key"
+        with self._lock:
+            rows = self._conn.execute(sql + " LIMIT ?", args + [limit]).fetchall()
+        return [{
+            by: key, 'sent': sent, 'opens': opens, 'unique_opens': unique,
+            'open_rate': round(unique / sent, 4) if sent else None,
+            'avg_time_to_open': round(seconds / unique, 1) if unique else None,
+        } for key, sent, opens, unique, seconds in rows]
+
+    def totals(self):
+        with self._lock:
+            sent, opens, unique, seconds = self._conn.execute(
+                "SELECT COALESCE(SUM(sent), 0), COALESCE(SUM(opens), 0), COALESCE(SUM(unique_opens), 0), "
+                "COALESCE(SUM(open_seconds), 0) FROM totals WHERE kind='day'").fetchone()
+        return {'sent': sent, 'opens': opens, 'unique_opens': unique,
+                'open_rate': round(unique / sent, 4) if sent else None,
+                'avg_time_to_open': round(seconds / unique, 1) if unique else None}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class _Rebuild(Exception):
+    pass
+
+def _first_line_key(path):
+    """Identity of a log file that survives renames (rotation): a hash of its first complete line."""
+    try:
+        with open(path, 'rb') as f:
+            line = f.readline()
+    except OSError:
+        return None
+    return hashlib.sha1(line).hexdigest() if line.endswith(b'\n') else None
+
+def _seconds(sent_at, opened_at):
+    try:
+        delta = datetime.datetime.strptime(opened_at, "%Y-%m-%d %H:%M:%S") - datetime.datetime.strptime(sent_at, "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return 0.0
+    return max(0.0, delta.total_seconds())
@@ -1,25 +1,37 @@
 import os
 import sys
 import logging
-from gmail_core import get_credentials, TOKEN_PATH
+from gmail_core import get_credentials, account_token_path, list_accounts, DEFAULT_ACCOUNT
 from setup_logging import setup_logging
 
 setup_logging()
 
+# Usage: python3 auth.py [account] | python3 auth.py remove [account] | python3 auth.py list
 if __name__ == '__main__':
-    if len(sys.argv) > 1 and sys.argv[1].lower() == 'remove':
-        if os.path.exists(TOKEN_PATH):
-            os.remove(TOKEN_PATH)
-            logging.info("Token removed.")
+    command = sys.argv[1].lower() if len(sys.argv) > 1 else ''
+    if command == 'list':
+        for name in list_accounts(): print(name)
+    elif command == 'remove':
+        account = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_ACCOUNT
+        token_path = account_token_path(account)
+        if os.path.exists(token_path):
+            os.remove(token_path)
+            logging.info(f"Token removed ({account}).")
         else:
-            logging.info("No token found.")
+            logging.info(f"No token found ({account}).")
     else:
-        logging.info("Starting authentication...")
-        if os.path.exists(TOKEN_PATH):
+        account = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_ACCOUNT
+        logging.info(f"Starting authentication ({account})...")
+        try:
+            token_path = account_token_path(account)
+        except ValueError as e:
+            logging.error(str(e))
+            sys.exit(1)
+        if os.path.exists(token_path):
             logging.error("Token exists. Remove it first.")
         else:
             try:
-                creds = get_credentials()
+                creds = get_credentials(account)
                 if creds and creds.valid: logging.info("Authentication successful.")
             except Exception as e:
-                logging.error(f"Auth Error: {e}")
\ No newline at end of file
+                logging.error(f"Auth Error: {e}")
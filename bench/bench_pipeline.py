@@ -0,0 +1,260 @@
+"""
+Throughput benchmark for the send pipeline against a local fake Gmail/Sheets backend (fully offline).
+Each scenario runs in its own process so peak RSS is measured per scenario.
+
+Scenarios:
+  placeholders  replace_placeholders on subject + body
+  message       create_message (MIME build + base64)
+  csv           get_csv_data_as_objects (streaming CSV reader)
+  sheet         get_sheet_data (chunked batchGet with prefetch)
+  send          process_bulk_email end to end (CSV -> fake messages.send)
+  dryrun        process_bulk_email dry run (CSV -> mbox, no API calls; per-row build time)
+
+Reports rows/s, p50/p99 per-row latency and peak RSS at each size, with and without attachments.
+--save writes the results as JSON; --compare fails (exit 1) when a scenario is slower or bigger than the
+saved baseline by more than --tolerance, so the suite can guard against regressions in CI.
+
+--accounts N shards the send scenario across N fake accounts; with --rate (messages/s per account)
+it shows how throughput scales with the number of accounts.
+
+--adaptive lets the send rate adapt (AIMD, starting at --rate, capped at --rate-max); with --capacity C the
+fake server answers 429 above C messages/s per account, so the run shows the rate the controller settles at.
+
+Usage: python3 bench/bench_pipeline.py [--rows 1000,10000,100000] [--scenarios send,csv] [--workers N] [--build-processes N]
+                                       [--latency S] [--error-rate F] [--rate-limit F] [--accounts N] [--rate R]
+                                       [--adaptive] [--rate-max R] [--capacity C]
+                                       [--save FILE] [--compare FILE] [--tolerance 0.25]
+"""
+import os
+import sys
+import csv
+import json
+import time
+import logging
+import argparse
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.append(BENCH_DIR)
+sys.path.append(ROOT)
+from fake_google import FakeGoogleServer, FakeSheet, write_token
+
+SCENARIOS = ('placeholders', 'message', 'csv', 'sheet', 'send', 'dryrun')
+ROWS = (1000, 10000, 100000)
+ATTACHMENT_KB = 32
+SHEET_ID = 'bench-sheet'
+HEADERS = ['email', 'name', 'plan', 'code', 'subject', 'attachment']
+SUBJECT = "Hello {{ name }}, your {{ plan }} update"
+BODY = "<html><body><p>Hi {{ name }},</p><p>Plan: {{ plan }} / Code: {{ code }}</p><p>Update attached.</p></body></html>"
+
+def make_row(i, attachment=''):
+    return [f'user{i}@example.com', f'User {i}', 'Pro', str(i), SUBJECT, attachment]
+
+def peak_rss_mb():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def percentile(values, q):
+    if not values: return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+# --- Child process: runs one scenario and prints a JSON result ---
+
+def timed_iter(rows):
+    """Consumes an iterator, timing the gap before each row."""
+    latencies = []
+    last = time.perf_counter()
+    for _ in rows:
+        now = time.perf_counter()
+        latencies.append(now - last)
+        last = now
+    return latencies
+
+def run_placeholders(args, tmp, attachment):
+    from gmail_core import replace_placeholders
+    from template_engine import template_values
+    latencies = []
+    for i in range(args.rows):
+        data = dict(zip(HEADERS, make_row(i, attachment)))
+        start = time.perf_counter()
+        values = template_values(data)
+        replace_placeholders(SUBJECT, data, values)
+        replace_placeholders(BODY, data, values)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def run_message(args, tmp, attachment):
+    from gmail_core import create_message
+    from message_builder import MessageSkeleton
+    files = [attachment] if attachment else []
+    skeleton = MessageSkeleton(files)  # Shared per attachment set, as build_rows does
+    latencies = []
+    for i in range(args.rows):
+        start = time.perf_counter()
+        create_message("me", f'user{i}@example.com', f'Hello User {i}', BODY, None, None, files, skeleton)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def run_csv(args, tmp, attachment):
+    from send_csv import get_csv_data_as_objects
+    return timed_iter(get_csv_data_as_objects(args.csv_path))
+
+def run_sheet(args, tmp, attachment):
+    from send_googlesheet import get_sheet_data
+    return timed_iter(get_sheet_data(SHEET_ID, 'Bench'))
+
+def run_send(args, tmp, attachment):
+    import gmail_core
+    from send_csv import get_csv_data_as_objects
+    started, latencies = {}, []
+    def notify(event, job, error=None):
+        uid = job['data'].get('__gmail_id')
+        if event == 'pending': started.setdefault(uid, time.perf_counter())
+        elif event in ('sent', 'failed') and uid in started: latencies.append(time.perf_counter() - started.pop(uid))
+    gmail_core.process_bulk_email(get_csv_data_as_objects(args.csv_path), daily_limit=args.rows * 2,
+                                  workers=args.workers, rate=args.rate or 1e9, notify=notify, build_processes=args.build_processes,
+                                  accounts='all' if args.accounts > 1 else None)
+    return latencies
+
+def run_dryrun(args, tmp, attachment):
+    import gmail_core
+    from send_csv import get_csv_data_as_objects
+    stats = gmail_core.process_bulk_email(get_csv_data_as_objects(args.csv_path), build_processes=args.build_processes,
+                                          dry_run=os.path.join(tmp, f'dry_run_{os.getpid()}.mbox'))
+    return stats.build_times
+
+def child(args):
+    import gmail_core
+    tmp = args.tmp
+    gmail_core.API_ENDPOINT = args.url
+    gmail_core.TOKEN_PATH = os.path.join(tmp, 'token.json')
+    gmail_core.TOKENS_DIR = os.path.join(tmp, 'tokens')
+    gmail_core.HISTORY_PATH = os.path.join(tmp, f'sent_history_{os.getpid()}.log')
+    gmail_core.FAILED_PATH = os.path.join(tmp, f'failed_history_{os.getpid()}.log')
+    gmail_core.HISTORY_DB_PATH = os.path.join(tmp, f'sent_history_{os.getpid()}.db')
+    gmail_core.ADAPTIVE_RATE = args.adaptive
+    gmail_core.SEND_RATE_MAX = args.rate_max
+    logging.basicConfig(level=logging.INFO, filename=os.path.join(tmp, 'process.log'),
+                        format='[%(asctime)s] [%(levelname)s] %(message)s')
+
+    start = time.perf_counter()
+    latencies = globals()[f"run_{args.scenario}"](args, tmp, args.attachment)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        'rows': len(latencies), 'seconds': round(elapsed, 3),
+        'rows_per_sec': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }))
+
+# --- Parent: fake backend, fixtures and reporting ---
+
+def write_fixtures(tmp, rows, attachment):
+    path = os.path.join(tmp, f"rows_{rows}_{'att' if attachment else 'plain'}.csv")
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADERS)
+        for i in range(rows): writer.writerow(make_row(i, attachment))
+    return path
+
+def run_scenario(args, server, tmp, scenario, rows, attachment):
+    sheet = FakeSheet('Bench', HEADERS, rows, lambda i: make_row(i, attachment))
+    server.sheets[SHEET_ID] = [sheet]
+    cmd = [sys.executable, os.path.abspath(__file__), '--child', scenario, '--rows', str(rows),
+           '--url', server.url, '--tmp', tmp, '--workers', str(args.workers), '--build-processes', str(args.build_processes),
+           '--accounts', str(args.accounts), '--rate', str(args.rate), '--rate-max', str(args.rate_max),
+           '--csv-path', write_fixtures(tmp, rows, attachment), '--attachment', attachment] + (['--adaptive'] if args.adaptive else [])
+    out = subprocess.run(cmd, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"{scenario} ({rows} rows) failed:\n{out.stderr}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def compare(results, baseline_path, tolerance):
+    """Returns the regressions of results against a saved run (slower, or more memory)."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {r['name']: r for r in json.load(f)}
+    regressions = []
+    for r in results:
+        base = baseline.get(r['name'])
+        if not base: continue
+        if r['rows_per_sec'] < base['rows_per_sec'] * (1 - tolerance):
+            regressions.append(f"{r['name']}: {r['rows_per_sec']:,.0f} rows/s (baseline {base['rows_per_sec']:,.0f})")
+        if r['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{r['name']}: peak RSS {r['peak_rss_mb']} MB (baseline {base['peak_rss_mb']} MB)")
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', default=','.join(map(str, ROWS)))
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--build-processes', type=int, default=0, help='Message build processes for the send scenario')
+    parser.add_argument('--latency', type=float, default=0.0, help='Fake server latency per request (seconds)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of sends answered with a 500')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='Fraction of sends answered with a 429')
+    parser.add_argument('--accounts', type=int, default=1, help='Sending accounts for the send scenario')
+    parser.add_argument('--rate', type=float, default=0.0, help='Send rate per account (messages/s, 0 = unlimited)')
+    parser.add_argument('--adaptive', action='store_true', help='Adapt the send rate (AIMD) instead of holding --rate')
+    parser.add_argument('--rate-max', type=float, default=100.0, help='Ceiling of the adaptive rate (messages/s per account)')
+    parser.add_argument('--capacity', type=float, default=0.0, help='Sends/s per account the fake server accepts before 429s')
+    parser.add_argument('--attachment-kb', type=int, default=ATTACHMENT_KB)
+    parser.add_argument('--no-attachments', action='store_true')
+    parser.add_argument('--save')
+    parser.add_argument('--compare')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    # Internal: set when the script re-runs itself for one scenario
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    parser.add_argument('--tmp', help=argparse.SUPPRESS)
+    parser.add_argument('--csv-path', help=argparse.SUPPRESS)
+    parser.add_argument('--attachment', default='', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.child:
+        args.scenario, args.rows = args.child, int(args.rows)
+        child(args)
+        sys.exit(0)
+
+    sizes = [int(n) for n in args.rows.split(',')]
+    scenarios = [s for s in args.scenarios.split(',') if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown: sys.exit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp, \
+         FakeGoogleServer(args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit,
+                          capacity=args.capacity or None) as server:
+        write_token(os.path.join(tmp, 'token.json'))
+        os.makedirs(os.path.join(tmp, 'tokens'))
+        for n in range(2, args.accounts + 1): write_token(os.path.join(tmp, 'tokens', f'account{n}.json'), f'bench{n}')
+        attachments = ['']
+        if not args.no_attachments:
+            path = os.path.join(tmp, 'attachment.bin')
+            with open(path, 'wb') as f: f.write(os.urandom(args.attachment_kb * 1024))
+            attachments.append(path)
+
+        print(f"{'scenario':<26}{'rows':>8}{'rows/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'RSS MB':>9}")
+        for scenario in scenarios:
+            for attachment in attachments:
+                for rows in sizes:
+                    name = f"{scenario}{'+att' if attachment else ''}/{rows}"
+                    r = dict(run_scenario(args, server, tmp, scenario, rows, attachment), name=name)
+                    results.append(r)
+                    print(f"{scenario + ('+att' if attachment else ''):<26}{rows:>8}{r['rows_per_sec']:>12,.0f}"
+                          f"{r['p50_ms']:>10.3f}{r['p99_ms']:>10.3f}{r['peak_rss_mb']:>9.1f}", flush=True)
+        if args.error_rate or args.rate_limit or args.capacity:
+            print(f"fake server: {server.sent} sent, {server.errors} errors, {server.rate_limited} rate-limited")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f: json.dump(results, f, indent=2)
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for line in regressions: print(f"REGRESSION {line}")
+        if regressions: sys.exit(1)
@@ -0,0 +1,49 @@
+"""
+Startup benchmark: import time of gmail_core and time-to-first-send for a single
+message (the send_one.py path) against a local fake Gmail endpoint.
+Usage: python3 bench/bench_startup.py [runs]
+"""
+import os
+import sys
+import json
+import tempfile
+import statistics
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.append(BENCH_DIR)
+from fake_google import FakeGoogleServer, write_token
+
+CHILD = """
+import time
+t0 = time.perf_counter()
+import sys, os, json
+sys.path.insert(0, {root!r})
+import gmail_core
+t1 = time.perf_counter()
+gmail_core.API_ENDPOINT = {url!r}
+gmail_core.TOKEN_PATH = os.path.join({tmp!r}, 'token.json')
+gmail_core.HISTORY_PATH = os.path.join({tmp!r}, 'sent_history.log')
+gmail_core.FAILED_PATH = os.path.join({tmp!r}, 'failed_history.log')
+gmail_core.HISTORY_DB_PATH = os.path.join({tmp!r}, 'sent_history.db')
+gmail_core.process_bulk_email([{{'email': 'someone@example.com', 'name': 'Bench', 'subject': 'Hi'}}], daily_limit=1)
+t2 = time.perf_counter()
+print(json.dumps({{'import': t1 - t0, 'first_send': t2 - t0}}))
+"""
+
+def run_once(url, tmp):
+    code = CHILD.format(root=ROOT, url=url, tmp=tmp)
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    with tempfile.TemporaryDirectory() as tmp, FakeGoogleServer() as server:
+        write_token(os.path.join(tmp, 'token.json'))
+        results = [run_once(server.url, tmp) for _ in range(runs)]
+        assert server.sent == runs, f"fake server saw {server.sent} sends, expected {runs}"
+
+    for key in ('import', 'first_send'):
+        values = [r[key] * 1000 for r in results]
+        print(f"{key:<11}: median {statistics.median(values):7.1f} ms  min {min(values):7.1f} ms")
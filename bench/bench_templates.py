@@ -0,0 +1,53 @@
+"""
+Micro-benchmark: compiled templates vs the previous per-row regex substitution.
+Usage: python3 bench/bench_templates.py [rows]
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gmail_core import replace_placeholders, DEFAULT_BODY
+from template_engine import template_values
+
+def legacy_replace_placeholders(text, data_dict):
+    """replace_placeholders as it was before the compiled template engine."""
+    if not text: return ""
+    lower_data = {k.lower(): str(v) for k, v in data_dict.items() if v is not None}
+    def replacer(match):
+        key = match.group(1).strip().lower()
+        return lower_data.get(key, match.group(0))
+    return re.sub(r'\{\{(.*?)\}\}', replacer, text)
+
+SUBJECT = "Hello {{ Name }}, your {{ plan }} update"
+BODY = DEFAULT_BODY.replace("</p><p>", "</p><p>Plan: {{ plan }} / Code: {{ code }} / {{ unknown }}</p><p>") * 5
+
+def make_rows(n):
+    return [{'email': f'user{i}@example.com', 'name': f'User {i}', 'plan': 'Pro', 'code': str(i),
+             'city': 'Somewhere', 'phone': '555-0100'} for i in range(n)]
+
+def run_legacy(rows):
+    for row in rows:
+        legacy_replace_placeholders(SUBJECT, row)
+        legacy_replace_placeholders(BODY, row)
+
+def run_compiled(rows):
+    for row in rows:
+        values = template_values(row)
+        replace_placeholders(SUBJECT, row, values)
+        replace_placeholders(BODY, row, values)
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rows = make_rows(n)
+    for row in rows[:100]:
+        assert legacy_replace_placeholders(BODY, row) == replace_placeholders(BODY, row)
+        assert legacy_replace_placeholders(SUBJECT, row) == replace_placeholders(SUBJECT, row)
+
+    legacy = min(timeit.repeat(lambda: run_legacy(rows), number=1, repeat=3))
+    compiled = min(timeit.repeat(lambda: run_compiled(rows), number=1, repeat=3))
+    print(f"rows={n}")
+    print(f"legacy   : {legacy:.3f}s ({n / legacy:,.0f} rows/s)")
+    print(f"compiled : {compiled:.3f}s ({n / compiled:,.0f} rows/s)")
+    print(f"speedup  : {legacy / compiled:.1f}x")
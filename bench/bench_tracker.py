@@ -0,0 +1,106 @@
+"""
+Load test for the open-tracking pixel server (tracker.py), fully offline. Starts the server in its own
+process on a free port with a temporary log, drives it with --connections keep-alive clients issuing
+--requests pixel hits in total (spread over --uids recipients), and reports hits/s and p50/p99 latency.
+Then checks that the server's in-memory counters and the flushed log both account for every hit.
+
+Client and server share the machine, so on a single core the reported rate is a lower bound.
+
+Usage: python3 bench/bench_tracker.py [--requests 50000] [--connections 50] [--uids 5000]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import signal
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    length = 0
+    for line in head.split(b'\r\n'):
+        if line.lower().startswith(b'content-length:'): length = int(line.split(b':', 1)[1])
+    return head, await reader.readexactly(length)
+
+async def client(port, hits, uids, offset, latencies):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    for i in range(hits):
+        uid = (offset + i) % uids
+        writer.write(f"GET /tracker?id=uid-{uid}&user=user{uid}%40example.com HTTP/1.1\r\n"
+                     f"Host: localhost\r\nUser-Agent: bench\r\n\r\n".encode())
+        start = time.perf_counter()
+        head, body = await read_response(reader)
+        latencies.append(time.perf_counter() - start)
+        if not head.startswith(b'HTTP/1.1 200') or not body.startswith(b'GIF89a'): raise RuntimeError(head.decode())
+    writer.close()
+
+async def fetch_stats(port, uid=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f"GET /stats{'?id=' + uid if uid else ''} HTTP/1.1\r\nConnection: close\r\n\r\n".encode())
+    _, body = await read_response(reader)
+    writer.close()
+    return json.loads(body)
+
+async def load(port, requests, connections, uids):
+    latencies = []
+    per_client = [requests // connections + (1 if i < requests % connections else 0) for i in range(connections)]
+    offsets = [sum(per_client[:i]) for i in range(connections)]
+    start = time.perf_counter()
+    await asyncio.gather(*(client(port, n, uids, off, latencies) for n, off in zip(per_client, offsets)))
+    return time.perf_counter() - start, sorted(latencies), await fetch_stats(port), await fetch_stats(port, 'uid-0')
+
+def wait_for_port(port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError('Tracker did not start')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=50000)
+    parser.add_argument('--connections', type=int, default=50)
+    parser.add_argument('--uids', type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = os.path.join(tmp, 'track_history.log')
+        port = free_port()
+        server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'tracker.py'), '--host', '127.0.0.1',
+                                   '--port', str(port), '--log', log_path],
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_port(port)
+            elapsed, latencies, stats, first = asyncio.run(load(port, args.requests, args.connections, args.uids))
+        finally:
+            server.send_signal(signal.SIGINT)
+            server.wait(timeout=30)
+        with open(log_path, encoding='utf-8') as f:
+            logged = sum(1 for _ in f)
+
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    print(f"{args.requests} hits over {args.connections} connections in {elapsed:.2f}s: "
+          f"{args.requests / elapsed:,.0f} hits/s  p50={pick(0.5):.2f}ms  p99={pick(0.99):.2f}ms  max={latencies[-1] * 1000:.2f}ms")
+    expected_first = len(range(0, args.requests, args.uids))
+    print(f"Server counters: {stats['hits']} hits, {stats['uids']} uids (uid-0: {first['opens']} opens); {logged} lines logged")
+    ok = stats['hits'] == logged == args.requests and stats['uids'] == min(args.uids, args.requests) and first['opens'] == expected_first
+    print('OK' if ok else 'MISMATCH')
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""
+Local stand-in for the Google endpoints this project calls, for offline benchmarks.
+Point gmail_core.API_ENDPOINT at FakeGoogleServer.url to use it.
+
+Serves Gmail messages.send (JSON body, resumable media upload or /batch) and the Sheets
+spreadsheets.get / values.get / values:batchGet calls.
+Sends can be made to fail: error_rate answers with error_status, rate_limit_rate with a
+429 rateLimitExceeded (and a Retry-After of retry_after seconds). With daily_quota, each access
+token (one per account, see write_token) gets that many sends before a 403 dailyLimitExceeded.
+With capacity, each token may send that many messages per second; faster sends get a 429 rateLimitExceeded.
+"""
+import re
+import json
+import email
+import time
+import random
+import datetime
+import threading
+import itertools
+from urllib.parse import urlsplit, parse_qs, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_SHEET_PATH = re.compile(r'/v4/spreadsheets/([^/:]+)(?:/values(?::batchGet|/(.+)))?$')
+_ROW_RANGE = re.compile(r'!?[A-Za-z]*(\d*)(?::[A-Za-z]*(\d*))?$')
+
+def write_token(path, token='bench'):
+    """Writes a token.json the Google client accepts without a refresh (valid for an hour)."""
+    expiry = (datetime.datetime.utcnow() + datetime.timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%SZ')
+    with open(path, 'w') as f:
+        json.dump({'token': token, 'refresh_token': 'bench', 'client_id': 'bench', 'client_secret': 'bench',
+                   'token_uri': 'https://oauth2.googleapis.com/token', 'expiry': expiry}, f)
+
+class FakeSheet:
+    """A spreadsheet tab whose rows are generated on demand: row(i) for data rows 0..row_count-1."""
+    def __init__(self, title, headers, row_count, row):
+        self.title = title
+        self.headers = list(headers)
+        self.row_count = row_count
+        self.row = row
+
+    def values(self, first, last):
+        """Sheet rows first..last (1-based, row 1 is the header row)."""
+        last = min(last, self.row_count + 1)
+        return [self.headers if n == 1 else self.row(n - 2) for n in range(max(first, 1), last + 1)]
+
+class FakeGoogleServer:
+    def __init__(self, latency=0.0, port=0, error_rate=0.0, error_status=500, rate_limit_rate=0.0, retry_after=0, seed=0,
+                 keep_uploads=False, daily_quota=None, capacity=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.sheets = {}  # spreadsheetId -> [FakeSheet]
+        self.sent = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.sheet_reads = 0
+        self.daily_quota = daily_quota
+        self.sent_by = {}   # access token -> messages sent
+        self.capacity = capacity
+        self._recent = {}   # access token -> send times within the last second (with capacity)
+        self.keep_uploads = keep_uploads
+        self.uploads = []   # Uploaded RFC 822 messages (with keep_uploads)
+        self._sessions = {} # upload_id -> [received bytes, total, data]
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def add_sheet(self, sheet_id, sheet):
+        self.sheets.setdefault(sheet_id, []).append(sheet)
+
+    def handle_send(self, body, token=''):
+        with self._lock:
+            if self.daily_quota is not None and self.sent_by.get(token, 0) >= self.daily_quota:
+                return 403, _error(403, 'dailyLimitExceeded', 'Daily user sending limit exceeded.'), {}
+            if self.capacity:
+                now = time.monotonic()
+                recent = [t for t in self._recent.get(token, ()) if now - t < 1.0]
+                self._recent[token] = recent
+                if len(recent) >= self.capacity:
+                    self.rate_limited += 1
+                    return 429, _error(429, 'rateLimitExceeded', 'Rate limit exceeded'), {'Retry-After': str(self.retry_after)}
+                recent.append(now)
+            roll = self._random.random()
+            if roll < self.rate_limit_rate:
+                self.rate_limited += 1
+                return 429, _error(429, 'rateLimitExceeded', 'Rate limit exceeded'), {'Retry-After': str(self.retry_after)}
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.errors += 1
+                return self.error_status, _error(self.error_status, 'backendError', 'Injected error'), {}
+            self.sent += 1
+            self.sent_by[token] = self.sent_by.get(token, 0) + 1
+            msg_id = next(self._ids)
+        return 200, {'id': f"{msg_id:016x}", 'threadId': f"{msg_id:016x}", 'labelIds': ['SENT']}, {}
+
+    def handle_batch(self, body, content_type, token=''):
+        """Answers a multipart/mixed batch of messages.send calls; returns (content type, multipart body)."""
+        batch = email.message_from_bytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+        boundary = f"batch_{next(self._ids):08x}"
+        parts = []
+        for part in batch.get_payload():
+            request = part.get_payload(decode=False)
+            status, payload, headers = self.handle_send(request.partition('\n\n')[2].encode(), token)
+            extra = ''.join(f"{k}: {v}\r\n" for k, v in headers.items())
+            parts.append(f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{part['Content-ID'][1:-1]}>\r\n\r\n"
+                         f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\nContent-Type: application/json\r\n{extra}\r\n"
+                         f"{json.dumps(payload)}\r\n")
+        return f"multipart/mixed; boundary={boundary}", (''.join(parts) + f"--{boundary}--\r\n").encode()
+
+    def start_upload(self, total, token=''):
+        with self._lock:
+            upload_id = f"u{next(self._ids)}"
+            self._sessions[upload_id] = [0, total, bytearray() if self.keep_uploads else None, token]
+        return upload_id
+
+    def handle_upload_chunk(self, upload_id, chunk):
+        """Resumable upload chunk: 308 with the received range until complete, then the send result."""
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is None: return 404, _error(404, 'notFound', 'Unknown upload session'), {}
+            session[0] += len(chunk)
+            if session[2] is not None: session[2] += chunk
+            if session[0] < session[1]: return 308, {}, {'Range': f"bytes=0-{session[0] - 1}"}
+            del self._sessions[upload_id]
+            if session[2] is not None: self.uploads.append(bytes(session[2]))
+        return self.handle_send(b'', session[3])
+
+    def handle_sheet(self, sheet_id, a1_range, query):
+        tabs = self.sheets.get(sheet_id)
+        if not tabs: return 404, _error(404, 'notFound', f'Requested entity was not found: {sheet_id}'), {}
+        if a1_range is None and 'ranges' not in query:
+            props = [{'properties': {'title': t.title, 'gridProperties': {'rowCount': t.row_count + 1}}} for t in tabs]
+            return 200, {'spreadsheetId': sheet_id, 'sheets': props}, {}
+        ranges = [a1_range] if a1_range is not None else query['ranges']
+        with self._lock:
+            self.sheet_reads += 1
+        value_ranges = [self._read_range(tabs, rng) for rng in ranges]
+        if a1_range is not None: return 200, value_ranges[0], {}
+        return 200, {'spreadsheetId': sheet_id, 'valueRanges': value_ranges}, {}
+
+    def _read_range(self, tabs, rng):
+        title, sep, cells = rng.rpartition('!')
+        if not sep: title, cells = cells, ''
+        title = title[1:-1].replace("''", "'") if title.startswith("'") else title
+        tab = next((t for t in tabs if t.title == title), tabs[0])
+        match = _ROW_RANGE.match(cells) if cells else None
+        first = int(match.group(1)) if match and match.group(1) else 1
+        last = int(match.group(2)) if match and match.group(2) else tab.row_count + 1
+        return {'range': rng, 'majorDimension': 'ROWS', 'values': tab.values(first, last)}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, payload, headers):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items(): self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _token(self):
+                return (self.headers.get('Authorization') or '').rpartition(' ')[2]
+
+            def _not_found(self):
+                self._reply(404, _error(404, 'notFound', f'Unknown path {self.path}'), {})
+
+            def do_GET(self):
+                if server.latency: time.sleep(server.latency)
+                url = urlsplit(self.path)
+                match = _SHEET_PATH.search(url.path)
+                if not match: return self._not_found()
+                sheet_id, a1_range = match.group(1), match.group(2)
+                if a1_range is not None: a1_range = unquote(a1_range)
+                self._reply(*server.handle_sheet(sheet_id, a1_range, parse_qs(url.query)))
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if server.latency: time.sleep(server.latency)
+                url = urlsplit(self.path)
+                if url.path.rstrip('/').endswith('/batch'):
+                    content_type, data = server.handle_batch(body, self.headers.get('Content-Type', ''), self._token())
+                    self.send_response(200)
+                    self.send_header('Content-Type', content_type)
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    return self.wfile.write(data)
+                if not url.path.endswith('/messages/send'): return self._not_found()
+                if url.path.startswith('/upload/'):
+                    upload_id = server.start_upload(int(self.headers.get('X-Upload-Content-Length') or 0), self._token())
+                    location = f"{server.url.rstrip('/')}{url.path}?uploadType=resumable&upload_id={upload_id}"
+                    return self._reply(200, {}, {'Location': location})
+                self._reply(*server.handle_send(body, self._token()))
+
+            def do_PUT(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if server.latency: time.sleep(server.latency)
+                upload_id = parse_qs(urlsplit(self.path).query).get('upload_id', [''])[0]
+                self._reply(*server.handle_upload_chunk(upload_id, body))
+
+        return Handler
+
+def _error(code, reason, message):
+    return {'error': {'code': code, 'message': message, 'errors': [{'reason': reason, 'message': message}]}}
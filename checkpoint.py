@@ -0,0 +1,84 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+
+FSYNC_EVERY = 100        # Entries between fsyncs
+FSYNC_INTERVAL = 2.0     # ...or seconds, whichever comes first
+ROW_ID_IGNORED = ('__gmail_id', '__track_id', 'tracker_url', 'campaign', '__attachments')
+
+def campaign_id(source):
+    """Deterministic campaign id for a source (CSV path, sheet id + tab, ...)."""
+    return 'c' + hashlib.sha1(str(source).encode('utf-8')).hexdigest()[:11]
+
+def row_uid(campaign, data):
+    """Deterministic row id from the campaign id and the row contents (stable across runs and resumes)."""
+    content = json.dumps(sorted((k, str(v)) for k, v in data.items() if k not in ROW_ID_IGNORED))
+    return hashlib.sha1(f"{campaign}\n{content}".encode('utf-8')).hexdigest()[:12]
+
+class CampaignJournal:
+    """
+    Append-only checkpoint journal of row states (pending, sent, failed) for one campaign.
+    Lines are 'state<TAB>uid'; the last state of a uid wins. Appends are buffered and fsynced in batches.
+    Each fresh run gets a nonce, stored in a '#run<TAB>nonce' header and reloaded on resume. Row uids stay
+    deterministic; track_id() appends the nonce, so sending the same source again later as a new run gets
+    new tracking ids (and sent-log uids) instead of reusing the earlier run's.
+    """
+    def __init__(self, campaign, directory, resume=False):
+        os.makedirs(directory, exist_ok=True)
+        self.campaign = campaign
+        self.path = os.path.join(directory, f"{campaign}.journal")
+        self.states = {}
+        self.nonce = None
+        resumed = resume and os.path.exists(self.path)
+        if resumed:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    state, _, uid = line.rstrip('\n').partition('\t')
+                    if state == '#run': self.nonce = uid
+                    elif uid: self.states[uid] = state
+            if self.nonce is None: self.nonce = ''  # Journal from before run nonces: keep its uids
+        self._file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+        if self.nonce is None:
+            self.nonce = uuid.uuid4().hex[:8]
+            self._file.write(f"#run\t{self.nonce}\n")
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def track_id(self, uid):
+        """Tracking id of a row uid in this run (the uid itself for journals from before run nonces)."""
+        return f"{uid}-{self.nonce}" if self.nonce else uid
+
+    @property
+    def done(self):
+        return sum(1 for s in self.states.values() if s in ('sent', 'failed'))
+
+    def state(self, uid):
+        return self.states.get(uid)
+
+    def record(self, uid, state):
+        with self._lock:
+            self.states[uid] = state
+            self._file.write(f"{state}\t{uid}\n")
+            self._unsynced += 1
+            if self._unsynced >= FSYNC_EVERY or time.monotonic() - self._last_sync >= FSYNC_INTERVAL:
+                self._sync()
+
+    def _sync(self):
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except OSError as e:
+            logging.error(f"Checkpoint sync failed: {e}")
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if self._file.closed: return
+            self._sync()
+            self._file.close()
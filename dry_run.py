@@ -0,0 +1,90 @@
+import os
+import re
+import time
+
+DRY_RUN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'log', 'dry_run')  # Default --dry-run target
+
+def dry_run_target(argv):
+    """The target of a --dry-run[=PATH] CLI option (a directory for .eml files, or a *.mbox file), else None."""
+    for arg in argv:
+        if arg == '--dry-run': return DRY_RUN_DIR
+        if arg.startswith('--dry-run='): return arg.split('=', 1)[1] or DRY_RUN_DIR
+    return None
+
+def open_sink(target):
+    """MboxWriter for a path ending in .mbox, EmlWriter (a directory of .eml files) otherwise."""
+    return MboxWriter(target) if target.lower().endswith('.mbox') else EmlWriter(target)
+
+class EmlWriter:
+    """Writes each message to <directory>/<row number>-<recipient>.eml."""
+    def __init__(self, directory):
+        self.path = directory
+        os.makedirs(directory, exist_ok=True)
+        self._count = 0
+
+    def write(self, job, raw):
+        self._count += 1
+        name = re.sub(r'[^A-Za-z0-9@._-]', '_', job.get('to') or 'unknown')[:80]
+        with open(os.path.join(self.path, f"{self._count:06d}-{name}.eml"), 'wb') as f:
+            f.write(raw)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class MboxWriter(EmlWriter):
+    """Appends every message to one mbox file (mboxrd: body lines starting with 'From ' are quoted)."""
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, 'wb', buffering=1024 * 1024)
+
+    def write(self, job, raw):
+        self._file.write(f"From MAILER-DAEMON {time.asctime()}\n".encode('ascii'))
+        self._file.write(re.sub(rb'(?m)^(>*From )', rb'>\1', raw))
+        self._file.write(b'\n' if raw.endswith(b'\n') else b'\n\n')
+
+    def close(self):
+        self._file.close()
+
+class DryRunStats:
+    """Per-row message size and build time of a dry run."""
+    def __init__(self):
+        self.sizes = []
+        self.build_times = []
+        self.skipped = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def add(self, job, size):
+        self.sizes.append(size)
+        self.build_times.append(job.get('build_seconds', 0.0))
+
+    def on_event(self, event, job, error=None):
+        if event == 'skipped': self.skipped += 1
+        elif event == 'failed': self.failed += 1
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    def summary(self):
+        rows = len(self.sizes)
+        lines = [f"Dry run: {rows} messages, {sum(self.sizes) / 1024 / 1024:.1f} MB in {self.elapsed:.2f}s "
+                 f"({rows / self.elapsed if self.elapsed else 0:,.0f} rows/s); {self.skipped} skipped, {self.failed} failed."]
+        if rows:
+            sizes, times = sorted(self.sizes), sorted(self.build_times)
+            lines.append(f"  size   min={sizes[0] / 1024:.1f}KB  p50={_pick(sizes, 0.5) / 1024:.1f}KB  "
+                         f"p99={_pick(sizes, 0.99) / 1024:.1f}KB  max={sizes[-1] / 1024:.1f}KB")
+            lines.append(f"  build  p50={_pick(times, 0.5) * 1000:.2f}ms  p99={_pick(times, 0.99) * 1000:.2f}ms  "
+                         f"max={times[-1] * 1000:.2f}ms")
+        return '\n'.join(lines)
+
+def _pick(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
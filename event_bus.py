@@ -0,0 +1,96 @@
+import json
+import time
+import logging
+import threading
+import itertools
+from collections import deque
+
+BUS_HISTORY = 1000      # Events kept for new or reconnecting subscribers
+HEARTBEAT = 15.0        # Seconds between keep-alive comments on idle streams
+
+_current_job = threading.local()
+
+def set_current_job(job_id):
+    """Tags log records from this thread with job_id (see BusLogHandler)."""
+    _current_job.id = job_id
+
+def current_job():
+    return getattr(_current_job, 'id', None)
+
+class EventBus:
+    """
+    In-process publish/subscribe bus with a bounded replay buffer.
+    The send loop publishes progress and log events; the UI streams them as Server-Sent Events.
+    """
+    def __init__(self, history=BUS_HISTORY):
+        self._events = deque(maxlen=history)
+        self._seq = itertools.count(1)
+        self._cond = threading.Condition()
+
+    @property
+    def last_id(self):
+        with self._cond:
+            return self._events[-1]['id'] if self._events else 0
+
+    def publish(self, event_type, data, job_id=None):
+        with self._cond:
+            event = {'id': next(self._seq), 'type': event_type, 'job_id': job_id, 'data': data}
+            self._events.append(event)
+            self._cond.notify_all()
+        return event['id']
+
+    def subscribe(self, since=0, job_id=None, tail=None, heartbeat=HEARTBEAT):
+        """
+        Yields events with id > since (None for heartbeats), filtered by job_id.
+        tail limits how many buffered events a new subscriber replays.
+        """
+        last = since
+        if tail is not None and not since:
+            with self._cond:
+                buffered = [e for e in self._events if _matches(e, job_id)]
+            if len(buffered) > tail: last = buffered[-tail - 1]['id']
+        while True:
+            with self._cond:
+                if not self._events or self._events[-1]['id'] <= last:
+                    self._cond.wait(heartbeat)
+                pending = [e for e in self._events if e['id'] > last]
+            if not pending:
+                yield None
+                continue
+            last = pending[-1]['id']
+            for event in pending:
+                if _matches(event, job_id): yield event
+
+def _matches(event, job_id):
+    return job_id is None or event['job_id'] == job_id
+
+def format_sse(event):
+    """Serializes an event (or None for a heartbeat) in text/event-stream format."""
+    if event is None: return ": keep-alive\n\n"
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+class BusLogHandler(logging.Handler):
+    """Publishes log records to the bus as 'log' events, tagged with the current job."""
+    def __init__(self, bus, level=logging.INFO):
+        super().__init__(level)
+        self.bus = bus
+
+    def emit(self, record):
+        try:
+            self.bus.publish('log', {'line': self.format(record)}, job_id=current_job())
+        except Exception:
+            self.handleError(record)
+
+class Throttle:
+    """Lets a call through at most once per interval (per key)."""
+    def __init__(self, interval):
+        self.interval = interval
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def ready(self, key=None):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last.get(key, 0) < self.interval: return False
+            self._last[key] = now
+            return True
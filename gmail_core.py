@@ -3,23 +3,25 @@ import sys
 import base64
 import re
 import time
-import mimetypes
 import random
 import string
 import logging
 import datetime
-from email.message import EmailMessage
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.image import MIMEImage
-from email.mime.audio import MIMEAudio
-from email.mime.base import MIMEBase
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from email import encoders
+import threading
+import itertools
+import metrics
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from rate_limiter import TokenBucket
+from accounts import AccountPool
+from preflight import Preflight
+from history_store import HistoryStore
+from message_builder import MessageSkeleton, SkeletonCache, MessageStream
+from template_engine import compile_template, template_values
+from checkpoint import CampaignJournal, row_uid
+from log_writer import LogWriter, SENT_FIELDS, FAILED_FIELDS
+from retry_queue import RetryQueue, classify_error, classify_error_text, retry_after, backoff_delay, error_status, is_quota_error
 
 SCOPES = [
     'https://www.googleapis.com/auth/gmail.send',
@@ -29,50 +31,183 @@ SCOPES = [
 
 # Configs
 ENABLE_TRACKING = True
-TRACKING_URL_BASE = "https://your-domain.com/tracker/tracker.php" # CHANGE THIS
+TRACKING_URL_BASE = "https://your-domain.com/tracker" # CHANGE THIS (tracker.py, or ui/server.py's /tracker)
 HISTORY_FILENAME = "sent_history.log"
 FAILED_FILENAME = "failed_history.log"
+SEND_WORKERS = 1        # >1 enables the concurrent send engine
+SEND_RATE = 1 / 1.5     # Messages per second per account (the starting rate when ADAPTIVE_RATE is on)
+ADAPTIVE_RATE = True    # Raise the rate while Gmail keeps up, back off on 429/5xx/slow sends (see rate_limiter.AimdController)
+SEND_RATE_MIN = 0.2     # Floor of the adaptive rate (messages/s per account, > 0)
+SEND_RATE_MAX = 2.5     # Ceiling of the adaptive rate (Gmail allows 250 quota units/s per user; a send costs 100)
+BATCH_SIZE = 0          # >0 groups messages.send calls into HTTP batch requests (Gmail allows up to 100, 50 recommended)
+BATCH_RETRIES = 2       # Extra attempts for rows that fail with a retryable error inside a batch
+BUILD_PROCESSES = 0     # >0 renders and builds messages in this many worker processes, ahead of the sender
+BUILD_CHUNK = 8         # Rows per build task (amortizes the inter-process transfer)
+BUILD_AHEAD = 2         # Tasks queued per build process (backpressure on the build stage)
+SKIP_ALREADY_SENT = None  # Dedupe mode: None (off), 'any', 'subject' or 'campaign'
+PREFLIGHT = True        # Validate addresses, drop duplicate rows and check attachments/sizes before rendering (see preflight.py)
+MEDIA_UPLOAD_THRESHOLD = 5 * 1024 * 1024  # Attachments at least this big are sent as a resumable media upload
+MEDIA_CHUNK_SIZE = 4 * 1024 * 1024        # Upload chunk size (a multiple of 256 KB)
+DRY_RUN_PROCESSES = None  # Build processes for dry runs (None = one per CPU core)
+SEND_ACCOUNTS = None    # Accounts to shard sends across: None (token.json only), 'all' (every authorized account) or a list of names
+ACCOUNT_STRATEGY = 'round_robin'  # 'round_robin', or 'quota' to favour the account with the most daily quota left
+DEFAULT_ACCOUNT = 'default'       # Name of the account whose token is token.json
+DEFAULT_BODY = "<html><body><p>Hi {{ name }},</p><p>Update attached.</p></body></html>"
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TOKEN_PATH = os.path.join(BASE_DIR, 'token.json')
+TOKENS_DIR = os.path.join(BASE_DIR, 'tokens')  # Tokens of additional sending accounts (<account>.json)
 CREDENTIALS_PATH = os.path.join(BASE_DIR, 'credentials.json')
 HISTORY_PATH = os.path.join(BASE_DIR, 'log', HISTORY_FILENAME)
 FAILED_PATH = os.path.join(BASE_DIR, 'log', FAILED_FILENAME)
+HISTORY_DB_PATH = os.path.join(BASE_DIR, 'log', 'sent_history.db')
+CHECKPOINT_DIR = os.path.join(BASE_DIR, 'log', 'campaigns')
+DISCOVERY_DIR = os.path.join(BASE_DIR, 'discovery')  # Bundled discovery documents (no runtime fetch)
+API_ENDPOINT = None  # Overrides the Google API root URL (e.g. a local fake server for benchmarks)
 
-def get_credentials():
-    creds = None
-    if os.path.exists(TOKEN_PATH):
-        creds = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
-    
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
+# The Google client libraries are imported lazily inside the functions that need them,
+# so importing this module (and sending a single message) does not pay for oauthlib/requests.
+
+REFRESH_MARGIN = 300  # Refresh the access token this many seconds before it expires
+
+# Process-wide credential and service pool (shared by the CLIs, the UI and worker threads), per account
+_creds = {}         # token path -> credentials
+_creds_stamp = {}   # token path -> (mtime, size) of the token file they were loaded from
+_creds_lock = threading.RLock()
+_services = threading.local()
+
+def account_token_path(account=None):
+    """token.json for the default account, tokens/<account>.json for the others."""
+    if not account or account == DEFAULT_ACCOUNT: return TOKEN_PATH
+    if not valid_account_name(account): raise ValueError(f"Invalid account name: {account!r}")
+    return os.path.join(TOKENS_DIR, f"{account}.json")
+
+def valid_account_name(account):
+    return bool(re.fullmatch(r'[A-Za-z0-9][A-Za-z0-9_.@+-]{0,63}', account or ''))
+
+def list_accounts():
+    """Names of the authorized accounts (those with a token file), the default account first."""
+    accounts = [DEFAULT_ACCOUNT] if os.path.exists(TOKEN_PATH) else []
+    if os.path.isdir(TOKENS_DIR):
+        names = sorted(f[:-5] for f in os.listdir(TOKENS_DIR) if f.endswith('.json'))
+        accounts += [n for n in names if n != DEFAULT_ACCOUNT and valid_account_name(n)]
+    return accounts
+
+def send_accounts(accounts=None):
+    """Resolves an accounts setting (None, 'all' or a list of names, see SEND_ACCOUNTS) to account names."""
+    if accounts is None: accounts = SEND_ACCOUNTS
+    if accounts is None: return [DEFAULT_ACCOUNT]
+    if accounts == 'all': return list_accounts() or [DEFAULT_ACCOUNT]
+    if isinstance(accounts, str): accounts = [a.strip() for a in accounts.split(',') if a.strip()]
+    return list(dict.fromkeys(accounts))
+
+def _token_stamp(path):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+def _expiring(creds):
+    if not creds.expiry: return False
+    return creds.expiry - datetime.datetime.utcnow() < datetime.timedelta(seconds=REFRESH_MARGIN)
+
+def _save_token(creds, path):
+    """Writes the token file atomically so readers never see a half-written file."""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as token:
+            token.write(creds.to_json())
+        os.replace(tmp_path, path)
+        _creds_stamp[path] = _token_stamp(path)
+    except PermissionError:
+        pass 
+
+def get_credentials(account=None):
+    """
+    Returns the cached credentials of an account, reloading its token file only when it changes on disk.
+    Tokens are refreshed under a lock shortly before they expire.
+    """
+    from google.oauth2.credentials import Credentials
+    path = account_token_path(account)
+    with _creds_lock:
+        stamp = _token_stamp(path)
+        if _creds.get(path) is None or stamp != _creds_stamp.get(path):
+            _creds[path] = Credentials.from_authorized_user_file(path, SCOPES) if stamp else None
+            _creds_stamp[path] = stamp
+        creds = _creds[path]
+
+        if creds and creds.valid and not _expiring(creds): return creds
+        if creds and creds.refresh_token:
+            from google.auth.transport.requests import Request
             creds.refresh(Request())
         else:
             if not os.path.exists(CREDENTIALS_PATH):
                 raise FileNotFoundError(f"credentials.json not found at {CREDENTIALS_PATH}")
+            from google_auth_oauthlib.flow import InstalledAppFlow
             flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_PATH, SCOPES)
             creds = flow.run_local_server(port=0)
-            
-        try:
-            with open(TOKEN_PATH, 'w') as token:
-                token.write(creds.to_json())
-        except PermissionError:
-            pass 
-    return creds
 
-def get_gmail_service():
-    return build('gmail', 'v1', credentials=get_credentials(), cache_discovery=False)
+        _creds[path] = creds
+        _save_token(creds, path)
+        return creds
+
+def reset_credentials(account=None):
+    """
+    Drops the cached credentials of an account (all accounts when None), e.g. after its token was
+    replaced or deleted; services rebuild on next use.
+    """
+    with _creds_lock:
+        if account is None:
+            _creds.clear()
+            _creds_stamp.clear()
+        else:
+            path = account_token_path(account)
+            _creds.pop(path, None)
+            _creds_stamp.pop(path, None)
+
+def _get_service(name, version, account=None):
+    """Per-thread service cache (per account); rebuilt when the credentials object changes."""
+    creds = get_credentials(account)
+    key = (name, version, account or DEFAULT_ACCOUNT)
+    cache = _services.__dict__.setdefault('cache', {})
+    cached = cache.get(key)
+    if cached and cached[0] is creds: return cached[1]
+    service = build_service(name, version, creds)
+    cache[key] = (creds, service)
+    return service
+
+def build_service(name, version, creds):
+    """
+    Builds a service with its own HTTP transport (httplib2 is not thread-safe).
+    Uses the discovery document bundled in discovery/ when there is one.
+    """
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.discovery import build, build_from_document
+    from googleapiclient.http import build_http
+    http = AuthorizedHttp(creds, http=build_http())  # Treats 308 as "resume incomplete", not a redirect
+    client_options = {'api_endpoint': API_ENDPOINT} if API_ENDPOINT else None
+    doc_path = os.path.join(DISCOVERY_DIR, f"{name}.{version}.json")
+    if os.path.exists(doc_path):
+        with open(doc_path, 'r', encoding='utf-8') as f:
+            return build_from_document(f.read(), http=http, client_options=client_options)
+    return build(name, version, http=http, cache_discovery=False, client_options=client_options)
+
+def get_gmail_service(account=None):
+    return _get_service('gmail', 'v1', account)
 
 def get_sheets_service():
-    return build('sheets', 'v4', credentials=get_credentials(), cache_discovery=False)
+    return _get_service('sheets', 'v4')
 
-def replace_placeholders(text, data_dict):
+def get_drive_service():
+    return _get_service('drive', 'v3')
+
+def replace_placeholders(text, data_dict, values=None):
+    """Renders {{ key }} placeholders (case-insensitive). Pass values from template_values() to reuse them."""
     if not text: return ""
-    lower_data = {k.lower(): str(v) for k, v in data_dict.items() if v is not None}
-    def replacer(match):
-        key = match.group(1).strip().lower()
-        return lower_data.get(key, match.group(0))
-    return re.sub(r'\{\{(.*?)\}\}', replacer, text)
+    if values is None: values = template_values(data_dict)
+    return compile_template(text).render(values)
 
 def validate_recipients(data_item):
     to = data_item.get('email') or data_item.get('to')
@@ -81,6 +216,8 @@ def validate_recipients(data_item):
     return True if any([to, cc, bcc]) else False
 
 def extract_attachments(data_item):
+    checked = data_item.get('__attachments')  # Already verified by the pre-flight stage
+    if checked is not None: return list(checked), []
     files = []
     logs = []
     for key, value in data_item.items():
@@ -93,151 +230,714 @@ def extract_attachments(data_item):
                 logs.append({'type': 'warning', 'msg': msg})
     return files, logs
 
-def create_message(sender, to, subject, body_html, cc=None, bcc=None, attachments=None):
-    message = MIMEMultipart()
-    message['from'] = sender
-    message['subject'] = subject
-    if to: message['to'] = to
-    if cc: message['cc'] = cc
-    if bcc: message['bcc'] = bcc 
-    
-    msg = MIMEText(body_html, 'html')
-    message.attach(msg)
-
-    if attachments:
-        for filepath in attachments:
-            if not os.path.exists(filepath): continue
-            ctype, encoding = mimetypes.guess_type(filepath)
-            if ctype is None or encoding is not None: ctype = 'application/octet-stream'
-            main_type, sub_type = ctype.split('/', 1)
-            try:
-                with open(filepath, 'rb') as f: file_data = f.read()
-                if main_type == 'text': part = MIMEText(file_data.decode('utf-8'), _subtype=sub_type)
-                elif main_type == 'image': part = MIMEImage(file_data, _subtype=sub_type)
-                elif main_type == 'audio': part = MIMEAudio(file_data, _subtype=sub_type)
-                else:
-                    part = MIMEBase(main_type, sub_type)
-                    part.set_payload(file_data)
-                    encoders.encode_base64(part)
-                part.add_header('Content-Disposition', 'attachment', filename=os.path.basename(filepath))
-                message.attach(part)
-            except Exception as e:
-                logging.error(f"Error attaching {filepath}: {e}")
+def create_message(sender, to, subject, body_html, cc=None, bcc=None, attachments=None, skeleton=None):
+    """
+    Builds the Gmail API message body. Attachments come from the shared AttachmentCache;
+    pass a MessageSkeleton to reuse the assembled attachment parts across a batch.
+    Messages with large attachments are returned as {'chunks': [...]} (RFC 822 bytes, never
+    base64-encoded as a whole) and sent as a media upload; see send_request.
+    """
+    start = metrics.clock()
+    if skeleton is None: skeleton = MessageSkeleton(attachments)
+    if skeleton.size >= MEDIA_UPLOAD_THRESHOLD:
+        chunks = skeleton.render_chunks(sender, to, subject, body_html, cc, bcc)
+        metrics.observe('mime', start)
+        return {'chunks': chunks}
+    raw = skeleton.render(sender, to, subject, body_html, cc, bcc)
+    metrics.observe('mime', start)
+    start = metrics.clock()
+    encoded = base64.urlsafe_b64encode(raw).decode()
+    metrics.observe('encode', start)
+    return {'raw': encoded}
+
+def send_request(service, msg):
+    """The messages.send request for a create_message body (a resumable media upload for large messages)."""
+    if 'chunks' not in msg: return service.users().messages().send(userId="me", body=msg)
+    from googleapiclient.http import MediaIoBaseUpload
+    media = MediaIoBaseUpload(MessageStream(msg['chunks']), mimetype='message/rfc822',
+                              chunksize=MEDIA_CHUNK_SIZE, resumable=True)
+    request = service.users().messages().send(userId="me", media_body=media)
+    if API_ENDPOINT:
+        # The client only swaps the host of upload URLs; keep the override's scheme too
+        from urllib.parse import urlsplit
+        request.uri = urlsplit(request.uri)._replace(scheme=urlsplit(API_ENDPOINT).scheme).geturl()
+    return request
+
+def message_size(msg):
+    """Bytes a create_message body puts on the wire (base64 text or raw RFC 822)."""
+    if 'chunks' in msg: return sum(len(chunk) for chunk in msg['chunks'])
+    return len(msg['raw'])
+
+def message_bytes(msg):
+    """The RFC 822 message of a create_message body."""
+    if 'chunks' in msg: return b''.join(msg['chunks'])
+    return base64.urlsafe_b64decode(msg['raw'])
 
-    return {'raw': base64.urlsafe_b64encode(message.as_bytes()).decode()}
+_history_lock = threading.Lock()
+
+_history_store = None
+
+# Sent/failed logs are appended by one background writer (grouped writes, fsync per batch, rotation)
+history_writer = LogWriter()
 
 def load_sent_history():
-    sent = set()
-    if os.path.exists(HISTORY_PATH):
-        try:
-            with open(HISTORY_PATH, 'r', encoding='utf-8') as f:
-                for line in f:
-                    parts = line.strip().split('‡')
-                    if len(parts) >= 3: sent.add(parts[2].strip()) # Index 2 is email
-                    elif line.strip(): sent.add(line.strip()) # Fallback for old logs
-        except Exception as e:
-            logging.error(f"Error reading history file: {e}")
-    return sent
+    """
+    Returns the process-wide HistoryStore (SQLite, indexed).
+    The legacy log/sent_history.log is imported into it once.
+    """
+    global _history_store
+    with _history_lock:
+        if _history_store is None:
+            try:
+                store = HistoryStore(HISTORY_DB_PATH)
+                store.import_log(HISTORY_PATH)
+                _history_store = store
+            except Exception as e:
+                logging.error(f"Error opening history store: {e}")
+                return None
+    return _history_store
+
+def tracking_uid(data):
+    """Uid of a row in the sent/failed logs and the tracking pixel: its run's tracking id, else its row uid."""
+    return data.get('__track_id') or data.get('__gmail_id', '')
 
-def log_sent_email(data_source, body_content, attachment_count):
+def log_sent_email(data_source, body_content, attachment_count, account=None):
+    start = metrics.clock()
     try:
-        os.makedirs(os.path.dirname(HISTORY_PATH), exist_ok=True)
         now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        uid = data_source.get('__gmail_id', '')
+        uid = tracking_uid(data_source)
         email = data_source.get('email') or data_source.get('to') or ''
         cc = data_source.get('cc') or ''
         bcc = data_source.get('bcc') or ''
         subject = data_source.get('subject') or ''
         
-        clean_body = body_content.replace('\n', ' ').replace('\r', '')
+        clean_body = body_content.replace('\n', ' ').replace('\r', '').replace('‡', '|')
         if len(clean_body) > 100: clean_body = clean_body[:97] + "..."
             
-        entry = f"{now}‡{uid}‡{email}‡{cc}‡{bcc}‡{subject}‡{clean_body}‡{attachment_count}\n"
-        with open(HISTORY_PATH, 'a', encoding='utf-8') as f:
-            f.write(entry)
+        account = account or DEFAULT_ACCOUNT
+        history_writer.write(HISTORY_PATH, SENT_FIELDS, (now, uid, email, cc, bcc, subject, clean_body, attachment_count, account))
+        store = load_sent_history()
+        if store: store.add_sent(now, uid, email, cc, bcc, subject, clean_body, attachment_count, data_source.get('campaign'), account)
     except Exception as e:
         logging.error(f"Failed to write to sent history: {e}")
+    metrics.observe('history', start)
 
-def log_failed_email(data_source, error_msg):
+def log_failed_email(data_source, error_msg, error_class=None):
     """
     Logs failed attempts to log/failed_history.log
-    Format: Timestamp ‡ Email ‡ Error Message
+    Format: Timestamp ‡ Email ‡ Error Message ‡ retryable|permanent ‡ UID ‡ Row JSON (or the same fields as JSON lines)
+    The row is kept so replay_failed.py can re-send it. error_class overrides the class derived from error_msg.
     """
     try:
-        os.makedirs(os.path.dirname(FAILED_PATH), exist_ok=True)
         now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         email = data_source.get('email') or data_source.get('to') or 'unknown'
         
         # Sanitize error message to fit on one line
         clean_error = str(error_msg).replace('\n', ' ').replace('\r', '').replace('‡', '|')
-        
-        entry = f"{now}‡{email}‡{clean_error}\n"
-        with open(FAILED_PATH, 'a', encoding='utf-8') as f:
-            f.write(entry)
+        if error_class is None:
+            error_class = classify_error(error_msg) if isinstance(error_msg, BaseException) else classify_error_text(clean_error)
+        uid = tracking_uid(data_source)
+        row = {k: v for k, v in data_source.items() if k not in ('tracker_url', '__attachments')}
+        history_writer.write(FAILED_PATH, FAILED_FIELDS, (now, email, clean_error, error_class, uid, row))
     except Exception as e:
         logging.error(f"Failed to write to failed history: {e}")
 
-def process_bulk_email(data_source_list, daily_limit=450):
-    logs = [] 
-    if not data_source_list:
-        logging.warning('No data provided to process.')
-        return logs
+def normalize_row(data):
+    """Lowercases and strips the keys of a data row."""
+    return {k.strip().lower(): v for k, v in data.items() if k}
+
+def render_email(data, default_body=DEFAULT_BODY):
+    """Renders a normalized, valid row into a job: recipient, final subject/body and attachment list."""
+    start = metrics.clock()
+    primary_email = data.get('email') or data.get('to')
+    if not data.get('__gmail_id'):
+        data['__gmail_id'] = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
+
+    raw_subject = data.get('subject', 'Update')
+    raw_body = data.get('body', default_body)
+
+    tracker = f"{TRACKING_URL_BASE}?id={tracking_uid(data)}&user={primary_email or 'unknown'}"
+    data['tracker_url'] = tracker
+
+    values = template_values(data)
+    for template in (raw_subject, raw_body):
+        if template: compile_template(template).check_keys(values)
+    final_subject = replace_placeholders(raw_subject, data, values)
+    final_body = replace_placeholders(raw_body, data, values)
+
+    if ENABLE_TRACKING and TRACKING_URL_BASE not in final_body:
+        pixel = f'<img src="{tracker}" width="1" height="1"/>'
+        final_body = final_body.replace('</body>', f'{pixel}</body>') if '</body>' in final_body else final_body + pixel
+
+    files, _ = extract_attachments(data)
+    metrics.observe('render', start)
+    return {'data': data, 'to': primary_email, 'subject': final_subject, 'body': final_body, 'files': files}
+
+def build_email(job, skeletons=None):
+    """Builds the Gmail API message for a rendered job (job['msg'])."""
+    data, files = job['data'], job['files']
+    skeleton = skeletons.get(files) if skeletons is not None else None
+    job['msg'] = create_message("me", job['to'], job['subject'], job['body'], data.get('cc'), data.get('bcc'), files, skeleton)
+    return job
+
+def prepare_email(data, default_body=DEFAULT_BODY, skeletons=None):
+    """
+    Normalizes a data row and renders it into a ready-to-send job.
+    Returns None if the row has no recipients.
+    """
+    data = normalize_row(data)
+    if not validate_recipients(data): return None
+    return build_email(render_email(data, default_body), skeletons)
+
+def _notify(notify, event, job, error=None):
+    if notify: notify(event, job, error)
+
+def send_prepared(service, job, retries=None, notify=None, failover=None):
+    """
+    Sends a prepared job and records the outcome in the history logs. Returns True on success.
+    With a RetryQueue, retryable errors requeue the row instead of logging it as failed.
+    failover(job, error) is offered quota errors first; it returns True if it requeued the row on another account.
+    notify(event, job, error) is called with 'sent', 'failed' or 'retry'.
+    """
+    from googleapiclient.errors import HttpError
+    primary_email = job['to']
+    try:
+        start, began = metrics.clock(), time.perf_counter()
+        try:
+            send_request(service, job['msg']).execute()
+        finally:
+            job['send_seconds'] = time.perf_counter() - began
+            metrics.observe('send', start)
+        log_sent_email(job['data'], job['body'], len(job['files']), job.get('account'))
+        logging.info(f"SENT: {primary_email}")
+        _notify(notify, 'sent', job)
+        return True
+    except HttpError as error:
+        if failover and is_quota_error(error) and failover(job, error):
+            _notify(notify, 'retry', job, error)
+            return False
+        if retries is not None and retries.push(job, error):
+            _notify(notify, 'retry', job, error)
+            return False
+        logging.error(f"Error sending to {primary_email}: {error}")
+        log_failed_email(job['data'], error)
+        _notify(notify, 'failed', job, error)
+    except Exception as e:
+        if retries is not None and retries.push(job, e):
+            _notify(notify, 'retry', job, e)
+            return False
+        logging.error(f"Unexpected error for {primary_email}: {e}")
+        log_failed_email(job['data'], e)
+        _notify(notify, 'failed', job, e)
+    return False
+
+def new_batch_request(service, callback):
+    """A batch request for service; with API_ENDPOINT it goes to <endpoint>batch like the other calls."""
+    if not API_ENDPOINT: return service.new_batch_http_request(callback=callback)
+    from googleapiclient.http import BatchHttpRequest
+    return BatchHttpRequest(callback=callback, batch_uri=API_ENDPOINT.rstrip('/') + '/batch')  # Gmail's batchPath
+
+def send_batch(service, jobs, http=None, retries=BATCH_RETRIES, notify=None, failover=None):
+    """
+    Sends jobs as one Gmail HTTP batch request. Each sub-response is mapped back to its row;
+    rows that fail with a retryable error are re-sent in a smaller batch, and quota errors are
+    offered to failover(job, error) first (see send_prepared).
+    Media uploads cannot be batched, so large messages are sent one by one with the same retries.
+    Returns a list of booleans (sent or not) aligned with jobs.
+    """
+    results = [False] * len(jobs)
+    pending = []
+    for idx, job in enumerate(jobs):
+        if 'chunks' in job['msg']: results[idx] = _send_single(service, job, retries, notify, failover)
+        else: pending.append(idx)
 
+    for attempt in range(retries + 1):
+        if not pending: break
+        errors = {}
+        def callback(request_id, response, exception):
+            idx = int(request_id)
+            if exception is not None:
+                errors[idx] = exception
+                return
+            job = jobs[idx]
+            job['send_seconds'] = time.perf_counter() - began
+            log_sent_email(job['data'], job['body'], len(job['files']), job.get('account'))
+            logging.info(f"SENT: {job['to']}")
+            results[idx] = True
+            _notify(notify, 'sent', job)
+
+        batch = new_batch_request(service, callback)
+        for idx in pending:
+            batch.add(service.users().messages().send(userId="me", body=jobs[idx]['msg']), request_id=str(idx))
+        start, began = metrics.clock(), time.perf_counter()
+        try:
+            batch.execute(http=http)
+        except Exception as e:
+            # The whole batch request failed; every row without an answer shares the error
+            for idx in pending:
+                if not results[idx] and idx not in errors: errors[idx] = e
+        metrics.observe('batch', start)
+
+        retry, wait = [], 0.0
+        for idx, error in errors.items():
+            if failover and is_quota_error(error) and failover(jobs[idx], error):
+                _notify(notify, 'retry', jobs[idx], error)
+                continue
+            if attempt < retries and classify_error(error) == 'retryable':
+                retry.append(idx)
+                wait = max(wait, retry_after(error) or 0.0)
+                _notify(notify, 'retry', jobs[idx], error)
+                continue
+            logging.error(f"Error sending to {jobs[idx]['to']}: {error}")
+            log_failed_email(jobs[idx]['data'], error)
+            _notify(notify, 'failed', jobs[idx], error)
+
+        pending = sorted(retry)
+        if not pending: break
+        logging.warning(f"Retrying {len(pending)} rows from batch (attempt {attempt + 2})...")
+        time.sleep(max(wait, backoff_delay(attempt + 1)))
+    return results
+
+class _BatchRetries:
+    """send_batch's retry policy for a row it sends on its own, in the shape of RetryQueue.push."""
+    def __init__(self, retries):
+        self.left = retries
+        self.wait = 0.0
+
+    def push(self, job, error):
+        if self.left <= 0 or classify_error(error) != 'retryable': return False
+        self.left -= 1
+        self.wait = retry_after(error) or 0.0
+        return True
+
+def _send_single(service, job, retries, notify=None, failover=None):
+    """send_prepared, retrying retryable errors up to retries times like the rows of a batch."""
+    policy = _BatchRetries(retries)
+    for attempt in range(retries + 1):
+        left = policy.left
+        if send_prepared(service, job, policy, notify, failover): return True
+        if policy.left == left: return False  # Sent elsewhere (failover) or failed for good
+        logging.warning(f"Retrying {job['to']} (attempt {attempt + 2})...")
+        time.sleep(max(policy.wait, backoff_delay(attempt + 1)))
+    return False
+
+def already_sent(history, data, dedupe):
+    """Checks the history store for a previous send according to the dedupe mode ('campaign' needs a campaign)."""
+    email = data.get('email') or data.get('to')
+    if not dedupe or not history or not email: return False
+    if dedupe == 'subject': return history.was_sent(email, subject=data.get('subject') or '')
+    if dedupe == 'campaign':
+        # Without a campaign there is nothing to scope to (was_sent(campaign=None) would match any send)
+        return bool(data.get('campaign')) and history.was_sent(email, campaign=data['campaign'])
+    return history.was_sent(email)
+
+# --- Streaming pipeline: source -> normalize -> validate -> render -> build -> send ---
+# Each stage is a generator, so only the rows in flight are held in memory.
+
+def normalize_rows(rows):
+    for data in rows:
+        if data: yield normalize_row(data)
+
+def validate_rows(rows, history=None, dedupe=None, campaign=None, journal=None, notify=None):
+    """
+    Drops rows without recipients and recipients already sent to.
+    Rows of a campaign get a deterministic uid (and, with a journal, a tracking id unique to the run);
+    rows the journal has completed are skipped.
+    """
+    for data in rows:
+        email = data.get('email') or data.get('to')
+        if not validate_recipients(data):
+            _notify(notify, 'skipped', {'data': data, 'to': email})
+            continue
+        if campaign:
+            if not data.get('campaign'): data['campaign'] = campaign
+            if not data.get('__gmail_id'): data['__gmail_id'] = row_uid(campaign, data)
+            if journal and not data.get('__track_id'): data['__track_id'] = journal.track_id(data['__gmail_id'])
+        if journal and _completed(journal, history, data):
+            logging.info(f"Skipped (completed in campaign {journal.campaign}): {email}")
+            _notify(notify, 'skipped', {'data': data, 'to': email})
+            continue
+        if already_sent(history, data, dedupe):
+            logging.info(f"Skipped (already sent): {email}")
+            _notify(notify, 'skipped', {'data': data, 'to': email})
+            continue
+        yield data
+
+def _completed(journal, history, data):
+    uid = data['__gmail_id']
+    state = journal.state(uid)
+    if state == 'pending' and history and history.find_uid(tracking_uid(data)):
+        journal.record(uid, 'sent')  # Sent, but the process died before the checkpoint was written
+        return True
+    return state in ('sent', 'failed')
+
+def _build_one(data, default_body, skeletons):
+    """render_email + build_email; the row's build time is kept in job['build_seconds']."""
+    start = time.perf_counter()
+    job = build_email(render_email(data, default_body), skeletons)
+    job['build_seconds'] = time.perf_counter() - start
+    return job
+
+def build_rows(rows, default_body=DEFAULT_BODY, notify=None, log_failures=True):
+    """Renders and builds rows in this process; a row whose build fails is reported and skipped."""
+    skeletons = SkeletonCache()  # Shared attachment parts, assembled once per attachment set
+    for data in rows:
+        try:
+            job = _build_one(data, default_body, skeletons)
+        except Exception as e:
+            _build_failed(data, e, notify, log_failures)
+            continue
+        yield job
+
+_worker_skeletons = None
+
+def _init_build_worker():
+    global _worker_skeletons
+    _worker_skeletons = SkeletonCache()  # Per worker process, for the lifetime of one batch
+
+def _build_chunk(rows, default_body):
+    """Worker side of build_rows_parallel: (job, None) or (None, error) per row."""
+    results = []
+    for data in rows:
+        try:
+            results.append((_build_one(data, default_body, _worker_skeletons), None))
+        except Exception as e:
+            results.append((None, e))
+    return results
+
+def build_rows_parallel(rows, processes, default_body=DEFAULT_BODY, notify=None, log_failures=True):
+    """
+    Renders and builds rows in a process pool, BUILD_CHUNK rows per task, keeping at most
+    processes * BUILD_AHEAD tasks in flight. Jobs come out in row order; a row whose build fails
+    is logged as failed and skipped. Stage timings of the build stay in the worker processes.
+    """
+    context = multiprocessing.get_context('spawn')  # fork is unsafe next to the sender and UI threads
+    pool = ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=_init_build_worker)
+    queue = deque()
+    try:
+        for chunk in _chunked(rows, BUILD_CHUNK):
+            queue.append((chunk, pool.submit(_build_chunk, chunk, default_body)))
+            if len(queue) >= processes * BUILD_AHEAD:
+                yield from _built(*queue.popleft(), notify, log_failures)
+        while queue:
+            yield from _built(*queue.popleft(), notify, log_failures)
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+def _chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk: return
+        yield chunk
+
+def _built(chunk, future, notify, log_failures=True):
     try:
-        service = get_gmail_service()
+        results = future.result()
     except Exception as e:
-        logging.critical(f"Authentication failed: {str(e)}")
+        results = [(None, e)] * len(chunk)
+    for data, (job, error) in zip(chunk, results):
+        if error is None: yield job
+        else: _build_failed(data, error, notify, log_failures)
+
+def _build_failed(data, error, notify, log_failures=True):
+    email = data.get('email') or data.get('to')
+    logging.error(f"Error building message for {email}: {error}")
+    if log_failures: log_failed_email(data, error)
+    _notify(notify, 'failed', {'data': data, 'to': email}, error)
+
+def iter_jobs(data_source_list, history=None, dedupe=None, campaign=None, journal=None, notify=None, processes=0,
+              log_failures=True, preflight=None):
+    """Yields prepared jobs for valid rows, skipping recipients already sent to (and rows a Preflight rejects)."""
+    valid = validate_rows(normalize_rows(data_source_list), history, dedupe, campaign, journal, notify)
+    if preflight: valid = preflight.filter(valid, notify)
+    if processes > 0: return build_rows_parallel(valid, processes, notify=notify, log_failures=log_failures)
+    return build_rows(valid, notify=notify, log_failures=log_failures)
+
+def controlled(jobs, control):
+    """Stops the job stream when control is cancelled and blocks it while control is paused."""
+    if control is None:
+        yield from jobs
+        return
+    for job in jobs:
+        if not control.wait():
+            logging.warning("Batch cancelled.")
+            return
+        yield job
+
+def process_bulk_email(data_source_list, daily_limit=450, workers=SEND_WORKERS, rate=SEND_RATE, batch_size=BATCH_SIZE,
+                       dedupe=SKIP_ALREADY_SENT, campaign=None, resume=False, notify=None, limiter=None, control=None,
+                       build_processes=BUILD_PROCESSES, accounts=None, dry_run=None):
+    """
+    Sends one message per row. data_source_list can be any iterable of dicts (list, CSV reader, generator);
+    rows are consumed lazily, so sending starts before the source has been fully read.
+    With a campaign, row states are checkpointed to log/campaigns/<campaign>.journal;
+    resume=True skips the rows a previous run of the campaign completed and reuses its tracking ids.
+    notify(event, job, error) receives 'pending', 'sent', 'failed', 'retry' and 'skipped' events.
+    A shared TokenBucket or AccountPool (limiter) coordinates rate and daily quota across concurrent jobs;
+    control (see job_manager.JobControl) lets the caller pause or cancel the batch.
+    build_processes > 0 builds messages in a process pool while the sender waits on the network.
+    accounts (None, 'all' or names, see SEND_ACCOUNTS) shards the rows across several sending accounts,
+    each with its own rate and daily_limit; a row whose account runs out of quota moves to another one.
+    dry_run (a directory, or a *.mbox file) builds every message without calling the API, writes it there
+    and returns the DryRunStats; see dry_run_bulk_email.
+    """
+    logs = [] 
+    rows = iter(data_source_list or ())
+    first = next(rows, None)
+    if first is None:
+        logging.warning('No data provided to process.')
         return logs
+    rows = itertools.chain([first], rows)
+    if dry_run: return dry_run_bulk_email(rows, dry_run, dedupe, campaign, notify, build_processes)
+
+    pool = _account_pool(limiter, accounts, rate, workers, daily_limit)
+    unusable = set()
+    for name in pool.names:
+        try:
+            get_gmail_service(name)
+        except Exception as e:
+            logging.critical(f"Authentication failed{f' for account {name}' if len(pool) > 1 else ''}: {str(e)}")
+            unusable.add(name)
+    if len(unusable) == len(pool): return logs
+    if len(pool) > 1: logging.info(f"Sending from {len(pool) - len(unusable)} accounts ({pool.strategy}).")
 
     sent_history = load_sent_history()
-    session_count = 0
-    default_body = "<html><body><p>Hi {{ name }},</p><p>Update attached.</p></body></html>"
+    journal = CampaignJournal(campaign, CHECKPOINT_DIR, resume=resume) if campaign else None
+    if journal and resume: logging.info(f"Resuming campaign {campaign}: {journal.done} rows already completed.")
+    sent_count = [0]
+    batch_metrics = metrics.snapshot() if metrics.ENABLED else None
+    notify = _with_journal(notify, journal)
+    notify = _with_counter(notify, sent_count)
+    notify = _with_metrics(notify)
+    notify = _with_rate_control(notify, pool)
 
-    for i, data in enumerate(data_source_list):
-        data = {k.strip().lower(): v for k, v in data.items() if k}
-        if not validate_recipients(data): continue
+    checks = Preflight() if PREFLIGHT else None
+    jobs = iter_jobs(rows, sent_history, dedupe, campaign, journal, notify, build_processes, preflight=checks)
+    retries = RetryQueue()
 
-        primary_email = data.get('email') or data.get('to')
-        # if primary_email and primary_email in sent_history: continue
-        if session_count >= daily_limit:
-            logging.warning(f"Daily limit of {daily_limit} reached.")
-            break
+    def failover(job, error):
+        """Retires an account that ran out of quota; its row goes back in the queue for another account."""
+        pool.exhaust(job.get('account'))
+        logging.warning(f"Account {job.get('account')} ran out of sending quota: {error}")
+        if len(pool) < 2 or not pool.has_quota(unusable): return False
+        retries.requeue(job)
+        return True
 
-        unique_id = data.get('__gmail_id')
-        if not unique_id:
-            unique_id = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
-            data['__gmail_id'] = unique_id
+    try:
+        if batch_size > 0:
+            _send_batched(jobs, pool, batch_size, retries, notify, control, failover, unusable)
+        elif workers > 1:
+            _send_concurrent(jobs, pool, workers, retries, notify, control, failover, unusable)
+        else:
+            for job in controlled(retries.iter(jobs), control):
+                account = pool.acquire(unusable)
+                if account is None:
+                    _limit_reached(pool)
+                    break
 
-        logging.info(f"Processing: {primary_email} (ID: {unique_id})...")
+                job['account'] = account.name
+                _dispatch(job, notify)
+                _send_on(account, job, retries, notify, failover)
 
-        raw_subject = data.get('subject', 'Update')
-        raw_body = data.get('body', default_body)
-        
-        tracker = f"{TRACKING_URL_BASE}?id={unique_id}&user={primary_email or 'unknown'}"
-        data['tracker_url'] = tracker
+        for job in retries.clear():
+            error = f"Retry abandoned (batch stopped after attempt {job.get('attempt', 1) - 1})"
+            log_failed_email(job['data'], error, 'retryable')  # Never failed for good: replay_failed.py re-sends it
+            _notify(notify, 'failed', job, error)
+    finally:
+        jobs.close()  # Stops the build stage (and its process pool) if the batch ended early
+        history_writer.flush()
+        if journal: journal.close()
+    logging.info(f"Batch complete. Sent {sent_count[0]} emails.")
+    if checks: logging.info(checks.report.summary())
+    if batch_metrics is not None: logging.info(metrics.summary(since=batch_metrics))
+    return logs
 
-        final_subject = replace_placeholders(raw_subject, data)
-        final_body = replace_placeholders(raw_body, data)
-        
-        if ENABLE_TRACKING and 'tracker.php' not in final_body:
-            pixel = f'<img src="{tracker}" width="1" height="1"/>'
-            final_body = final_body.replace('</body>', f'{pixel}</body>') if '</body>' in final_body else final_body + pixel
+def dry_run_bulk_email(rows, target, dedupe=None, campaign=None, notify=None, processes=0):
+    """
+    Runs the validation, render and create_message stages of a send (in processes, one per core by default)
+    and writes the messages to target instead of Gmail: a directory of .eml files, or one mbox file.
+    Nothing is sent or recorded (no checkpoint or history entries). Logs and returns per-row size/timing stats.
+    """
+    from dry_run import open_sink, DryRunStats
+    if not processes:
+        cores = os.cpu_count() or 1
+        processes = DRY_RUN_PROCESSES if DRY_RUN_PROCESSES is not None else (cores if cores > 1 else 0)
+    stats = DryRunStats()
+    def handler(event, job, error=None):
+        stats.on_event(event, job, error)
+        if notify: notify(event, job, error)
 
-        files, _ = extract_attachments(data)
-        msg = create_message("me", primary_email, final_subject, final_body, data.get('cc'), data.get('bcc'), files)
-        
+    logging.info(f"Dry run: writing messages to {target}" + (f" ({processes} build processes)" if processes else ""))
+    history = load_sent_history() if dedupe else None
+    checks = Preflight() if PREFLIGHT else None
+    jobs = iter_jobs(rows, history, dedupe, campaign, None, handler, processes, log_failures=False, preflight=checks)
+    try:
+        with open_sink(target) as sink:
+            for job in jobs:
+                raw = message_bytes(job['msg'])
+                sink.write(job, raw)
+                stats.add(job, len(raw))
+    finally:
+        jobs.close()
+    if checks: logging.info(checks.report.summary())
+    logging.info(stats.finish().summary())
+    return stats
+
+def preflight_check(data_source_list, dedupe=None, campaign=None):
+    """Runs only the validation and pre-flight stages over a source (nothing is rendered or sent); returns the report."""
+    checks = Preflight()
+    def skipped(event, job, error=None):
+        checks.report.rows += 1
+        checks.report.reject('no_recipient' if not validate_recipients(job['data']) else 'already_sent', job.get('to'))
+    history = load_sent_history() if dedupe else None
+    for _ in checks.filter(validate_rows(normalize_rows(data_source_list or ()), history, dedupe, campaign, notify=skipped)): pass
+    logging.info(checks.report.summary())
+    return checks.report
+
+def send_rate_range():
+    """(floor, ceiling) of the adaptive send rate, or None when ADAPTIVE_RATE is off."""
+    if not ADAPTIVE_RATE: return None
+    if not SEND_RATE_MIN > 0: raise ValueError(f"SEND_RATE_MIN must be > 0 (got {SEND_RATE_MIN})")
+    if SEND_RATE_MAX < SEND_RATE_MIN: raise ValueError(f"SEND_RATE_MAX ({SEND_RATE_MAX}) is below SEND_RATE_MIN ({SEND_RATE_MIN})")
+    return (SEND_RATE_MIN, SEND_RATE_MAX)
+
+def _account_pool(limiter, accounts, rate, workers, daily_limit):
+    """The AccountPool a batch sends from: the caller's pool, or one built from accounts (see send_accounts)."""
+    if isinstance(limiter, AccountPool): return limiter
+    names = send_accounts(accounts)
+    if limiter is not None: return AccountPool.single(limiter, names[0])  # The caller's TokenBucket keeps its rate
+    if len(names) == 1:
+        return AccountPool.single(TokenBucket(rate, capacity=max(1, workers), daily_limit=daily_limit), names[0], send_rate_range())
+    return AccountPool(names, rate, daily_limit, capacity=max(1, workers), strategy=ACCOUNT_STRATEGY, rate_range=send_rate_range())
+
+def _limit_reached(pool):
+    if len(pool) > 1: logging.warning(f"Daily limit reached on all {len(pool)} accounts.")
+    else: logging.warning(f"Daily limit of {pool.daily_limit} reached.")
+
+def _with_counter(notify, counter):
+    lock = threading.Lock()
+    def handler(event, job, error=None):
+        if event == 'sent':
+            with lock: counter[0] += 1
+        if notify: notify(event, job, error)
+    return handler
+
+def _with_metrics(notify):
+    """Counts sends, bytes, retries and failures (by HTTP status) for the metrics registry."""
+    if not metrics.ENABLED: return notify
+    def handler(event, job, error=None):
+        if event == 'sent':
+            metrics.inc('sent_total')
+            metrics.inc('bytes_sent_total', message_size(job['msg']))
+        elif event == 'retry':
+            metrics.inc('retries_total')
+        elif event == 'failed':
+            metrics.inc('failed_total', status=error_status(error) or 'none')
+        elif event == 'skipped':
+            metrics.inc('skipped_total')
+        if notify: notify(event, job, error)
+    return handler
+
+def _with_rate_control(notify, pool):
+    """Feeds each account's send outcomes (latency, rate-limit and server errors) to its rate controller."""
+    if not any(account.controller for account in pool): return notify
+    def handler(event, job, error=None):
+        account = pool.get(job.get('account'))
+        if account and account.controller:
+            if event == 'sent': account.controller.on_sent(job.get('send_seconds'))
+            elif event in ('retry', 'failed') and error is not None: account.controller.on_error(error)
+        if notify: notify(event, job, error)
+    return handler
+
+def _with_journal(notify, journal):
+    """Chains checkpoint journal writes in front of the caller's notify callback."""
+    if not journal: return notify
+    def handler(event, job, error=None):
+        if event in ('pending', 'sent', 'failed'): journal.record(job['data']['__gmail_id'], event)
+        if notify: notify(event, job, error)
+    return handler
+
+def _dispatch(job, notify):
+    logging.info(f"Processing: {job['to']} (ID: {job['data']['__gmail_id']})...")
+    _notify(notify, 'pending', job)
+
+def _send_on(account, job, retries, notify=None, failover=None):
+    """Sends job from account and settles the slot it reserved on the account's limiter."""
+    try:
+        ok = send_prepared(get_gmail_service(account.name), job, retries, notify, failover)
+    except Exception as e:
+        logging.error(f"Worker error for {job['to']}: {e}")
+        log_failed_email(job['data'], e)
+        _notify(notify, 'failed', job, e)
+        ok = False
+    if ok: account.limiter.commit()
+    else: account.limiter.release()
+    return ok
+
+def _send_concurrent(jobs, pool, workers, retries, notify=None, control=None, failover=None, exclude=()):
+    """Sends rows on a thread pool; each worker thread owns a Gmail service and transport per account."""
+    in_flight = threading.BoundedSemaphore(workers * 2)
+    active = [0]
+    active_lock = threading.Lock()
+
+    def worker(account, job):
+        try:
+            _send_on(account, job, retries, notify, failover)
+        finally:
+            with active_lock: active[0] -= 1
+            in_flight.release()
+            retries.wake()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for job in controlled(retries.iter(jobs, busy=lambda: active[0] > 0), control):
+            in_flight.acquire()
+            account = pool.acquire(exclude)
+            if account is None:
+                in_flight.release()
+                _limit_reached(pool)
+                break
+            job['account'] = account.name
+            _dispatch(job, notify)
+            with active_lock: active[0] += 1
+            executor.submit(worker, account, job)
+
+def _send_batched(jobs, pool, batch_size, retries, notify=None, control=None, failover=None, exclude=()):
+    """
+    Groups rows into HTTP batch requests of up to batch_size messages, one batch per account.
+    Rows that fail over to another account are sent once the source is drained.
+    """
+    pending = {}  # account name -> (account, rows waiting for a batch)
+    def flush(name):
+        account, batch = pending.pop(name)
         try:
-            service.users().messages().send(userId="me", body=msg).execute()
-            log_sent_email(data, final_body, len(files))
-            session_count += 1
-            logging.info(f"SENT: {primary_email}")
-            time.sleep(1.5)
-        except HttpError as error:
-            logging.error(f"Error sending to {primary_email}: {error}")
-            log_failed_email(data, error)
+            results = send_batch(get_gmail_service(name), batch, notify=notify, failover=failover)
         except Exception as e:
-            logging.error(f"Unexpected error for {primary_email}: {e}")
-            log_failed_email(data, e)
+            logging.error(f"Batch error for account {name}: {e}")
+            for job in batch:
+                log_failed_email(job['data'], e)
+                _notify(notify, 'failed', job, e)
+            results = [False] * len(batch)
+        for ok in results:
+            if ok: account.limiter.commit()
+            else: account.limiter.release()
 
-    logging.info(f"Batch complete. Sent {session_count} emails.")
-    return logs
\ No newline at end of file
+    source = jobs
+    while True:
+        stopped = False
+        for job in controlled(retries.iter(source), control):
+            if pending and not pool.has_quota(exclude):
+                for name in list(pending): flush(name)  # Settle pending rows; failures free up slots
+            account = pool.acquire(exclude)
+            if account is None:
+                _limit_reached(pool)
+                stopped = True
+                break
+            job['account'] = account.name
+            _dispatch(job, notify)
+            rows = pending.setdefault(account.name, (account, []))[1]
+            rows.append(job)
+            if len(rows) >= batch_size: flush(account.name)
+        for name in list(pending): flush(name)
+        if stopped or not len(retries) or (control and control.cancelled): break
+        source = ()
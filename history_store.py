@@ -0,0 +1,102 @@
+import os
+import sqlite3
+import logging
+import threading
+from log_writer import parse_line, SENT_FIELDS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sent (
+    id INTEGER PRIMARY KEY,
+    sent_at TEXT,
+    uid TEXT,
+    email TEXT,
+    cc TEXT,
+    bcc TEXT,
+    subject TEXT,
+    body TEXT,
+    attachments INTEGER,
+    campaign TEXT,
+    account TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sent_email ON sent(email, subject);
+CREATE INDEX IF NOT EXISTS idx_sent_uid ON sent(uid);
+CREATE INDEX IF NOT EXISTS idx_sent_date ON sent(sent_at);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+class HistoryStore:
+    """
+    SQLite-backed sent history, indexed on email, uid and date.
+    Replaces scanning log/sent_history.log into memory on every run.
+    """
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(sent)")}
+        if 'account' not in columns: self._conn.execute("ALTER TABLE sent ADD COLUMN account TEXT")  # Stores created before multi-account sending
+        self._conn.commit()
+
+    def import_log(self, log_path):
+        """One-time import of the legacy sent log ('‡' or JSON lines). Returns the number of rows imported."""
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM meta WHERE key='log_imported'").fetchone(): return 0
+            rows = []
+            if os.path.exists(log_path):
+                with open(log_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        parts = parse_line(line, SENT_FIELDS)
+                        if len(parts) >= 8:
+                            account = parts[8] if len(parts) >= 9 else None
+                            rows.append((parts[0], parts[1], parts[2].strip(), parts[3], parts[4], parts[5], parts[6], _to_int(parts[7]), account))
+                        elif len(parts) >= 3:
+                            rows.append((parts[0], parts[1], parts[2].strip(), '', '', '', '', 0, None))
+                        elif line.strip():
+                            rows.append(('', '', line.strip(), '', '', '', '', 0, None))  # Old logs held only the email
+            self._conn.executemany(
+                "INSERT INTO sent (sent_at, uid, email, cc, bcc, subject, body, attachments, account) VALUES (?,?,?,?,?,?,?,?,?)", rows)
+            self._conn.execute("INSERT INTO meta (key, value) VALUES ('log_imported', ?)", (str(len(rows)),))
+            self._conn.commit()
+        if rows: logging.info(f"Imported {len(rows)} entries from {log_path} into history store.")
+        return len(rows)
+
+    def add_sent(self, sent_at, uid, email, cc, bcc, subject, body, attachments, campaign=None, account=None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sent (sent_at, uid, email, cc, bcc, subject, body, attachments, campaign, account) VALUES (?,?,?,?,?,?,?,?,?,?)",
+                (sent_at, uid, email, cc, bcc, subject, body, attachments, campaign, account))
+            self._conn.commit()
+
+    def was_sent(self, email, subject=None, campaign=None):
+        """True if email already received a message, optionally scoped to a subject or campaign."""
+        sql, args = "SELECT 1 FROM sent WHERE email=?", [email]
+        if subject is not None:
+            sql += " AND subject=?"
+            args.append(subject)
+        if campaign is not None:
+            sql += " AND campaign=?"
+            args.append(campaign)
+        with self._lock:
+            return self._conn.execute(sql + " LIMIT 1", args).fetchone() is not None
+
+    def last_sent(self, email):
+        """Timestamp ('%Y-%m-%d %H:%M:%S') of the latest send to email, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(sent_at) FROM sent WHERE email=?", (email,)).fetchone()
+        return row[0] if row else None
+
+    def find_uid(self, uid):
+        with self._lock:
+            return self._conn.execute("SELECT sent_at, email, subject FROM sent WHERE uid=?", (uid,)).fetchone()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def _to_int(value):
+    try: return int(value)
+    except ValueError: return 0
@@ -0,0 +1,177 @@
+import time
+import uuid
+import logging
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from accounts import AccountPool
+from event_bus import Throttle, set_current_job
+import gmail_core
+
+MAX_JOBS = 2          # Jobs sending at the same time; others wait in the queue
+DAILY_LIMIT = 450     # Per sending account, shared by every job
+MAX_FINISHED = 100    # Finished jobs kept for /api/jobs
+PROGRESS_INTERVAL = 0.25  # Min seconds between progress events per job on the event bus
+
+_progress_throttle = Throttle(PROGRESS_INTERVAL)
+
+class JobControl:
+    """Pause/resume/cancel switch checked by process_bulk_email before each row."""
+    def __init__(self):
+        self.cancelled = False
+        self._running = threading.Event()
+        self._running.set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def cancel(self):
+        self.cancelled = True
+        self._running.set()
+
+    def wait(self):
+        """Blocks while paused. Returns False once cancelled."""
+        while not self._running.wait(1.0):
+            pass
+        return not self.cancelled
+
+class Job:
+    def __init__(self, kind, label, total=None, bus=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.bus = bus
+        self.kind = kind
+        self.label = label
+        self.total = total
+        self.status = 'queued'
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.sent = 0
+        self.failed = 0
+        self.skipped = 0
+        self.retries = 0
+        self.control = JobControl()
+        self._lock = threading.Lock()
+
+    def on_event(self, event, job, error=None):
+        """notify callback for process_bulk_email."""
+        with self._lock:
+            if event == 'sent': self.sent += 1
+            elif event == 'failed': self.failed += 1
+            elif event == 'skipped': self.skipped += 1
+            elif event == 'retry': self.retries += 1
+        if self.bus and event != 'pending' and _progress_throttle.ready(self.id):
+            self.publish('progress')
+
+    def publish(self, event_type='job'):
+        if self.bus: self.bus.publish(event_type, self.to_dict(), job_id=self.id)
+
+    @property
+    def done(self):
+        return self.sent + self.failed + self.skipped
+
+    def to_dict(self):
+        elapsed = ((self.finished or time.time()) - self.started) if self.started else 0
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if self.total and rate > 0 and self.status in ('running', 'paused'):
+            eta = max(0, self.total - self.done) / rate
+        status = 'paused' if self.status == 'running' and self.control.paused else self.status
+        return {
+            'id': self.id, 'kind': self.kind, 'label': self.label, 'status': status, 'error': self.error,
+            'total': self.total, 'done': self.done, 'sent': self.sent, 'failed': self.failed,
+            'skipped': self.skipped, 'retries': self.retries,
+            'rate': round(rate, 2), 'eta': round(eta) if eta is not None else None,
+            'created': self.created, 'started': self.started, 'finished': self.finished,
+        }
+
+class JobManager:
+    """
+    Runs send jobs on a fixed-size worker pool. All jobs share one AccountPool (a token bucket per
+    sending account), so concurrent jobs split each account's send rate and daily quota instead of competing for it.
+    """
+    def __init__(self, max_workers=MAX_JOBS, rate=gmail_core.SEND_RATE, daily_limit=DAILY_LIMIT, bus=None):
+        self.bus = bus
+        self.limiter = AccountPool(rate=rate, daily_limit=daily_limit, strategy=gmail_core.ACCOUNT_STRATEGY,
+                                   rate_range=gmail_core.send_rate_range())
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._day = datetime.date.today()
+
+    def submit(self, kind, label, func, *args, total=None, cleanup=None):
+        """
+        Queues func(job, *args); func should call process_bulk_email with notify=job.on_event,
+        control=job.control and limiter=self.limiter (see send_kwargs). cleanup() runs when the job ends.
+        """
+        job = Job(kind, label, total, self.bus)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        job.publish()
+        self._pool.submit(self._run, job, func, args, cleanup)
+        return job
+
+    def send_kwargs(self, job):
+        """Keyword arguments that tie a process_bulk_email call to this job (and the currently authorized accounts)."""
+        self.limiter.sync(gmail_core.send_accounts())
+        return {'notify': job.on_event, 'control': job.control, 'limiter': self.limiter}
+
+    def _run(self, job, func, args, cleanup):
+        set_current_job(job.id)
+        if job.control.cancelled:
+            job.status = 'cancelled'
+        else:
+            self._roll_day()
+            job.status = 'running'
+            job.started = time.time()
+            job.publish()
+            try:
+                func(job, *args)
+                job.status = 'cancelled' if job.control.cancelled else 'done'
+            except Exception as e:
+                logging.error(f"Job {job.id} failed: {e}")
+                job.status = 'failed'
+                job.error = str(e)
+        job.finished = time.time()
+        if cleanup:
+            try: cleanup()
+            except Exception as e: logging.error(f"Job {job.id} cleanup failed: {e}")
+        job.publish()
+        set_current_job(None)
+
+    def _roll_day(self):
+        today = datetime.date.today()
+        with self._lock:
+            if today != self._day:
+                self._day = today
+                self.limiter.new_day()
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if j.finished]
+        for j in sorted(finished, key=lambda j: j.finished)[:-MAX_FINISHED or None]:
+            del self._jobs[j.id]
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            jobs = sorted(self._jobs.values(), key=lambda j: j.created, reverse=True)
+        return [j.to_dict() for j in jobs]
+
+    def action(self, job_id, action):
+        """Applies 'pause', 'resume' or 'cancel'. Returns the job, or None if unknown."""
+        job = self.get(job_id)
+        if job is None or job.finished: return job
+        getattr(job.control, action)()
+        job.publish()
+        return job
@@ -1,7 +1,6 @@
 import json
 import logging
-from googleapiclient.discovery import build
-from gmail_core import get_credentials
+from gmail_core import get_credentials, get_drive_service
 
 def list_spreadsheets():
     """
@@ -12,7 +11,7 @@ def list_spreadsheets():
         if not creds:
             return json.dumps({"error": "No credentials found"})
 
-        service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+        service = get_drive_service()
         
         # Query for Google Sheets mimeType and not in trash
         query = "mimeType='application/vnd.google-apps.spreadsheet' and trashed=false"
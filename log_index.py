@@ -0,0 +1,180 @@
+import os
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+from log_writer import parse_line, log_files
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, name TEXT UNIQUE, size INTEGER, signature TEXT);
+CREATE TABLE IF NOT EXISTS entries (
+    file_id INTEGER,
+    offset INTEGER,
+    time TEXT,
+    email TEXT,
+    subject TEXT,
+    uid TEXT,
+    PRIMARY KEY (file_id, offset)
+);
+CREATE INDEX IF NOT EXISTS idx_entries_email ON entries(email, time);
+CREATE INDEX IF NOT EXISTS idx_entries_time ON entries(time);
+CREATE INDEX IF NOT EXISTS idx_entries_uid ON entries(uid);
+"""
+SIGNATURE_BYTES = 256  # Head of a log file used to notice that it was replaced or rotated
+
+class LogIndex:
+    """
+    Sidecar index (<log>.idx, SQLite) of line offsets and keys (time, email, subject, uid) for an
+    append-only log and its rotated copies. update() indexes only the bytes appended since the last call;
+    a file that shrank or whose head changed is re-indexed from scratch. Queries seek straight to the
+    matching lines, and a line that no longer matches its index entry triggers a rebuild.
+    """
+    def __init__(self, log_path, fields, index_path=None):
+        self.log_path = log_path
+        self.fields = fields
+        self.index_path = index_path or f"{log_path}.idx"
+        os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.index_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def update(self):
+        """Indexes new lines of every log file; returns the number of lines added."""
+        with self._lock:
+            return self._update()
+
+    def rebuild(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.execute("DELETE FROM files")
+            self._conn.commit()
+            return self._update()
+
+    def _update(self):
+        added = 0
+        paths = log_files(self.log_path)
+        known = {name: (fid, size, sig) for fid, name, size, sig in self._conn.execute("SELECT id, name, size, signature FROM files")}
+        for name in set(known) - {os.path.basename(p) for p in paths}:
+            self._forget(known.pop(name)[0])
+
+        for path in paths:
+            name = os.path.basename(path)
+            fid, indexed, old_signature = known.get(name, (None, 0, None))
+            try:
+                size = os.path.getsize(path)
+                signature = _signature(path, indexed)
+            except OSError:
+                continue
+            if fid is not None and (size < indexed or signature != old_signature):
+                logging.info(f"History index out of sync with {name}; re-indexing it.")
+                self._forget(fid)
+                fid, indexed = None, 0
+            if fid is None:
+                fid = self._conn.execute("INSERT INTO files (name, size, signature) VALUES (?, 0, ?)",
+                                         (name, _signature(path, 0))).lastrowid
+            if size > indexed: added += self._index_file(fid, path, indexed)
+        self._conn.commit()
+        return added
+
+    def _index_file(self, fid, path, start):
+        rows = []
+        with open(path, 'rb') as f:
+            f.seek(start)
+            offset = start
+            for raw in f:
+                if not raw.endswith(b'\n'): break  # Partial line still being written
+                keys = self._keys(raw)
+                if keys: rows.append((fid, offset) + keys)
+                offset += len(raw)
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO entries (file_id, offset, time, email, subject, uid) VALUES (?,?,?,?,?,?)", rows)
+        self._conn.execute("UPDATE files SET size=?, signature=? WHERE id=?", (offset, _signature(path, offset), fid))
+        return len(rows)
+
+    def _forget(self, fid):
+        self._conn.execute("DELETE FROM entries WHERE file_id=?", (fid,))
+        self._conn.execute("DELETE FROM files WHERE id=?", (fid,))
+
+    def _keys(self, raw):
+        entry = self._entry(raw)
+        if entry is None: return None
+        return (entry.get('time', ''), entry.get('email', '').strip().lower(), entry.get('subject', ''), entry.get('uid', ''))
+
+    def _entry(self, raw):
+        line = raw.decode('utf-8', errors='replace')
+        if not line.strip(): return None
+        parts = parse_line(line, self.fields)
+        if len(parts) < 3: return {'email': parts[0].strip()}  # Old logs held only the email
+        entry = dict(zip(self.fields, parts))
+        if 'row' in entry:
+            try: entry['row'] = json.loads(entry['row'])
+            except ValueError: entry['row'] = {}
+            if not entry.get('subject') and isinstance(entry['row'], dict): entry['subject'] = str(entry['row'].get('subject') or '')
+        return entry
+
+    def search(self, email=None, since=None, until=None, subject=None, uid=None, limit=50, offset=0):
+        """
+        Returns (total, entries) for the matching lines, newest first. email and uid match exactly
+        (email case-insensitively), subject is a substring, since/until are dates or timestamps (inclusive).
+        """
+        sql, args = " FROM entries e JOIN files f ON f.id = e.file_id WHERE 1=1", []
+        if email:
+            sql += " AND e.email = ?"
+            args.append(email.strip().lower())
+        if uid:
+            sql += " AND e.uid = ?"
+            args.append(uid)
+        if subject:
+            sql += " AND e.subject LIKE ? ESCAPE '\\'"
+            args.append('%' + subject.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        if since:
+            sql += " AND e.time >= ?"
+            args.append(since)
+        if until:
+            sql += " AND e.time <= ? AND e.time != ''"
+            args.append(until + ' 23:59:59' if len(until) == 10 else until)
+
+        for attempt in range(2):
+            with self._lock:
+                self._update()
+                total = self._conn.execute("SELECT COUNT(*)" + sql, args).fetchone()[0]
+                hits = self._conn.execute(
+                    "SELECT f.name, e.offset, e.email" + sql + " ORDER BY e.time DESC, f.id DESC, e.offset DESC LIMIT ? OFFSET ?",
+                    args + [limit, offset]).fetchall()
+            entries = self._read(hits)
+            if entries is not None: return total, entries
+            if attempt == 0:
+                logging.warning(f"History index for {self.log_path} is stale; rebuilding.")
+                self.rebuild()
+        return total, []
+
+    def _read(self, hits):
+        """Seeks to each hit; returns None if a line no longer matches the index."""
+        entries, handles = [], {}
+        directory = os.path.dirname(self.log_path)
+        try:
+            for name, offset, email in hits:
+                f = handles.get(name)
+                if f is None: f = handles[name] = open(os.path.join(directory, name), 'rb')
+                f.seek(offset)
+                entry = self._entry(f.readline())
+                if entry is None or entry.get('email', '').strip().lower() != email: return None
+                entries.append(entry)
+        except OSError:
+            return None
+        finally:
+            for f in handles.values(): f.close()
+        return entries
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def _signature(path, indexed):
+    """Hash of the head of the file, limited to the part already indexed (so appends don't change it)."""
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read(min(SIGNATURE_BYTES, indexed))).hexdigest()
@@ -0,0 +1,163 @@
+import os
+import glob
+import json
+import time
+import queue
+import atexit
+import logging
+import datetime
+import threading
+
+LOG_FLUSH_INTERVAL = 1.0              # Seconds appends are grouped before a write + fsync
+LOG_ROTATE_BYTES = 50 * 1024 * 1024   # Rotate a log once it would grow past this size (0 = never)
+LOG_ROTATE_DAILY = False              # Also rotate when the date changes
+LOG_JSONL = False                     # Write compact JSON lines instead of '‡'-separated lines
+
+SENT_FIELDS = ('time', 'uid', 'email', 'cc', 'bcc', 'subject', 'body', 'attachments', 'account')
+FAILED_FIELDS = ('time', 'email', 'error', 'class', 'uid', 'row')
+TRACK_FIELDS = ('time', 'uid', 'email', 'ip', 'agent')
+
+_STOP = object()
+
+def format_line(fields, values, jsonl=False):
+    if jsonl:
+        return json.dumps(dict(zip(fields, values)), ensure_ascii=False, separators=(',', ':'), default=str) + '\n'
+    return '‡'.join(json.dumps(v, default=str) if isinstance(v, (dict, list)) else str(v) for v in values) + '\n'
+
+def parse_line(line, fields):
+    """Splits a log line of either format into its '‡' parts (nested JSON values are re-serialized)."""
+    if line.startswith('{'):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            entry = None
+        if isinstance(entry, dict):
+            values = [entry.get(f) for f in fields]
+            return ['' if v is None else json.dumps(v) if isinstance(v, (dict, list)) else str(v) for v in values]
+    return line.rstrip('\n').split('‡')
+
+def log_files(path):
+    """Rotated copies of a log (oldest first) followed by the live file, if they exist."""
+    root, ext = os.path.splitext(path)
+    rotated = sorted(glob.glob(f"{glob.escape(root)}.*{ext}"))
+    return [p for p in rotated if p != path] + ([path] if os.path.exists(path) else [])
+
+class LogWriter:
+    """
+    Single background writer for the append-only logs. Entries are queued by any thread, grouped
+    for up to flush_interval, written through handles that stay open and fsynced per batch,
+    so concurrent senders never interleave partial lines. Files rotate by size and/or date.
+    flush() waits until everything queued so far is on disk; pending entries are flushed at exit.
+    """
+    def __init__(self, flush_interval=LOG_FLUSH_INTERVAL, rotate_bytes=LOG_ROTATE_BYTES,
+                 rotate_daily=LOG_ROTATE_DAILY, jsonl=LOG_JSONL):
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_daily = rotate_daily
+        self.jsonl = jsonl
+        self._queue = queue.Queue()
+        self._files = {}  # path -> (file, date opened)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def write(self, path, fields, values):
+        self._start()
+        self._queue.put((path, format_line(fields, values, self.jsonl)))
+
+    def flush(self, timeout=None):
+        """Blocks until entries queued before the call are written and synced."""
+        if not self._running(): return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None or not thread.is_alive(): return
+        self._queue.put(_STOP)
+        thread.join()
+
+    def _running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _start(self):
+        if self._running(): return
+        with self._lock:
+            if self._running(): return
+            self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while isinstance(batch[-1], tuple):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0: break
+                try: batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty: break
+            # Take whatever else is already queued without waiting
+            while isinstance(batch[-1], tuple):
+                try: batch.append(self._queue.get_nowait())
+                except queue.Empty: break
+            if not self._write_batch(batch): return
+
+    def _write_batch(self, batch):
+        touched = set()
+        for item in batch:
+            if not isinstance(item, tuple): continue
+            path, line = item
+            try:
+                f = self._open(path, len(line.encode('utf-8')))
+                f.write(line)
+                touched.add(path)
+            except OSError as e:
+                logging.error(f"Failed to write to {path}: {e}")
+        for path in touched:
+            try:
+                f = self._files[path][0]
+                f.flush()
+                os.fsync(f.fileno())
+            except (OSError, KeyError) as e:
+                logging.error(f"Failed to sync {path}: {e}")
+
+        stop = False
+        for item in batch:
+            if isinstance(item, threading.Event): item.set()
+            elif item is _STOP: stop = True
+        if stop:
+            for f, _ in self._files.values(): f.close()
+            self._files.clear()
+        return not stop
+
+    def _open(self, path, incoming):
+        entry = self._files.get(path)
+        today = datetime.date.today()
+        if entry:
+            f, opened = entry
+            if (self.rotate_bytes and f.tell() + incoming > self.rotate_bytes) or (self.rotate_daily and opened != today):
+                f.close()
+                del self._files[path]
+                self._rotate(path)
+                entry = None
+        elif os.path.exists(path):
+            st = os.stat(path)
+            stale = self.rotate_daily and datetime.date.fromtimestamp(st.st_mtime) != today
+            if st.st_size and (stale or (self.rotate_bytes and st.st_size + incoming > self.rotate_bytes)):
+                self._rotate(path)
+        if entry: return entry[0]
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        f = open(path, 'a', encoding='utf-8')
+        self._files[path] = (f, today)
+        return f
+
+    def _rotate(self, path):
+        root, ext = os.path.splitext(path)
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        target, n = f"{root}.{stamp}{ext}", 1
+        while os.path.exists(target):
+            target, n = f"{root}.{stamp}-{n}{ext}", n + 1
+        os.replace(path, target)
+        logging.info(f"Rotated {path} to {target}")
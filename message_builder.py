@@ -0,0 +1,180 @@
+import io
+import os
+import bisect
+import logging
+import itertools
+import mimetypes
+import threading
+from collections import OrderedDict
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from email.mime.image import MIMEImage
+from email.mime.audio import MIMEAudio
+from email.mime.base import MIMEBase
+from email import encoders
+
+ATTACHMENT_CACHE_BYTES = 64 * 1024 * 1024  # Budget for serialized attachment parts
+SKELETON_CACHE_SIZE = 16                   # Attachment sets whose assembled skeleton is kept per batch
+
+def build_attachment_part(filepath):
+    """Builds the MIME part for one attachment (same structure create_message has always produced)."""
+    ctype, encoding = mimetypes.guess_type(filepath)
+    if ctype is None or encoding is not None: ctype = 'application/octet-stream'
+    main_type, sub_type = ctype.split('/', 1)
+    with open(filepath, 'rb') as f: file_data = f.read()
+    if main_type == 'text': part = MIMEText(file_data.decode('utf-8'), _subtype=sub_type)
+    elif main_type == 'image': part = MIMEImage(file_data, _subtype=sub_type)
+    elif main_type == 'audio': part = MIMEAudio(file_data, _subtype=sub_type)
+    else:
+        part = MIMEBase(main_type, sub_type)
+        part.set_payload(file_data)
+        encoders.encode_base64(part)
+    part.add_header('Content-Disposition', 'attachment', filename=os.path.basename(filepath))
+    return part
+
+class AttachmentCache:
+    """
+    Content-addressed cache of serialized (already base64-encoded) attachment parts.
+    Keyed by (path, mtime, size) so edited files are re-read; evicts least recently used past max_bytes.
+    """
+    def __init__(self, max_bytes=ATTACHMENT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._parts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, filepath):
+        """Returns the serialized part as bytes, or None if the file is missing or unreadable."""
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            return None
+        key = (os.path.abspath(filepath), st.st_mtime_ns, st.st_size)
+        with self._lock:
+            data = self._parts.get(key)
+            if data is not None:
+                self._parts.move_to_end(key)
+                return data
+
+        try:
+            data = build_attachment_part(filepath).as_bytes()
+        except Exception as e:
+            logging.error(f"Error attaching {filepath}: {e}")
+            return None
+
+        with self._lock:
+            if len(data) <= self.max_bytes and key not in self._parts:
+                self._parts[key] = data
+                self.size += len(data)
+                while self.size > self.max_bytes:
+                    _, old = self._parts.popitem(last=False)
+                    self.size -= len(old)
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._parts.clear()
+            self.size = 0
+
+class MessageSkeleton:
+    """
+    The parts shared by every message of a batch (the encoded attachments), assembled once.
+    render() builds only the per-recipient headers and HTML body with the stdlib generator and
+    splices the cached attachment bytes in before the closing boundary.
+    """
+    def __init__(self, attachments=None, cache=None):
+        cache = cache or _default_cache
+        self.parts = []
+        for filepath in attachments or []:
+            data = cache.get(filepath)
+            if data is not None: self.parts.append(data)
+        self.size = sum(len(part) for part in self.parts)
+
+    def render(self, sender, to, subject, body_html, cc=None, bcc=None):
+        """Returns the RFC 822 message as bytes."""
+        return b''.join(self.render_chunks(sender, to, subject, body_html, cc, bcc))
+
+    def render_chunks(self, sender, to, subject, body_html, cc=None, bcc=None):
+        """Returns the RFC 822 message as a list of byte chunks; the cached attachment parts are not copied."""
+        message = MIMEMultipart()
+        message['from'] = sender
+        message['subject'] = subject
+        if to: message['to'] = to
+        if cc: message['cc'] = cc
+        if bcc: message['bcc'] = bcc
+        message.attach(MIMEText(body_html, 'html'))
+        if not self.parts: return [message.as_bytes()]
+
+        raw = message.as_bytes()
+        boundary = message.get_boundary().encode('ascii')
+        close = b'\n--' + boundary + b'--\n'
+        head, tail = raw[:raw.rindex(close)], raw[raw.rindex(close):]
+        delimiter = b'\n--' + boundary + b'\n'
+        return [head] + [chunk for part in self.parts for chunk in (delimiter, part)] + [tail]
+
+class SkeletonCache:
+    """
+    Small LRU of MessageSkeletons keyed by attachment set. A skeleton pins its attachment parts, so
+    it is dropped with the least recently used sets past max_entries or max_bytes (the attachment
+    cache's budget): rows with a different attachment each stay within bounded memory.
+    """
+    def __init__(self, max_entries=SKELETON_CACHE_SIZE, max_bytes=ATTACHMENT_CACHE_BYTES, cache=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.cache = cache
+        self.size = 0
+        self._skeletons = OrderedDict()
+
+    def get(self, attachments):
+        key = tuple(attachments or ())
+        skeleton = self._skeletons.get(key)
+        if skeleton is not None:
+            self._skeletons.move_to_end(key)
+            return skeleton
+        skeleton = MessageSkeleton(attachments, self.cache)
+        if skeleton.size > self.max_bytes: return skeleton
+        self._skeletons[key] = skeleton
+        self.size += skeleton.size
+        while len(self._skeletons) > self.max_entries or self.size > self.max_bytes:
+            _, old = self._skeletons.popitem(last=False)
+            self.size -= old.size
+        return skeleton
+
+class MessageStream(io.RawIOBase):
+    """Seekable read-only file over a list of byte chunks, so a message can be uploaded without joining it."""
+    def __init__(self, chunks):
+        self._chunks = [chunk for chunk in chunks if chunk]
+        self._starts = [0] + list(itertools.accumulate(len(chunk) for chunk in self._chunks))
+        self.size = self._starts[-1]
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR: offset += self._pos
+        elif whence == io.SEEK_END: offset += self.size
+        if offset < 0: raise ValueError(f"negative seek position {offset}")
+        self._pos = offset
+        return self._pos
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast('B')
+        written = 0
+        idx = bisect.bisect_right(self._starts, self._pos) - 1
+        while written < len(view) and idx < len(self._chunks):
+            offset = self._pos - self._starts[idx]
+            piece = memoryview(self._chunks[idx])[offset:offset + len(view) - written]
+            view[written:written + len(piece)] = piece
+            written += len(piece)
+            self._pos += len(piece)
+            idx += 1
+        return written
+
+_default_cache = AttachmentCache()
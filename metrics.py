@@ -0,0 +1,105 @@
+import time
+import bisect
+import threading
+
+ENABLED = True  # Set to False (or call enable(False)) to turn every hot-path call into a no-op
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = 'gmail_sender_'
+
+# Pipeline stages timed by process_bulk_email
+STAGES = ('render', 'mime', 'encode', 'send', 'batch', 'history')
+
+_lock = threading.Lock()
+_counters = {}     # (name, labels) -> value
+_histograms = {}   # stage -> [bucket counts..., +Inf count, sum]
+
+def enable(flag=True):
+    global ENABLED
+    ENABLED = flag
+
+def clock():
+    """Start time for observe(); None when metrics are disabled."""
+    return time.perf_counter() if ENABLED else None
+
+def observe(stage, start):
+    """Records the time since start (from clock()) in the stage latency histogram."""
+    if start is None: return
+    elapsed = time.perf_counter() - start
+    idx = bisect.bisect_left(BUCKETS, elapsed)
+    with _lock:
+        hist = _histograms.get(stage)
+        if hist is None: hist = _histograms[stage] = [0] * (len(BUCKETS) + 2)
+        hist[idx] += 1
+        hist[-1] += elapsed
+
+def inc(name, value=1, **labels):
+    if not ENABLED: return
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def snapshot():
+    """Copy of all counters and histograms (for per-batch deltas)."""
+    with _lock:
+        return dict(_counters), {k: list(v) for k, v in _histograms.items()}
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+def _quantile(hist, q):
+    total = sum(hist[:-1])
+    if not total: return 0.0
+    rank, seen = q * total, 0
+    for i, count in enumerate(hist[:-1]):
+        seen += count
+        if seen >= rank: return BUCKETS[i] if i < len(BUCKETS) else float('inf')
+    return float('inf')
+
+def summary(since=None):
+    """Human-readable summary (counters and per-stage latency), optionally relative to a snapshot()."""
+    counters, histograms = snapshot()
+    if since:
+        base_counters, base_hists = since
+        counters = {k: v - base_counters.get(k, 0) for k, v in counters.items()}
+        histograms = {k: [a - b for a, b in zip(v, base_hists.get(k, [0] * len(v)))] for k, v in histograms.items()}
+
+    parts = []
+    for (name, labels), value in sorted(counters.items()):
+        if not value: continue
+        label = ','.join(f"{k}={v}" for k, v in labels)
+        parts.append(f"{name}{'{' + label + '}' if label else ''}={value:g}")
+    lines = ["Metrics: " + (', '.join(parts) or 'no events')]
+    for stage in STAGES + tuple(s for s in histograms if s not in STAGES):
+        hist = histograms.get(stage)
+        count = sum(hist[:-1]) if hist else 0
+        if not count: continue
+        lines.append(f"  {stage:<8} n={count:<6} avg={hist[-1] / count * 1000:8.2f}ms"
+                     f"  p50<={_quantile(hist, 0.5) * 1000:g}ms  p99<={_quantile(hist, 0.99) * 1000:g}ms")
+    return '\n'.join(lines)
+
+def render_prometheus():
+    """Prometheus text exposition format (version 0.0.4)."""
+    counters, histograms = snapshot()
+    out = []
+    seen = set()
+    for (name, labels), value in sorted(counters.items()):
+        metric = PREFIX + name
+        if metric not in seen:
+            out.append(f"# TYPE {metric} counter")
+            seen.add(metric)
+        label = ','.join(f'{k}="{v}"' for k, v in labels)
+        out.append(f"{metric}{'{' + label + '}' if label else ''} {value:g}")
+
+    metric = PREFIX + 'stage_seconds'
+    if histograms: out.append(f"# TYPE {metric} histogram")
+    for stage, hist in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(BUCKETS + (float('inf'),), hist[:-1]):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else f"{bound:g}"
+            out.append(f'{metric}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+        out.append(f'{metric}_sum{{stage="{stage}"}} {hist[-1]:.6f}')
+        out.append(f'{metric}_count{{stage="{stage}"}} {cumulative}')
+    return '\n'.join(out) + '\n'
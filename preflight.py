@@ -0,0 +1,173 @@
+import os
+import re
+import stat
+import hashlib
+import logging
+from email.utils import getaddresses, formataddr
+
+MAX_MESSAGE_BYTES = 25 * 1024 * 1024  # Gmail's message size limit
+HEADER_OVERHEAD = 2048                # Headers, MIME boundaries and the tracking pixel, per message
+PART_OVERHEAD = 300                   # MIME headers of one attachment part
+REPORT_SAMPLES = 20                   # Problems listed by name in the report (the rest are only counted)
+
+# Dot-atom local part and domain labels; non-ASCII characters are allowed (internationalized addresses),
+# and the TLD may be alphabetic, punycode (xn--...) or non-ASCII. The classes are written as negated ASCII
+# ranges: a class listing the non-ASCII range costs ~25 ms to compile. Compiled on first use.
+_ATOM = r"""[^\x00-\x20"(),.:;<>@\[\\\]\x7f]"""   # atext or non-ASCII
+_ALNUM = r"[^\x00-/:-@\[-`{-\x7f]"                # Letter, digit or non-ASCII
+_LDH = r"[^\x00-,./:-@\[-`{-\x7f]"                # ...or hyphen
+_ADDRESS_PATTERN = (rf"{_ATOM}+(?:\.{_ATOM}+)*"
+                    rf"@(?:{_ALNUM}(?:{_LDH}{{0,61}}{_ALNUM})?\.)+"
+                    r"(?:[A-Za-z]{2,63}|xn--[A-Za-z0-9-]{1,59}|[^\x00-\x7f]{2,63})")
+_address = None
+_SEPARATORS = re.compile(r'[,;]')
+
+def valid_address(address):
+    global _address
+    if _address is None: _address = re.compile(_ADDRESS_PATTERN)
+    return bool(_address.fullmatch(address))
+
+def normalize_address(address):
+    """Strips the address and lowercases its domain (the local part is case-sensitive)."""
+    local, _, domain = address.strip().rpartition('@')
+    return f"{local}@{domain.lower()}" if local else address.strip()
+
+def parse_addresses(value):
+    """[(display name, address)] of a To/Cc/Bcc value ('a@x.com, B <b@y.com>; ...')."""
+    value = str(value or '').strip()
+    if not value: return []
+    if '<' not in value and '"' not in value:
+        return [('', part.strip()) for part in _SEPARATORS.split(value) if part.strip()]
+    return [(name, addr) for name, addr in getaddresses([value.replace(';', ',')]) if addr or name]
+
+def _row_key(data, recipients):
+    """Digest of a row's content (recipients compared case-insensitively) for the batch dedupe."""
+    parts = [f"{k}\0{str(v).lower() if k in recipients else v}" for k, v in sorted(data.items()) if not k.startswith('__')]
+    return hashlib.sha1('\0'.join(parts).encode('utf-8', 'surrogatepass')).digest()
+
+def encoded_size(size):
+    """Size of size bytes once base64-encoded in 76-character MIME lines."""
+    encoded = (size + 2) // 3 * 4
+    return encoded + encoded // 76 * 2
+
+class PreflightReport:
+    def __init__(self):
+        self.rows = 0
+        self.passed = 0
+        self.rejected = {}   # reason -> rows dropped
+        self.warnings = {}   # kind -> occurrences (the row is still sent)
+        self.samples = []    # (reason, email, detail), at most REPORT_SAMPLES
+        self.paths_checked = 0
+        self.largest = 0     # Largest estimated message size (bytes)
+
+    def reject(self, reason, email, detail=''):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        self._sample(reason, email, detail)
+
+    def warn(self, kind, email, detail=''):
+        self.warnings[kind] = self.warnings.get(kind, 0) + 1
+        self._sample(kind, email, detail)
+
+    def _sample(self, kind, email, detail):
+        if len(self.samples) < REPORT_SAMPLES: self.samples.append((kind, email, detail))
+
+    def to_dict(self):
+        return {'rows': self.rows, 'passed': self.passed, 'rejected': dict(self.rejected), 'warnings': dict(self.warnings),
+                'paths_checked': self.paths_checked, 'largest': self.largest,
+                'samples': [{'kind': k, 'email': e, 'detail': d} for k, e, d in self.samples]}
+
+    def summary(self):
+        counts = lambda d: ', '.join(f"{k}={v}" for k, v in sorted(d.items())) or 'none'
+        lines = [f"Pre-flight: {self.passed}/{self.rows} rows passed; rejected: {counts(self.rejected)}; "
+                 f"warnings: {counts(self.warnings)}; {self.paths_checked} attachment paths checked; "
+                 f"largest message ~{self.largest / 1024 / 1024:.1f} MB."]
+        lines += [f"  {kind}: {email or '-'}{' (' + detail + ')' if detail else ''}" for kind, email, detail in self.samples]
+        return '\n'.join(lines)
+
+class Preflight:
+    """
+    Cheap checks run on every row before it is rendered or sent: address syntax (invalid Cc/Bcc
+    addresses are dropped, an invalid primary address rejects the row), normalized recipients
+    deduplicated within the row, rows identical to an earlier one in the batch (same recipients, subject,
+    body, attachments and placeholder values) dropped, attachments checked once per distinct path,
+    and the encoded message size estimated against Gmail's limit. filter() streams the rows that pass
+    and records the rest in self.report. Verified attachment paths are handed on in row['__attachments'].
+    """
+    def __init__(self, max_bytes=MAX_MESSAGE_BYTES):
+        self.max_bytes = max_bytes
+        self.report = PreflightReport()
+        self._paths = {}   # path -> size in bytes, or None if missing
+        self._seen = set()
+
+    def filter(self, rows, notify=None):
+        for data in rows:
+            self.report.rows += 1
+            problem = self.check(data)
+            if problem is None:
+                self.report.passed += 1
+                yield data
+                continue
+            email = data.get('email') or data.get('to')
+            logging.warning(f"Skipped (pre-flight: {problem}): {email}")
+            if notify: notify('skipped', {'data': data, 'to': email}, None)
+
+    def check(self, data):
+        """Normalizes data in place; returns None if the row can be sent, else the rejection reason."""
+        primary = 'email' if data.get('email') else 'to'
+        email = str(data.get(primary) or '')
+        fields = (primary, 'cc', 'bcc')
+        seen = set()
+        for field in fields:
+            if not data.get(field): continue
+            kept = []
+            for name, address in parse_addresses(data[field]):
+                address = normalize_address(address)
+                if not valid_address(address):
+                    if field == primary:
+                        self.report.reject('invalid_address', email, address)
+                        return 'invalid_address'
+                    self.report.warn('invalid_address_dropped', email, f"{field}: {address}")
+                    continue
+                if address.lower() in seen:
+                    self.report.warn('duplicate_recipient_removed', email, f"{field}: {address}")
+                    continue
+                seen.add(address.lower())
+                kept.append(formataddr((name, address)) if name else address)
+            data[field] = ', '.join(kept)
+        if not seen:
+            self.report.reject('no_recipient', email)
+            return 'no_recipient'
+
+        key = _row_key(data, fields)
+        if key in self._seen:
+            self.report.reject('duplicate', email)
+            return 'duplicate'
+        self._seen.add(key)
+
+        files, size = [], 0
+        for field, value in data.items():
+            if not field.startswith('attachment') or not value: continue
+            file_size = self._stat(value)
+            if file_size is None:
+                logging.warning(f"Attachment skipped (not found): {value}")
+                self.report.warn('missing_attachment', email, value)
+                continue
+            files.append(value)
+            size += encoded_size(file_size) + PART_OVERHEAD
+        size += HEADER_OVERHEAD + encoded_size(sum(len(str(v)) for v in data.values() if isinstance(v, str)))
+        self.report.largest = max(self.report.largest, size)
+        if size > self.max_bytes:
+            self.report.reject('too_large', email, f"~{size / 1024 / 1024:.1f} MB")
+            return 'too_large'
+        data['__attachments'] = files
+        return None
+
+    def _stat(self, path):
+        if path not in self._paths:
+            self.report.paths_checked += 1
+            try:
+                st = os.stat(path)
+                self._paths[path] = st.st_size if stat.S_ISREG(st.st_mode) else None
+            except OSError:
+                self._paths[path] = None
+        return self._paths[path]
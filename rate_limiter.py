@@ -0,0 +1,184 @@
+import time
+import logging
+import threading
+from retry_queue import error_status, error_reasons, classify_error, is_quota_error, RETRYABLE_REASONS
+
+ADAPT_INCREASE = 0.1          # Messages/s added per second of error-free sending (additive increase)
+ADAPT_DECREASE = 0.5          # Rate multiplier on a 429, 5xx or rate-limit reason (multiplicative decrease)
+ADAPT_LATENCY_DECREASE = 0.9  # Rate multiplier when send latency climbs past ADAPT_LATENCY_FACTOR x its baseline
+ADAPT_LATENCY_FACTOR = 3.0
+ADAPT_LATENCY_ALPHA = 0.2     # Weight of the newest sample in the latency moving average
+ADAPT_COOLDOWN = 2.0          # Seconds after a decrease during which further signals (in-flight sends) are ignored
+ADAPT_LOG_INTERVAL = 10.0     # Min seconds between 'rate raised' log lines (decreases are always logged)
+ADAPT_MIN_FLOOR = 0.01        # Lowest floor accepted (a rate of 0 would mean unlimited to TokenBucket)
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by all send workers.
+    Enforces the per-second send rate and the session daily limit.
+    A daily slot is reserved on acquire() and must be settled with commit() or release().
+    """
+    def __init__(self, rate, capacity=1, daily_limit=None):
+        self.rate = float(rate) if rate else 0.0
+        self.capacity = max(1, capacity)
+        self.daily_limit = daily_limit
+        self._tokens = float(self.capacity)
+        self._stamp = time.monotonic()
+        self._reserved = 0
+        self._used = 0
+        self._exhausted = False
+        self._cond = threading.Condition()
+
+    @property
+    def sent(self):
+        return self._used
+
+    @property
+    def remaining(self):
+        """Daily slots not yet reserved (None when unlimited)."""
+        if self._exhausted: return 0
+        if self.daily_limit is None: return None
+        return self.daily_limit - self._reserved
+
+    @property
+    def in_flight(self):
+        """Slots reserved but not yet settled."""
+        return self._reserved - self._used
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate > 0:
+            self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+        else:
+            self._tokens = float(self.capacity)
+        self._stamp = now
+
+    def set_rate(self, rate):
+        """Changes the send rate; waiting senders pick it up immediately."""
+        with self._cond:
+            self._refill()
+            self.rate = float(rate)
+            self._cond.notify_all()
+
+    def acquire(self):
+        """Blocks until a send is allowed. Returns False once the daily limit is used up."""
+        with self._cond:
+            while self._exhausted or (self.daily_limit is not None and self._reserved >= self.daily_limit):
+                if self._exhausted or self._reserved == self._used: return False
+                self._cond.wait()  # In-flight sends may still fail and hand their slot back
+            self._reserved += 1
+
+            self._refill()
+            while self._tokens < 1:
+                self._cond.wait((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+            return True
+
+    def wait_time(self):
+        """Seconds until acquire() would get a token without blocking (0.0 now), or None once the daily limit is used up."""
+        with self._cond:
+            if self._exhausted or (self.daily_limit is not None and self._reserved >= self.daily_limit): return None
+            self._refill()
+            return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def exhaust(self):
+        """Ends the daily budget early (the server reported the quota as used up) until new_day()."""
+        with self._cond:
+            self._exhausted = True
+            self._cond.notify_all()
+
+    def new_day(self):
+        """Starts a new daily budget; sends still in flight keep their reservation."""
+        with self._cond:
+            self._reserved -= self._used
+            self._used = 0
+            self._exhausted = False
+            self._cond.notify_all()
+
+    def commit(self):
+        """Marks a reserved slot as used (message sent)."""
+        with self._cond:
+            self._used += 1
+            self._cond.notify_all()
+
+    def release(self):
+        """Returns a reserved slot to the daily budget (message failed)."""
+        with self._cond:
+            self._reserved -= 1
+            self._cond.notify_all()
+
+class AimdController:
+    """
+    Adapts a TokenBucket's rate to what the account sustains (additive increase, multiplicative decrease).
+    Every sent message raises the rate by ADAPT_INCREASE / rate (about ADAPT_INCREASE per second);
+    a 429, a 5xx, a rate-limit reason or a network error halves it, a send latency well above its
+    baseline trims it, and a quota reason drops it to the floor. After a decrease, signals from sends
+    already in flight are ignored for ADAPT_COOLDOWN. The rate stays within [floor, ceiling]; the floor
+    is at least ADAPT_MIN_FLOOR.
+    """
+    def __init__(self, limiter, floor, ceiling, name=''):
+        self.limiter = limiter
+        self.floor = max(ADAPT_MIN_FLOOR, floor)
+        self.ceiling = max(self.floor, ceiling)
+        self.name = name
+        self.latency = None   # Moving average of send latency (seconds)
+        self.baseline = None  # Lowest moving average seen
+        self._last_decrease = float('-inf')
+        self._last_log = time.monotonic()
+        self._lock = threading.Lock()
+        limiter.set_rate(min(self.ceiling, max(self.floor, limiter.rate)))
+
+    @property
+    def rate(self):
+        return self.limiter.rate
+
+    def on_sent(self, latency=None):
+        with self._lock:
+            if latency is not None:
+                self.latency = latency if self.latency is None else (
+                    ADAPT_LATENCY_ALPHA * latency + (1 - ADAPT_LATENCY_ALPHA) * self.latency)
+                self.baseline = self.latency if self.baseline is None else min(self.baseline, self.latency)
+                if self.latency > self.baseline * ADAPT_LATENCY_FACTOR:
+                    self._decrease(ADAPT_LATENCY_DECREASE, f"latency {self.latency:.2f}s")
+                    return
+            rate = min(self.ceiling, self.rate + ADAPT_INCREASE / max(self.rate, self.floor))
+            if rate == self.rate: return
+            self.limiter.set_rate(rate)
+            if time.monotonic() - self._last_log >= ADAPT_LOG_INTERVAL:
+                self._last_log = time.monotonic()
+                logging.info(f"Send rate{self._label()} raised to {rate:.2f}/s")
+
+    def on_error(self, error):
+        signal = congestion_signal(error)
+        if signal is None: return
+        with self._lock:
+            if signal == 'quota':
+                if self.rate > self.floor:
+                    self.limiter.set_rate(self.floor)
+                    logging.warning(f"Send rate{self._label()} lowered to {self.floor:.2f}/s (quota)")
+                return
+            self._decrease(ADAPT_DECREASE, signal)
+
+    def _decrease(self, factor, cause):
+        now = time.monotonic()
+        if now - self._last_decrease < ADAPT_COOLDOWN: return
+        self._last_decrease = now
+        rate = max(self.floor, self.rate * factor)
+        if rate == self.rate: return
+        self.limiter.set_rate(rate)
+        logging.warning(f"Send rate{self._label()} lowered to {rate:.2f}/s ({cause})")
+
+    def _label(self):
+        return f" for {self.name}" if self.name else ""
+
+def congestion_signal(error):
+    """'quota', a short description of a rate-limit / server / network error, or None (not a congestion signal)."""
+    if isinstance(error, str): return None
+    status = error_status(error)
+    if is_quota_error(error): return 'quota'
+    if status == 429 or (status is not None and status >= 500): return f"HTTP {status}"
+    reasons = [r for r in error_reasons(error) if r in RETRYABLE_REASONS] if status is not None else []
+    if reasons: return reasons[0]
+    if status is None and classify_error(error) == 'retryable': return type(error).__name__
+    return None
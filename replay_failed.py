@@ -0,0 +1,64 @@
+import sys
+import json
+import logging
+from setup_logging import setup_logging
+from gmail_core import process_bulk_email, load_sent_history, FAILED_PATH
+from retry_queue import classify_error_text
+from log_writer import parse_line, log_files, FAILED_FIELDS
+import send_csv
+
+DAILY_LIMIT = 450
+
+def load_replay_rows(failed_path=FAILED_PATH, source_rows=None):
+    """
+    Reads failed_history.log (and its rotated copies) in one pass and returns the rows worth re-sending:
+    the latest failure per row uid, only if it was retryable and the row was not sent since.
+    Rows come from the JSON stored in the log; older lines (email only, keyed and checked by address)
+    are matched against source_rows.
+    """
+    latest = {}
+    paths = log_files(failed_path)
+    if not paths:
+        logging.warning(f"No failed history at {failed_path}")
+        return []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = parse_line(line, FAILED_FIELDS)
+                if len(parts) < 3: continue
+                uid = parts[4] if len(parts) >= 5 else ''
+                latest[uid or parts[1].strip().lower()] = parts
+
+    history = load_sent_history()
+    rows, missing = [], {}
+    for parts in latest.values():
+        error_class = parts[3] if len(parts) >= 6 else classify_error_text(parts[2])
+        if error_class != 'retryable': continue
+        if history:
+            uid = parts[4] if len(parts) >= 5 else ''
+            sent_at = (history.find_uid(uid) or (None,))[0] if uid else history.last_sent(parts[1].strip())
+            if sent_at and sent_at >= parts[0]: continue
+        if len(parts) >= 6 and parts[5]:
+            try:
+                rows.append(json.loads('‡'.join(parts[5:])))
+                continue
+            except ValueError:
+                pass
+        missing[parts[1].strip().lower()] = parts
+
+    if missing and source_rows is not None:
+        for row in source_rows:
+            row = {k.strip().lower(): v for k, v in row.items() if k}
+            email = (row.get('email') or row.get('to') or '').strip().lower()
+            if missing.pop(email, None) is not None: rows.append(row)
+            if not missing: break
+    for email in missing:
+        logging.warning(f"Cannot replay {email}: row data not in log (pass the original CSV)")
+    return rows
+
+if __name__ == '__main__':
+    setup_logging()
+    source = send_csv.get_csv_data_as_objects(sys.argv[1]) if len(sys.argv) > 1 else None
+    rows = load_replay_rows(source_rows=source)
+    logging.info(f"Replaying {len(rows)} recoverable rows from {FAILED_PATH}...")
+    if rows: process_bulk_email(rows, daily_limit=DAILY_LIMIT)
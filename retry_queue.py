@@ -0,0 +1,164 @@
+import re
+import time
+import heapq
+import random
+import logging
+import datetime
+import itertools
+import threading
+from email.utils import parsedate_to_datetime
+
+RETRY_MAX_ATTEMPTS = 5     # Sends per row, including the first one
+RETRY_BASE_DELAY = 2.0     # Seconds; doubled on every attempt
+RETRY_MAX_DELAY = 120.0
+RETRY_DEADLINE = 15 * 60   # Give up on a row this many seconds after its first failure
+
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+RETRYABLE_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded', 'backendError', 'concurrentLimitExceeded')
+QUOTA_REASONS = ('dailyLimitExceeded', 'quotaExceeded')
+
+def error_status(error):
+    """HTTP status of an HttpError (None for other errors)."""
+    resp = getattr(error, 'resp', None)
+    try:
+        return int(resp.status) if resp is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def error_reasons(error):
+    """Gmail error reasons (e.g. 'rateLimitExceeded') of an HttpError."""
+    try:
+        return [d.get('reason') for d in (error.error_details or []) if isinstance(d, dict)]
+    except Exception:
+        return []
+
+def classify_error(error):
+    """Returns 'retryable' for rate limiting, server and network errors, 'permanent' otherwise."""
+    import httplib2
+    status = error_status(error)
+    if status is not None:
+        if status in RETRYABLE_STATUS: return 'retryable'
+        if status == 403 and any(r in RETRYABLE_REASONS for r in error_reasons(error)): return 'retryable'
+        return 'permanent'
+    if isinstance(error, (OSError, TimeoutError, httplib2.HttpLib2Error)): return 'retryable'
+    return 'permanent'
+
+def classify_error_text(text):
+    """classify_error for an error that is only known by its logged message (older failed_history.log lines)."""
+    match = re.search(r'HttpError (\d{3})', text or '')
+    if match:
+        status = int(match.group(1))
+        if status in RETRYABLE_STATUS: return 'retryable'
+        if status == 403 and any(r in text for r in RETRYABLE_REASONS): return 'retryable'
+        return 'permanent'
+    if re.search(r'timed? ?out|Connection|Errno|ServerNotFound|rate limit', text or '', re.IGNORECASE): return 'retryable'
+    return 'permanent'
+
+def is_quota_error(error):
+    """
+    True when the account's sending quota is used up (rather than a short-term rate limit):
+    a quota reason or message, or a 429 whose Retry-After lies beyond the retry deadline.
+    """
+    if error_status(error) is None: return False
+    if any(r in QUOTA_REASONS for r in error_reasons(error)): return True
+    if re.search(r'sending (?:quota|limit)|daily limit', str(error), re.IGNORECASE): return True
+    delay = retry_after(error) if error_status(error) == 429 else None
+    return delay is not None and delay > RETRY_DEADLINE
+
+def retry_after(error):
+    """Seconds requested by a Retry-After header (delta-seconds or HTTP-date), or None."""
+    resp = getattr(error, 'resp', None)
+    value = resp.get('retry-after') if hasattr(resp, 'get') else None
+    if not value: return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+        return max(0.0, (when - datetime.datetime.now(when.tzinfo)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    """Exponential backoff with full jitter; attempt starts at 1."""
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+
+class RetryQueue:
+    """
+    Time-ordered queue of rows waiting for another send attempt.
+    push() schedules a row after a retryable error; iter() merges due retries into the source stream.
+    """
+    def __init__(self, max_attempts=RETRY_MAX_ATTEMPTS, deadline=RETRY_DEADLINE):
+        self.max_attempts = max_attempts
+        self.deadline = deadline
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, job, error):
+        """Schedules job for another attempt. Returns False if it is permanent or out of attempts/time."""
+        if classify_error(error) != 'retryable': return False
+        now = time.monotonic()
+        attempt = job.get('attempt', 1)
+        first_failure = job.setdefault('first_failure', now)
+        if attempt >= self.max_attempts: return False
+
+        delay = retry_after(error)
+        if delay is None: delay = backoff_delay(attempt)
+        if now + delay - first_failure > self.deadline: return False
+
+        job['attempt'] = attempt + 1
+        with self._cond:
+            heapq.heappush(self._heap, (now + delay, next(self._seq), job))
+            self._cond.notify_all()
+        logging.warning(f"Retry {attempt + 1}/{self.max_attempts} for {job.get('to')} in {delay:.1f}s: {error}")
+        return True
+
+    def requeue(self, job):
+        """Schedules job for an immediate new attempt (e.g. on another account); does not count as a retry."""
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic(), next(self._seq), job))
+            self._cond.notify_all()
+
+    def pop_ready(self):
+        with self._cond:
+            if self._heap and self._heap[0][0] <= time.monotonic():
+                return heapq.heappop(self._heap)[2]
+        return None
+
+    def iter(self, jobs, busy=None):
+        """
+        Yields due retries ahead of new rows from jobs, then waits for the remaining retries.
+        busy() tells whether sends are still in flight (and may push more retries).
+        """
+        for job in jobs:
+            ready = self.pop_ready()
+            while ready is not None:
+                yield ready
+                ready = self.pop_ready()
+            yield job
+
+        while True:
+            ready = self.pop_ready()
+            if ready is not None:
+                yield ready
+                continue
+            with self._cond:
+                if not self._heap and not (busy and busy()): return
+                timeout = self._heap[0][0] - time.monotonic() if self._heap else 0.1
+                self._cond.wait(max(0.0, min(timeout, 1.0)))
+
+    def clear(self):
+        """Removes and returns the rows still waiting (e.g. when the daily limit stops the batch)."""
+        with self._cond:
+            jobs = [entry[2] for entry in sorted(self._heap)]
+            self._heap.clear()
+        return jobs
+
+    def wake(self):
+        with self._cond:
+            self._cond.notify_all()
@@ -1,26 +1,44 @@
+import os
 import csv
 import sys
 import logging
 from setup_logging import setup_logging
-from gmail_core import process_bulk_email
+from gmail_core import process_bulk_email, preflight_check
+from checkpoint import campaign_id
+from dry_run import dry_run_target
 
 DAILY_LIMIT = 450 
 
 def get_csv_data_as_objects(filepath):
+    """Returns a lazy iterator of row dicts (None if the file cannot be opened)."""
     try:
-        with open(filepath, mode='r', encoding='utf-8') as file:
-            return list(csv.DictReader(file))
+        file = open(filepath, mode='r', encoding='utf-8')
     except Exception as e:
         logging.error(f"Could not read file: {e}")
         return None
+    return _iter_csv_rows(file)
+
+def _iter_csv_rows(file):
+    with file:
+        try:
+            yield from csv.DictReader(file)
+        except Exception as e:
+            logging.error(f"Could not read file: {e}")
 
 if __name__ == '__main__':
+    # Usage: python3 send_csv.py [file.csv] [--resume] [--dry-run[=DIR|FILE.mbox]] [--check]
     setup_logging()
-    csv_file = sys.argv[1] if len(sys.argv) > 1 else 'recipients.csv'
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    resume = '--resume' in sys.argv[1:]
+    dry_run = dry_run_target(sys.argv[1:])
+    csv_file = args[0] if args else 'recipients.csv'
     logging.info(f"Reading {csv_file}...")
     
     data = get_csv_data_as_objects(csv_file)
-    if data:
-        process_bulk_email(data, daily_limit=DAILY_LIMIT)
+    if data and '--check' in sys.argv[1:]:
+        preflight_check(data)
+    elif data:
+        campaign = campaign_id(os.path.abspath(csv_file))
+        process_bulk_email(data, daily_limit=DAILY_LIMIT, campaign=campaign, resume=resume, dry_run=dry_run)
     else:
         sys.exit(1)
\ No newline at end of file
@@ -1,33 +1,81 @@
 import sys
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from setup_logging import setup_logging
-from gmail_core import get_sheets_service, process_bulk_email, get_credentials
-from googleapiclient.discovery import build
+from gmail_core import get_sheets_service, get_drive_service, process_bulk_email, preflight_check
+from checkpoint import campaign_id
+from dry_run import dry_run_target
 
-def get_sheet_data(sheet_id, sheet_name=None):
+SHEET_CHUNK_ROWS = 1000  # Rows requested per batchGet call
+
+def get_sheet_data(sheet_id, sheet_name=None, chunk_rows=SHEET_CHUNK_ROWS):
+    """
+    Returns a lazy iterator of row dicts. The tab is read in row-range chunks, and the next chunk
+    is prefetched in the background while the current one is being sent.
+    """
     try:
         service = get_sheets_service()
-        # If no sheet name provided, get the first one
-        if not sheet_name:
-            spreadsheet = service.spreadsheets().get(spreadsheetId=sheet_id).execute()
-            sheet_name = spreadsheet.get('sheets', [])[0]['properties']['title']
-            logging.info(f"Auto-detected sheet: {sheet_name}")
-
-        result = service.spreadsheets().values().get(spreadsheetId=sheet_id, range=sheet_name).execute()
-        rows = result.get('values', [])
-        
-        if len(rows) < 2: return []
-        headers = [h.strip().lower() for h in rows[0]]
-        return [dict(zip(headers, row)) for row in rows[1:]]
+        sheet_name, row_count = get_sheet_properties(service, sheet_id, sheet_name)
+        chunks = iter_sheet_chunks(service, sheet_id, sheet_name, row_count, chunk_rows)
+        first = next(chunks, [])
+        if not first: return []
+        headers = [h.strip().lower() for h in first[0]]
     except Exception as e:
         logging.error(f"Sheet Read Error: {str(e)}")
         return None
+    return _iter_sheet_rows(headers, first[1:], chunks)
+
+def get_sheet_properties(service, sheet_id, sheet_name=None):
+    """Returns (title, row count) using a fields mask; defaults to the first tab."""
+    spreadsheet = service.spreadsheets().get(
+        spreadsheetId=sheet_id, fields="sheets.properties(title,gridProperties.rowCount)").execute()
+    sheets = [s['properties'] for s in spreadsheet.get('sheets', [])]
+    if not sheet_name:
+        props = sheets[0]
+        logging.info(f"Auto-detected sheet: {props['title']}")
+    else:
+        props = next((p for p in sheets if p['title'] == sheet_name), {'title': sheet_name})
+    return props['title'], props.get('gridProperties', {}).get('rowCount')
+
+def iter_sheet_chunks(service, sheet_id, sheet_name, row_count=None, chunk_rows=SHEET_CHUNK_ROWS):
+    """Yields lists of rows, chunk_rows at a time, keeping one batchGet request in flight ahead."""
+    values = service.spreadsheets().values()  # Building the resource is slow for Sheets v4; do it once
+    def fetch(start):
+        rng = f"'{sheet_name.replace(chr(39), chr(39) * 2)}'!{start}:{start + chunk_rows - 1}"
+        result = values.batchGet(
+            spreadsheetId=sheet_id, ranges=[rng], majorDimension='ROWS').execute()
+        ranges = result.get('valueRanges', [])
+        return ranges[0].get('values', []) if ranges else []
+
+    # A single worker keeps all Sheets calls on one thread (httplib2 is not thread-safe)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        start = 1
+        future = pool.submit(fetch, start)
+        while future:
+            rows = future.result()
+            start += chunk_rows
+            more = start <= row_count if row_count else bool(rows)
+            future = pool.submit(fetch, start) if more else None
+            yield rows
+
+def _iter_sheet_rows(headers, first_rows, chunks):
+    try:
+        for row in first_rows:
+            if row: yield dict(zip(headers, row))
+        for rows in chunks:
+            for row in rows:
+                if row: yield dict(zip(headers, row))
+    except Exception as e:
+        logging.error(f"Sheet Read Error: {str(e)}")
+
+def sheet_campaign(sheet_id, sheet_name=None):
+    """Campaign id for a spreadsheet tab (used for checkpoints and --resume)."""
+    return campaign_id(f"sheet:{sheet_id}:{sheet_name or ''}")
 
 def list_recent_sheets(limit=100):
     """Fetches recent Google Sheets using Drive API."""
     try:
-        creds = get_credentials()
-        service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+        service = get_drive_service()
         
         query = "mimeType='application/vnd.google-apps.spreadsheet' and trashed=false"
         
@@ -80,20 +128,24 @@ def interactive_mode():
     # Process
     data = get_sheet_data(selected_sheet['id'], sheet_name)
     if data:
-        process_bulk_email(data)
+        process_bulk_email(data, campaign=sheet_campaign(selected_sheet['id'], sheet_name))
 
 if __name__ == '__main__':
     setup_logging()
     
     # Check if running in CLI mode (with arguments) or Interactive mode
-    if len(sys.argv) > 1:
-        # CLI Mode: python3 send_googlesheet.py <ID> [NAME]
-        s_id = sys.argv[1]
-        s_name = sys.argv[2] if len(sys.argv) > 2 else None
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    resume = '--resume' in sys.argv[1:]
+    dry_run = dry_run_target(sys.argv[1:])
+    if args:
+        # CLI Mode: python3 send_googlesheet.py <ID> [NAME] [--resume] [--dry-run[=DIR|FILE.mbox]] [--check]
+        s_id = args[0]
+        s_name = args[1] if len(args) > 1 else None
         
         logging.info(f"Reading Sheet ID: {s_id}...")
         data = get_sheet_data(s_id, s_name)
-        if data: process_bulk_email(data)
+        if data and '--check' in sys.argv[1:]: preflight_check(data)
+        elif data: process_bulk_email(data, campaign=sheet_campaign(s_id, s_name), resume=resume, dry_run=dry_run)
     else:
         # Interactive Mode
         interactive_mode()
\ No newline at end of file
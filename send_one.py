@@ -2,17 +2,19 @@ import sys
 import logging
 from setup_logging import setup_logging
 from gmail_core import process_bulk_email
+from dry_run import dry_run_target
 
 if __name__ == '__main__':
     setup_logging()
-    if len(sys.argv) < 3:
-        logging.error("Usage: python3 send_one.py <email> <name>")
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    if len(args) < 2:
+        logging.error("Usage: python3 send_one.py <email> <name> [--dry-run[=DIR|FILE.mbox]]")
         sys.exit(1)
     
     data = {
-        'email': sys.argv[1],
-        'name': sys.argv[2],
+        'email': args[0],
+        'name': args[1],
         'subject': 'We received your form',
         'body': "<html><body><p>Hi {{ name }},</p><p>Thanks for your submission.</p></body></html>"
     }
-    process_bulk_email([data], daily_limit=1)
\ No newline at end of file
+    process_bulk_email([data], daily_limit=1, dry_run=dry_run_target(sys.argv[1:]))
\ No newline at end of file
@@ -0,0 +1,56 @@
+import re
+import logging
+import threading
+from functools import lru_cache
+
+PLACEHOLDER_RE = re.compile(r'\{\{(.*?)\}\}')
+
+class CompiledTemplate:
+    """
+    A subject or body parsed once into literal and {{ key }} segments.
+    Keys are matched case-insensitively; unknown keys are left in the output untouched.
+    """
+    def __init__(self, text):
+        self.text = text
+        self._parts = []
+        self._slots = []  # (index in _parts, lowercase key, original placeholder text)
+        pos = 0
+        for match in PLACEHOLDER_RE.finditer(text):
+            self._parts.append(text[pos:match.start()])
+            self._slots.append((len(self._parts), match.group(1).strip().lower(), match.group(0)))
+            self._parts.append(match.group(0))
+            pos = match.end()
+        self._parts.append(text[pos:])
+        self.keys = frozenset(key for _, key, _ in self._slots)
+        self._warned = set()
+        self._lock = threading.Lock()
+
+    def render(self, values):
+        """values: dict of lowercase key -> str (see template_values)."""
+        if not self._slots: return self.text
+        parts = self._parts[:]
+        for i, key, raw in self._slots:
+            parts[i] = values.get(key, raw)
+        return ''.join(parts)
+
+    def unknown_keys(self, known_keys):
+        known = {k.lower() for k in known_keys}
+        return self.keys - known
+
+    def check_keys(self, known_keys):
+        """Logs unknown placeholders once per template instead of silently leaving them in every message."""
+        missing = self.unknown_keys(known_keys) - self._warned
+        if not missing: return
+        with self._lock:
+            missing -= self._warned
+            self._warned |= missing
+        if missing:
+            logging.warning(f"Template has unknown placeholders: {', '.join(sorted(missing))}")
+
+@lru_cache(maxsize=256)
+def compile_template(text):
+    return CompiledTemplate(text)
+
+def template_values(data_dict):
+    """Lowercased str view of a data row, built once per row and shared by subject and body."""
+    return {k.lower(): str(v) for k, v in data_dict.items() if v is not None}
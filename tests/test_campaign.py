@@ -0,0 +1,109 @@
+"""
+Campaign runs through process_bulk_email against a mocked Gmail API (googleapiclient HttpMockSequence), fully
+offline: the 'campaign' dedupe mode across runs, journal resume and per-run tracking ids.
+
+Run: python3 -m unittest discover tests
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import gmail_core
+from checkpoint import CampaignJournal, row_uid
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import HttpMockSequence
+
+def gmail(responses):
+    with open(os.path.join(gmail_core.DISCOVERY_DIR, 'gmail.v1.json'), 'r', encoding='utf-8') as f:
+        return build_from_document(f.read(), http=HttpMockSequence(responses))
+
+def sent(n):
+    return [({'status': '200'}, json.dumps({'id': f'm{i}'})) for i in range(n)]
+
+def rows(n=2, subject='Hello'):
+    return [{'email': f'user{i}@example.com', 'name': f'User {i}', 'subject': subject} for i in range(n)]
+
+class CampaignTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.patches = [mock.patch.multiple(gmail_core, HISTORY_PATH=os.path.join(self.tmp, 'sent.log'),
+                                            FAILED_PATH=os.path.join(self.tmp, 'failed.log'),
+                                            HISTORY_DB_PATH=os.path.join(self.tmp, 'sent.db'),
+                                            CHECKPOINT_DIR=os.path.join(self.tmp, 'campaigns'), _history_store=None)]
+        for p in self.patches: p.start()
+
+    def tearDown(self):
+        gmail_core.history_writer.flush()
+        store = gmail_core._history_store
+        for p in self.patches: p.stop()
+        if store: store.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def run_campaign(self, data, responses, **kwargs):
+        events = []
+        service = gmail(responses)
+        with mock.patch.object(gmail_core, 'get_gmail_service', return_value=service):
+            gmail_core.process_bulk_email(data, rate=1000, notify=lambda e, j, err=None: events.append((e, j)), **kwargs)
+        return events
+
+    def sent_jobs(self, events):
+        return [j for e, j in events if e == 'sent']
+
+    def test_campaign_dedupe_matches_earlier_runs(self):
+        first = self.sent_jobs(self.run_campaign(rows(), sent(2), dedupe='campaign', campaign='spring'))
+        second = self.sent_jobs(self.run_campaign(rows(), sent(2), dedupe='campaign', campaign='spring'))
+        other = self.sent_jobs(self.run_campaign(rows(), sent(2), dedupe='campaign', campaign='autumn'))
+        self.assertEqual(len(first), 2)
+        self.assertEqual(second, [])
+        self.assertEqual(len(other), 2)
+        self.assertEqual({j['data']['campaign'] for j in first}, {'spring'})
+
+    def test_campaign_dedupe_ignores_rows_without_campaign(self):
+        self.run_campaign(rows(), sent(2), dedupe='campaign', campaign='spring')
+        again = self.sent_jobs(self.run_campaign(rows(), sent(2), dedupe='campaign'))
+        self.assertEqual(len(again), 2)
+
+    def test_subject_and_any_dedupe(self):
+        self.run_campaign(rows(1), sent(1))
+        self.assertEqual(self.sent_jobs(self.run_campaign(rows(1), sent(1), dedupe='subject')), [])
+        self.assertEqual(len(self.sent_jobs(self.run_campaign(rows(1, 'Other'), sent(1), dedupe='subject'))), 1)
+        self.assertEqual(self.sent_jobs(self.run_campaign(rows(1, 'Third'), sent(1), dedupe='any')), [])
+
+    def test_row_uids_are_deterministic_and_tracking_ids_per_run(self):
+        first = self.sent_jobs(self.run_campaign(rows(), sent(2), campaign='spring'))
+        second = self.sent_jobs(self.run_campaign(rows(), sent(2), campaign='spring'))
+        uids = [j['data']['__gmail_id'] for j in first]
+        self.assertEqual(uids, [row_uid('spring', r) for r in rows()])
+        self.assertEqual(uids, [j['data']['__gmail_id'] for j in second])
+        first_ids = {j['data']['__track_id'] for j in first}
+        second_ids = {j['data']['__track_id'] for j in second}
+        self.assertFalse(first_ids & second_ids)
+        self.assertTrue(all(f"?id={j['data']['__track_id']}&" in j['data']['tracker_url'] for j in first + second))
+
+    def test_resume_skips_completed_rows_and_keeps_tracking_ids(self):
+        journal = CampaignJournal('spring', gmail_core.CHECKPOINT_DIR)
+        done = rows(3)[0]
+        journal.record(row_uid('spring', done), 'sent')
+        journal.close()
+        resumed = self.sent_jobs(self.run_campaign(rows(3), sent(2), campaign='spring', resume=True))
+        self.assertEqual([j['to'] for j in resumed], ['user1@example.com', 'user2@example.com'])
+        self.assertEqual({j['data']['__track_id'] for j in resumed},
+                         {journal.track_id(row_uid('spring', r)) for r in rows(3)[1:]})
+        self.assertEqual(self.sent_jobs(self.run_campaign(rows(3), [], campaign='spring', resume=True)), [])
+
+    def test_resume_trusts_the_sent_log_for_pending_rows(self):
+        self.run_campaign(rows(1), sent(1), campaign='spring')
+        path = os.path.join(gmail_core.CHECKPOINT_DIR, 'spring.journal')
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = [line for line in f if not line.startswith('sent\t')]
+        with open(path, 'w', encoding='utf-8') as f:
+            f.writelines(lines + [f"pending\t{row_uid('spring', rows(1)[0])}\n"])  # Died before the checkpoint
+        self.assertEqual(self.sent_jobs(self.run_campaign(rows(1), [], campaign='spring', resume=True)), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+"""
+SQLite sent history (history_store.py) and the dedupe modes of gmail_core.already_sent.
+
+Run: python3 -m unittest discover tests
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gmail_core import already_sent
+from history_store import HistoryStore
+
+class HistoryStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.store = HistoryStore(os.path.join(self.tmp, 'sent.db'))
+        self.store.add_sent('2026-01-02 10:00:00', 'u1', 'a@example.com', '', '', 'Hello', 'body', 0, 'spring')
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_lookups(self):
+        self.assertTrue(self.store.was_sent('a@example.com'))
+        self.assertFalse(self.store.was_sent('b@example.com'))
+        self.assertTrue(self.store.was_sent('a@example.com', subject='Hello'))
+        self.assertFalse(self.store.was_sent('a@example.com', subject='Other'))
+        self.assertEqual(self.store.last_sent('a@example.com'), '2026-01-02 10:00:00')
+        self.assertEqual(self.store.find_uid('u1'), ('2026-01-02 10:00:00', 'a@example.com', 'Hello'))
+
+    def test_import_log_once(self):
+        path = os.path.join(self.tmp, 'sent.log')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('2026-01-01 09:00:00‡u0‡old@example.com‡‡‡Hi‡body‡1\nlegacy@example.com\n')
+        self.assertEqual(self.store.import_log(path), 2)
+        self.assertEqual(self.store.import_log(path), 0)
+        self.assertTrue(self.store.was_sent('old@example.com', subject='Hi'))
+        self.assertTrue(self.store.was_sent('legacy@example.com'))
+
+    def test_dedupe_modes(self):
+        row = lambda **kw: dict({'email': 'a@example.com', 'subject': 'Other'}, **kw)
+        self.assertFalse(already_sent(self.store, row(), None))
+        self.assertTrue(already_sent(self.store, row(), 'any'))
+        self.assertFalse(already_sent(self.store, row(), 'subject'))
+        self.assertTrue(already_sent(self.store, row(subject='Hello'), 'subject'))
+        self.assertTrue(already_sent(self.store, row(campaign='spring'), 'campaign'))
+        self.assertFalse(already_sent(self.store, row(campaign='autumn'), 'campaign'))
+        self.assertFalse(already_sent(self.store, row(), 'campaign'))  # No campaign: nothing to scope to
+        self.assertFalse(already_sent(self.store, row(email='b@example.com'), 'any'))
+
+if __name__ == '__main__':
+    unittest.main()
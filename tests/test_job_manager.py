@@ -0,0 +1,90 @@
+"""
+JobManager pause/resume/cancel around process_bulk_email, against a mocked Gmail API
+(googleapiclient HttpMockSequence), fully offline.
+
+Run: python3 -m unittest discover tests
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import gmail_core
+from job_manager import JobManager
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import HttpMockSequence
+
+def gmail(n):
+    with open(os.path.join(gmail_core.DISCOVERY_DIR, 'gmail.v1.json'), 'r', encoding='utf-8') as f:
+        return build_from_document(f.read(), http=HttpMockSequence(
+            [({'status': '200'}, json.dumps({'id': f'm{i}'})) for i in range(n)]))
+
+def rows(n):
+    return [{'email': f'user{i}@example.com', 'subject': 'Hello'} for i in range(n)]
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline: raise AssertionError('timed out')
+        time.sleep(0.01)
+
+class JobManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.patches = [mock.patch.multiple(gmail_core, HISTORY_PATH=os.path.join(self.tmp, 'sent.log'),
+                                            FAILED_PATH=os.path.join(self.tmp, 'failed.log'),
+                                            HISTORY_DB_PATH=os.path.join(self.tmp, 'sent.db'),
+                                            ADAPTIVE_RATE=False, _history_store=None),
+                        mock.patch.object(gmail_core, 'get_gmail_service', return_value=gmail(10))]
+        for p in self.patches: p.start()
+        self.jobs = JobManager(max_workers=1, rate=1000, daily_limit=100)
+
+    def tearDown(self):
+        self.jobs._pool.shutdown(wait=True)
+        gmail_core.history_writer.flush()
+        store = gmail_core._history_store
+        for p in self.patches: p.stop()
+        if store: store.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def submit(self, data, pause_after=None):
+        """Submits a send of data; with pause_after, the job pauses itself after that many sends."""
+        def task(job):
+            kwargs = self.jobs.send_kwargs(job)
+            notify = kwargs['notify']
+            def on_event(event, j, error=None):
+                notify(event, j, error)
+                if event == 'sent' and job.sent == pause_after: job.control.pause()
+            kwargs['notify'] = on_event
+            gmail_core.process_bulk_email(data, **kwargs)
+        return self.jobs.submit('test', 'rows', task, total=len(data))
+
+    def test_pause_and_resume(self):
+        job = self.submit(rows(3), pause_after=1)
+        wait_for(lambda: job.control.paused)
+        time.sleep(0.2)
+        self.assertEqual((job.to_dict()['status'], job.sent), ('paused', 1))
+        self.jobs.action(job.id, 'resume')
+        wait_for(lambda: job.finished)
+        self.assertEqual((job.status, job.sent), ('done', 3))
+
+    def test_cancel_running_and_queued(self):
+        running = self.submit(rows(3), pause_after=1)
+        queued = self.submit(rows(2))
+        wait_for(lambda: running.control.paused)
+        self.assertEqual(queued.status, 'queued')
+        self.jobs.action(queued.id, 'cancel')
+        self.jobs.action(running.id, 'cancel')
+        wait_for(lambda: running.finished and queued.finished)
+        self.assertEqual((running.status, running.sent), ('cancelled', 1))
+        self.assertEqual((queued.status, queued.sent), ('cancelled', 0))
+        self.assertEqual([j['status'] for j in self.jobs.list()], ['cancelled', 'cancelled'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+"""
+Pre-flight address syntax and batch dedupe (preflight.py).
+
+Run: python3 -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from preflight import Preflight, valid_address
+
+class AddressTest(unittest.TestCase):
+    def test_valid(self):
+        for address in ('a@example.com', "o'neil+tag@mail.example.co.uk", 'a@xn--e1afmkfd.xn--p1ai',
+                        'jörg@müller.de', 'пользователь@пример.рф', '用户@例子.广告'):
+            self.assertTrue(valid_address(address), address)
+
+    def test_invalid(self):
+        for address in ('a@example', 'a@@example.com', 'a b@example.com', 'a..b@example.com', 'a"b@example.com',
+                        'a@-example.com', 'a@example-.com', 'a@example.c0m', 'a@exa_mple.com', '@example.com'):
+            self.assertFalse(valid_address(address), address)
+
+class DedupeTest(unittest.TestCase):
+    def test_only_identical_rows_are_duplicates(self):
+        row = {'email': 'a@example.com', 'subject': 'Hello', 'body': 'One', 'name': 'A'}
+        rows = [row, dict(row, email='A@Example.com'), dict(row, body='Two'), dict(row, name='B'), dict(row, subject='Hi')]
+        checks = Preflight()
+        passed = list(checks.filter([dict(r) for r in rows]))
+        self.assertEqual([r['body'] + r['name'] + r['subject'] for r in passed], ['OneAHello', 'TwoAHello', 'OneBHello', 'OneAHi'])
+        self.assertEqual(checks.report.rejected, {'duplicate': 1})
+
+if __name__ == '__main__':
+    unittest.main()
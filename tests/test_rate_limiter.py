@@ -0,0 +1,79 @@
+"""
+AIMD send-rate bounds (rate_limiter.AimdController) and the SEND_RATE_MIN/MAX checks.
+
+Run: python3 -m unittest discover tests
+"""
+import os
+import sys
+import json
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import httplib2
+import gmail_core
+import rate_limiter
+from rate_limiter import AimdController, TokenBucket, ADAPT_MIN_FLOOR
+from googleapiclient.errors import HttpError
+
+def http_error(code, reason):
+    body = {'error': {'code': code, 'message': reason, 'errors': [{'reason': reason, 'message': reason}]}}
+    return HttpError(httplib2.Response({'status': str(code)}), json.dumps(body).encode())
+
+class AimdTest(unittest.TestCase):
+    def setUp(self):
+        patch = mock.patch.object(rate_limiter, 'ADAPT_COOLDOWN', 0.0)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_floor_is_clamped_positive(self):
+        for floor in (0, -1):
+            bucket = TokenBucket(1.0)
+            control = AimdController(bucket, floor, -5)
+            self.assertEqual(control.floor, ADAPT_MIN_FLOOR)
+            self.assertEqual(control.ceiling, ADAPT_MIN_FLOOR)
+            self.assertEqual(bucket.rate, ADAPT_MIN_FLOOR)
+            control.on_sent()
+            self.assertEqual(bucket.rate, ADAPT_MIN_FLOOR)
+
+    def test_decrease_stops_at_floor(self):
+        bucket = TokenBucket(2.0)
+        control = AimdController(bucket, 0, 2.0)
+        for _ in range(20): control.on_error(http_error(429, 'rateLimitExceeded'))
+        self.assertEqual(bucket.rate, ADAPT_MIN_FLOOR)
+        control.on_sent()  # The additive step divides by the rate
+        self.assertGreater(bucket.rate, ADAPT_MIN_FLOOR)
+        self.assertLessEqual(bucket.rate, 2.0)
+
+    def test_signals(self):
+        bucket = TokenBucket(1.0)
+        control = AimdController(bucket, 0.2, 2.0)
+        control.on_error(http_error(503, 'backendError'))
+        self.assertEqual(bucket.rate, 0.5)
+        control.on_error(http_error(400, 'invalidArgument'))  # Not a congestion signal
+        self.assertEqual(bucket.rate, 0.5)
+        control.on_error(http_error(403, 'dailyLimitExceeded'))
+        self.assertEqual(bucket.rate, 0.2)
+        for _ in range(200): control.on_sent()
+        self.assertEqual(bucket.rate, 2.0)
+
+    def test_cooldown_ignores_in_flight_signals(self):
+        with mock.patch.object(rate_limiter, 'ADAPT_COOLDOWN', 60.0):
+            bucket = TokenBucket(1.0)
+            control = AimdController(bucket, 0.2, 2.0)
+            control.on_error(http_error(429, 'rateLimitExceeded'))
+            control.on_error(http_error(429, 'rateLimitExceeded'))
+        self.assertEqual(bucket.rate, 0.5)
+
+class SendRateRangeTest(unittest.TestCase):
+    def test_validated(self):
+        with mock.patch.multiple(gmail_core, ADAPTIVE_RATE=True, SEND_RATE_MIN=0.2, SEND_RATE_MAX=2.5):
+            self.assertEqual(gmail_core.send_rate_range(), (0.2, 2.5))
+        for low, high in ((0, 2.5), (-1, 2.5), (3.0, 2.5)):
+            with mock.patch.multiple(gmail_core, ADAPTIVE_RATE=True, SEND_RATE_MIN=low, SEND_RATE_MAX=high):
+                self.assertRaises(ValueError, gmail_core.send_rate_range)
+        with mock.patch.multiple(gmail_core, ADAPTIVE_RATE=False, SEND_RATE_MIN=0):
+            self.assertIsNone(gmail_core.send_rate_range())
+
+if __name__ == '__main__':
+    unittest.main()
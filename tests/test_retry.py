@@ -0,0 +1,117 @@
+"""
+Retry classification, the RetryQueue, abandoned retries and replay_failed.py against a mocked Gmail API
+(googleapiclient HttpMockSequence), fully offline.
+
+Run: python3 -m unittest discover tests
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import gmail_core
+import retry_queue
+import replay_failed
+from log_writer import parse_line, FAILED_FIELDS
+from retry_queue import RetryQueue, classify_error, classify_error_text, is_quota_error
+from googleapiclient.discovery import build_from_document
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpMockSequence
+
+def gmail(responses):
+    with open(os.path.join(gmail_core.DISCOVERY_DIR, 'gmail.v1.json'), 'r', encoding='utf-8') as f:
+        return build_from_document(f.read(), http=HttpMockSequence(responses))
+
+def error(code, reason):
+    return {'error': {'code': code, 'message': reason, 'errors': [{'reason': reason, 'message': reason}]}}
+
+def http_error(code, reason, headers=None):
+    import httplib2
+    return HttpError(httplib2.Response(dict({'status': str(code)}, **(headers or {}))), json.dumps(error(code, reason)).encode())
+
+class ClassifyTest(unittest.TestCase):
+    def test_http_errors(self):
+        self.assertEqual(classify_error(http_error(429, 'rateLimitExceeded')), 'retryable')
+        self.assertEqual(classify_error(http_error(503, 'backendError')), 'retryable')
+        self.assertEqual(classify_error(http_error(403, 'userRateLimitExceeded')), 'retryable')
+        self.assertEqual(classify_error(http_error(400, 'invalidArgument')), 'permanent')
+        self.assertEqual(classify_error(http_error(403, 'forbidden')), 'permanent')
+        self.assertTrue(is_quota_error(http_error(403, 'dailyLimitExceeded')))
+
+    def test_logged_text(self):
+        self.assertEqual(classify_error_text('<HttpError 503 when requesting ...>'), 'retryable')
+        self.assertEqual(classify_error_text('<HttpError 400 when requesting ...>'), 'permanent')
+
+class RetryQueueTest(unittest.TestCase):
+    def test_push_limits(self):
+        queue = RetryQueue(max_attempts=2, deadline=60)
+        job = {'to': 'a@example.com'}
+        with mock.patch.object(retry_queue, 'backoff_delay', return_value=0.0):
+            self.assertFalse(queue.push(job, http_error(400, 'invalidArgument')))
+            self.assertTrue(queue.push(job, http_error(429, 'rateLimitExceeded')))
+            self.assertIs(queue.pop_ready(), job)
+            self.assertFalse(queue.push(job, http_error(429, 'rateLimitExceeded')))  # Out of attempts
+        self.assertEqual(len(queue), 0)
+
+    def test_retry_after_past_deadline(self):
+        queue = RetryQueue(deadline=10)
+        self.assertFalse(queue.push({'to': 'a@example.com'}, http_error(429, 'rateLimitExceeded', {'retry-after': '30'})))
+
+class FailedLogTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.failed = os.path.join(self.tmp, 'failed.log')
+        self.patches = [mock.patch.multiple(gmail_core, HISTORY_PATH=os.path.join(self.tmp, 'sent.log'), FAILED_PATH=self.failed,
+                                            HISTORY_DB_PATH=os.path.join(self.tmp, 'sent.db'), _history_store=None)]
+        for p in self.patches: p.start()
+
+    def tearDown(self):
+        gmail_core.history_writer.flush()
+        store = gmail_core._history_store
+        for p in self.patches: p.stop()
+        if store: store.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def failed_lines(self):
+        gmail_core.history_writer.flush()
+        with open(self.failed, 'r', encoding='utf-8') as f:
+            return [parse_line(line, FAILED_FIELDS) for line in f]
+
+    def test_retry_then_sent(self):
+        service = gmail([({'status': '503'}, json.dumps(error(503, 'backendError'))), ({'status': '200'}, json.dumps({'id': 'm0'}))])
+        events = []
+        rows = [{'email': 'user0@example.com', 'subject': 'Hi'}]
+        with mock.patch.object(gmail_core, 'get_gmail_service', return_value=service), \
+             mock.patch.object(retry_queue, 'backoff_delay', return_value=0.0):
+            gmail_core.process_bulk_email(rows, rate=1000, notify=lambda e, j, err=None: events.append(e))
+        self.assertEqual([e for e in events if e != 'pending'], ['retry', 'sent'])
+
+    def test_abandoned_retries_are_logged_retryable(self):
+        service = gmail([({'status': '429'}, json.dumps(error(429, 'rateLimitExceeded'))), ({'status': '200'}, json.dumps({'id': 'm1'}))])
+        rows = [{'email': f'user{i}@example.com', 'subject': 'Hi'} for i in range(3)]
+        with mock.patch.object(gmail_core, 'get_gmail_service', return_value=service), \
+             mock.patch.object(retry_queue, 'backoff_delay', return_value=30.0):
+            gmail_core.process_bulk_email(rows, rate=1000, daily_limit=1)  # user2 hits the limit while user0 waits
+        lines = self.failed_lines()
+        self.assertEqual([(p[1], p[3]) for p in lines], [('user0@example.com', 'retryable')])
+        self.assertIn('Retry abandoned', lines[0][2])
+        self.assertEqual([r['email'] for r in replay_failed.load_replay_rows(self.failed)], ['user0@example.com'])
+
+    def test_replay_keeps_every_row_of_an_address(self):
+        rows = [{'email': 'a@example.com', 'subject': s, '__gmail_id': f'uid{i}'} for i, s in enumerate(('One', 'Two', 'Three'))]
+        gmail_core.log_failed_email(rows[0], 'Retry abandoned (batch stopped after attempt 1)', 'retryable')
+        gmail_core.log_failed_email(rows[1], http_error(503, 'backendError'))
+        gmail_core.log_failed_email(rows[2], http_error(400, 'invalidArgument'))
+        gmail_core.history_writer.flush()
+        replay = replay_failed.load_replay_rows(self.failed)
+        self.assertEqual(sorted(r['subject'] for r in replay), ['One', 'Two'])
+
+        gmail_core.log_sent_email(rows[1], 'body', 0)  # Re-sent since it failed
+        self.assertEqual([r['subject'] for r in replay_failed.load_replay_rows(self.failed)], ['One'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+send_batch against a mocked Gmail batch endpoint (googleapiclient HttpMockSequence), fully offline:
+per-part success, a 429 retried in a smaller batch, a permanent 400 logged as failed, and the same
+retry policy for a large message sent as a media upload.
+
+Run: python3 -m unittest discover tests
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import gmail_core
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import HttpMockSequence
+
+BOUNDARY = 'batch_test'
+
+def batch_response(parts):
+    """A multipart/mixed batch answer: parts is [(request id, status, payload)]."""
+    body = ''.join(f"--{BOUNDARY}\r\nContent-Type: application/http\r\nContent-ID: <response-base + {rid}>\r\n\r\n"
+                   f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n\r\n{json.dumps(payload)}\r\n"
+                   for rid, status, payload in parts)
+    return ({'status': '200', 'content-type': f'multipart/mixed; boundary={BOUNDARY}'}, body + f"--{BOUNDARY}--")
+
+def error(code, reason):
+    return {'error': {'code': code, 'message': reason, 'errors': [{'reason': reason, 'message': reason}]}}
+
+def job(i):
+    data = {'email': f'user{i}@example.com', '__gmail_id': f'uid{i}'}
+    return {'data': data, 'to': data['email'], 'body': 'body', 'files': [], 'msg': {'raw': 'cmF3'}}
+
+class SendBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.patches = [mock.patch.multiple(gmail_core, HISTORY_PATH=os.path.join(self.tmp, 'sent.log'),
+                                            FAILED_PATH=os.path.join(self.tmp, 'failed.log'),
+                                            HISTORY_DB_PATH=os.path.join(self.tmp, 'sent.db'), _history_store=None),
+                        mock.patch.object(gmail_core, 'backoff_delay', return_value=0.0)]
+        for p in self.patches: p.start()
+        with open(os.path.join(gmail_core.DISCOVERY_DIR, 'gmail.v1.json'), 'r', encoding='utf-8') as f:
+            self.service = build_from_document(f.read(), http=HttpMockSequence([]))
+
+    def tearDown(self):
+        gmail_core.history_writer.flush()
+        store = gmail_core._history_store
+        for p in self.patches: p.stop()
+        if store: store.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_success_retry_and_permanent_failure(self):
+        http = HttpMockSequence([
+            batch_response([(0, 200, {'id': 'm0'}), (1, 429, error(429, 'rateLimitExceeded')), (2, 400, error(400, 'invalidArgument'))]),
+            batch_response([(1, 200, {'id': 'm1'})]),
+        ])
+        events = []
+        jobs = [job(i) for i in range(3)]
+        results = gmail_core.send_batch(self.service, jobs, http=http, notify=lambda e, j, err=None: events.append((e, j['to'])))
+
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(events, [('sent', 'user0@example.com'), ('retry', 'user1@example.com'),
+                                  ('failed', 'user2@example.com'), ('sent', 'user1@example.com')])
+        gmail_core.history_writer.flush()
+        with open(gmail_core.HISTORY_PATH, encoding='utf-8') as f:
+            self.assertEqual([line.split('‡')[1] for line in f], ['uid0', 'uid1'])
+        with open(gmail_core.FAILED_PATH, encoding='utf-8') as f:
+            failed = f.read().split('‡')
+        self.assertEqual(failed[1], 'user2@example.com')
+        self.assertEqual(failed[3], 'permanent')
+
+    def test_media_upload_gets_batch_retries(self):
+        with open(os.path.join(gmail_core.DISCOVERY_DIR, 'gmail.v1.json'), 'r', encoding='utf-8') as f:
+            service = build_from_document(f.read(), http=HttpMockSequence([
+                ({'status': '503'}, json.dumps(error(503, 'backendError'))),
+                ({'status': '200', 'location': 'https://gmail.googleapis.com/upload/session'}, ''),
+                ({'status': '200'}, json.dumps({'id': 'm0'})),
+            ]))
+        large = dict(job(0), msg={'chunks': [b'Subject: big\r\n\r\n', b'x' * 1024]})
+        events = []
+        results = gmail_core.send_batch(service, [large], notify=lambda e, j, err=None: events.append(e))
+        self.assertEqual(results, [True])
+        self.assertEqual(events, ['retry', 'sent'])
+
+    def test_batch_uri_follows_api_endpoint(self):
+        with mock.patch.object(gmail_core, 'API_ENDPOINT', 'http://127.0.0.1:9/'):
+            self.assertEqual(gmail_core.new_batch_request(self.service, None)._batch_uri, 'http://127.0.0.1:9/batch')
+        self.assertEqual(gmail_core.new_batch_request(self.service, None)._batch_uri, 'https://gmail.googleapis.com/batch')
+
+if __name__ == '__main__':
+    unittest.main()
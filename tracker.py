@@ -0,0 +1,199 @@
+"""
+Open-tracking pixel. OpenTracker counts opens per uid in memory and appends them to
+log/track_history.log through a batched LogWriter. Served by ui/server.py (/tracker) or by the
+standalone asyncio server below, which answers thousands of pixel hits per second on one core:
+
+    python3 tracker.py [--host 0.0.0.0] [--port 8080] [--log log/track_history.log]
+
+Point TRACKING_URL_BASE in gmail_core.py at http(s)://<host>/tracker.
+"""
+import os
+import sys
+import json
+import base64
+import asyncio
+import logging
+import argparse
+import datetime
+import threading
+from urllib.parse import parse_qs
+from log_writer import LogWriter, TRACK_FIELDS, parse_line, log_files
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TRACK_PATH = os.path.join(BASE_DIR, 'log', 'track_history.log')
+TRACKER_HOST = '0.0.0.0'
+TRACKER_PORT = 8080
+TRACK_FLUSH_INTERVAL = 1.0   # Seconds opens are grouped before a write + fsync
+TRACK_PATHS = ('/tracker', '/tracker/tracker.php', '/tracker.php')
+MAX_REQUEST_HEAD = 16 * 1024  # Larger request heads are refused
+
+PIXEL = base64.b64decode('R0lGODlhAQABAIAAAP///wAAACH5BAEAAAAALAAAAAABAAEAAAICRAEAOw==')  # 1x1 transparent GIF
+PIXEL_HEADERS = {
+    'Content-Type': 'image/gif',
+    'Cache-Control': 'no-store, no-cache, must-revalidate, max-age=0',
+    'Pragma': 'no-cache',
+    'Expires': '0',
+}
+
+def _clean(value):
+    """Client-supplied value made safe for one log field."""
+    return str(value).replace('‡', '|').replace('\n', ' ').replace('\r', '')[:300]
+
+class OpenTracker:
+    """
+    Per-uid open counters kept in memory (rebuilt from the log on start) and an append-only open log.
+    record() is cheap enough for the request path: the line is queued and written by the log writer thread.
+    """
+    def __init__(self, path=TRACK_PATH, flush_interval=TRACK_FLUSH_INTERVAL, load=True):
+        self.path = path
+        self.hits = 0
+        self._opens = {}  # uid -> opens
+        self._lock = threading.Lock()
+        self._writer = LogWriter(flush_interval=flush_interval)
+        if load: self.load()
+
+    def load(self):
+        """Rebuilds the counters from the existing log (and its rotated copies)."""
+        opens, hits = {}, 0
+        for path in log_files(self.path):
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    parts = parse_line(line, TRACK_FIELDS)
+                    if len(parts) < 2 or not parts[1]: continue
+                    opens[parts[1]] = opens.get(parts[1], 0) + 1
+                    hits += 1
+        with self._lock:
+            self._opens, self.hits = opens, hits
+
+    def record(self, uid, email='', ip='', agent=''):
+        if not uid: return
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            self._opens[uid] = self._opens.get(uid, 0) + 1
+            self.hits += 1
+        self._writer.write(self.path, TRACK_FIELDS, (now, _clean(uid), _clean(email), _clean(ip), _clean(agent)))
+
+    def record_query(self, query, ip='', agent=''):
+        """Records a pixel hit from its query string (id=<uid>&user=<email>)."""
+        params = parse_qs(query)
+        self.record(params.get('id', [''])[0], params.get('user', [''])[0], ip, agent)
+
+    def opens(self, uid):
+        with self._lock:
+            return self._opens.get(uid, 0)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'uids': len(self._opens)}
+
+    def flush(self):
+        self._writer.flush()
+
+    def close(self):
+        self._writer.close()
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+def open_tracker():
+    """Process-wide OpenTracker (created on first use)."""
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None: _tracker = OpenTracker()
+    return _tracker
+
+# --- Standalone server: a minimal HTTP/1.1 (keep-alive) responder, one event loop thread ---
+
+def _response(status, body, content_type, extra=None, keep_alive=True):
+    headers = {'Content-Type': content_type, 'Content-Length': str(len(body))}
+    headers.update(extra or {})
+    headers['Connection'] = 'keep-alive' if keep_alive else 'close'
+    head = f"HTTP/1.1 {status}\r\n" + ''.join(f"{k}: {v}\r\n" for k, v in headers.items()) + "\r\n"
+    return head.encode('latin-1') + body
+
+_PIXEL_RESPONSES = {keep: _response('200 OK', PIXEL, 'image/gif', PIXEL_HEADERS, keep) for keep in (True, False)}
+_NOT_FOUND = _response('404 Not Found', b'Not found', 'text/plain', keep_alive=False)
+_BAD_REQUEST = _response('400 Bad Request', b'Bad request', 'text/plain', keep_alive=False)
+
+class _PixelProtocol(asyncio.Protocol):
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.buffer = b''
+
+    def connection_made(self, transport):
+        self.transport = transport
+        peer = transport.get_extra_info('peername')
+        self.peer = peer[0] if peer else ''
+
+    def data_received(self, data):
+        self.buffer += data
+        while True:
+            end = self.buffer.find(b'\r\n\r\n')
+            if end < 0:
+                if len(self.buffer) > MAX_REQUEST_HEAD: self._finish(_BAD_REQUEST)
+                return
+            head, self.buffer = self.buffer[:end], self.buffer[end + 4:]
+            if not self._handle(head): return
+
+    def _handle(self, head):
+        """Answers one request; returns False once the connection is closed."""
+        lines = head.decode('latin-1').split('\r\n')
+        parts = lines[0].split(' ')
+        if len(parts) != 3 or parts[0] not in ('GET', 'HEAD'): return self._finish(_BAD_REQUEST)
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if 'content-length' in headers or 'transfer-encoding' in headers: return self._finish(_BAD_REQUEST)
+        keep_alive = parts[2] == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+        path, _, query = parts[1].partition('?')
+        if path in TRACK_PATHS:
+            ip = headers.get('x-forwarded-for', '').split(',')[0].strip() or self.peer
+            self.tracker.record_query(query, ip, headers.get('user-agent', ''))
+            response = _PIXEL_RESPONSES[keep_alive]
+        elif path == '/stats':
+            uid = parse_qs(query).get('id', [''])[0]
+            stats = dict(self.tracker.stats(), **({'id': uid, 'opens': self.tracker.opens(uid)} if uid else {}))
+            response = _response('200 OK', json.dumps(stats).encode(), 'application/json', keep_alive=keep_alive)
+        else:
+            return self._finish(_NOT_FOUND)
+        if parts[0] == 'HEAD': response = response[:response.index(b'\r\n\r\n') + 4]
+        if not keep_alive: return self._finish(response)
+        self.transport.write(response)
+        return True
+
+    def _finish(self, response):
+        self.transport.write(response)
+        self.transport.close()
+        self.buffer = b''
+        return False
+
+async def serve(host=TRACKER_HOST, port=TRACKER_PORT, tracker=None):
+    tracker = tracker or open_tracker()
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(lambda: _PixelProtocol(tracker), host, port, reuse_address=True)
+    logging.info(f"Tracker listening on http://{host}:{port}{TRACK_PATHS[0]} ({tracker.stats()['hits']} opens loaded)")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Open-tracking pixel server')
+    parser.add_argument('--host', default=TRACKER_HOST)
+    parser.add_argument('--port', type=int, default=TRACKER_PORT)
+    parser.add_argument('--log', help=f'open log (default {TRACK_PATH}; when given, the process log goes to the console only)')
+    args = parser.parse_args()
+    if args.log:  # Elsewhere (e.g. the benchmark's temp dir): keep log/process.log out of it
+        logging.basicConfig(level=logging.INFO, format='[%(asctime)s] [%(levelname)s] %(message)s',
+                            datefmt='%Y-%m-%d %H:%M:%S', stream=sys.stdout)
+    else:
+        from setup_logging import setup_logging
+        setup_logging()
+    _tracker = OpenTracker(args.log or TRACK_PATH)
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        open_tracker().close()
+        sys.exit(0)
@@ -1,10 +1,12 @@
 import sys
 import os
-import threading
+import csv
+import uuid
 import logging
 import json
 import time
-from flask import Flask, render_template_string, request, jsonify, redirect, url_for
+import threading
+from flask import Flask, Response, render_template_string, request, jsonify, redirect, url_for
 
 # --- 1. SETUP PATHS ---
 # Add parent directory to path so we can import gmail_core, etc.
@@ -14,9 +16,17 @@ sys.path.append(parent_dir)
 
 # Import your existing modules
 import gmail_core
+import metrics
 import list_sheets
 import send_googlesheet
 import send_csv
+import tracker
+from analytics import CampaignStats
+from job_manager import JobManager
+from log_index import LogIndex
+from log_writer import SENT_FIELDS, FAILED_FIELDS
+from event_bus import EventBus, BusLogHandler, format_sse
+from setup_logging import setup_logging
 
 # --- 2. FLASK CONFIG ---
 app = Flask(__name__)
@@ -24,8 +34,14 @@ app.secret_key = 'super-secret-key-change-this'
 
 # Configuration
 LOG_FILE = os.path.join(parent_dir, 'log', 'process.log')
-TOKEN_PATH = os.path.join(parent_dir, 'token.json')
 CREDENTIALS_PATH = os.path.join(parent_dir, 'credentials.json')
+UPLOAD_DIR = os.path.join(parent_dir, 'log', 'uploads')
+LOG_TAIL_BYTES = 64 * 1024  # How much of process.log a fresh page load receives
+EVENT_TAIL = 200            # Buffered events replayed to a fresh per-job stream
+HISTORY_PAGE_MAX = 500      # Largest per_page accepted by /api/history
+
+bus = EventBus()
+jobs = JobManager(bus=bus)
 
 # --- 3. HTML TEMPLATE (Single File UI) ---
 # Using a simple Bootstrap layout embedded here for ease of use
@@ -118,16 +134,21 @@ HTML_TEMPLATE = """
                         <!-- TAB: AUTH -->
                         <div class="tab-pane fade" id="auth" role="tabpanel">
                             <div class="alert alert-info">
-                                <small>Upload <b>credentials.json</b> (from Google Cloud) or <b>token.json</b> (generated locally).</small>
+                                <small>Upload <b>credentials.json</b> (from Google Cloud) or <b>token.json</b> (generated locally).
+                                Name the account to add a <b>token.json</b> as an extra sending account.</small>
                             </div>
                             <form action="/upload_auth" method="post" enctype="multipart/form-data" class="mb-2">
                                 <div class="input-group">
                                     <input type="file" class="form-control" name="file">
+                                    <input type="text" class="form-control" name="account" placeholder="Account (default)">
                                     <button class="btn btn-outline-secondary" type="submit">Upload</button>
                                 </div>
                             </form>
                             <hr>
-                            <button onclick="deleteToken()" class="btn btn-danger btn-sm w-100">Delete Existing Token</button>
+                            <table class="table table-sm">
+                                <thead><tr><th>Account</th><th>Sent</th><th>Remaining</th><th>Rate/s</th><th></th></tr></thead>
+                                <tbody id="accounts-body"><tr><td colspan="5" class="text-muted">No authorized account</td></tr></tbody>
+                            </table>
                         </div>
 
                     </div>
@@ -146,6 +167,21 @@ HTML_TEMPLATE = """
             </div>
         </div>
     </div>
+
+    <!-- JOBS -->
+    <div class="row mt-4">
+        <div class="col">
+            <div class="card">
+                <div class="card-header bg-white"><b>Jobs</b></div>
+                <div class="card-body p-0">
+                    <table class="table table-sm mb-0">
+                        <thead><tr><th>Job</th><th>Source</th><th>Status</th><th>Progress</th><th>Sent</th><th>Failed</th><th>Rate</th><th>ETA</th><th></th></tr></thead>
+                        <tbody id="jobs-body"><tr><td colspan="9" class="text-muted">No jobs yet.</td></tr></tbody>
+                    </table>
+                </div>
+            </div>
+        </div>
+    </div>
 </div>
 
 <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
@@ -177,24 +213,62 @@ HTML_TEMPLATE = """
     }
     loadSheets();
 
-    // --- LOG POLLING ---
-    let lastLogPos = 0;
-    async function pollLogs() {
-        try {
-            const res = await fetch('/api/logs?pos=' + lastLogPos);
-            const data = await res.json();
-            if (data.logs) {
-                const logWin = document.getElementById('log-window');
-                // Replace newlines with <br> and append
-                const htmlLogs = data.logs.replace(/\\n/g, '<br>');
-                logWin.innerHTML += htmlLogs;
-                logWin.scrollTop = logWin.scrollHeight; // Auto scroll
-                lastLogPos = data.pos;
-            }
-        } catch (e) { console.error(e); }
-        setTimeout(pollLogs, 2000);
+    // --- LIVE EVENTS (Server-Sent Events) ---
+    const jobsById = {};
+
+    function appendLog(text) {
+        const logWin = document.getElementById('log-window');
+        if (logWin.textContent === 'Waiting for action...') logWin.textContent = '';
+        text.split('\n').forEach(line => {
+            if (!line) return;
+            logWin.appendChild(document.createTextNode(line));
+            logWin.appendChild(document.createElement('br'));
+        });
+        logWin.scrollTop = logWin.scrollHeight; // Auto scroll
+    }
+
+    const events = new EventSource('/api/events');
+    events.addEventListener('snapshot', e => {
+        const data = JSON.parse(e.data);
+        if (data.log) appendLog(data.log);
+        data.jobs.forEach(j => jobsById[j.id] = j);
+        renderJobs();
+    });
+    events.addEventListener('log', e => appendLog(JSON.parse(e.data).line));
+    ['job', 'progress'].forEach(type => events.addEventListener(type, e => {
+        const j = JSON.parse(e.data);
+        jobsById[j.id] = j;
+        renderJobs();
+    }));
+
+    // --- JOBS ---
+    function escapeHtml(value) {
+        return String(value).replace(/[&<>"']/g, c => ({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'})[c]);
+    }
+    function fmtEta(sec) {
+        if (sec === null || sec === undefined) return '-';
+        const m = Math.floor(sec / 60), s = sec % 60;
+        return m ? `${m}m ${s}s` : `${s}s`;
+    }
+    async function jobAction(id, action) {
+        await fetch(`/api/jobs/${id}/${action}`, { method: 'POST' });
+    }
+    function renderJobs() {
+        const data = Object.values(jobsById).sort((a, b) => b.created - a.created);
+        const body = document.getElementById('jobs-body');
+        if (!data.length) return;
+        body.innerHTML = data.map(j => {
+            const active = j.status === 'running' || j.status === 'paused' || j.status === 'queued';
+            const buttons = !active ? '' :
+                (j.status === 'paused'
+                    ? `<button class="btn btn-sm btn-outline-success" onclick="jobAction('${j.id}','resume')">Resume</button> `
+                    : `<button class="btn btn-sm btn-outline-secondary" onclick="jobAction('${j.id}','pause')">Pause</button> `) +
+                `<button class="btn btn-sm btn-outline-danger" onclick="jobAction('${j.id}','cancel')">Cancel</button>`;
+            return `<tr><td><code>${escapeHtml(j.id)}</code></td><td>${escapeHtml(j.kind)}: ${escapeHtml(j.label)}</td><td>${escapeHtml(j.status)}</td>` +
+                   `<td>${j.done}${j.total !== null ? ' / ' + j.total : ''}</td><td>${j.sent}</td><td>${j.failed}</td>` +
+                   `<td>${j.rate}/s</td><td>${fmtEta(j.eta)}</td><td>${buttons}</td></tr>`;
+        }).join('');
     }
-    pollLogs();
 
     function clearLogDisplay() {
         document.getElementById('log-window').innerHTML = '';
@@ -227,10 +301,26 @@ HTML_TEMPLATE = """
         alert("Process started in background. Check logs.");
     };
 
-    async function deleteToken() {
-        if(confirm("Are you sure? You will need to re-authenticate.")) {
-            await fetch('/api/delete_token', { method: 'POST' });
+    async function loadAccounts() {
+        const data = await (await fetch('/api/accounts')).json();
+        if (!data.length) return;
+        document.getElementById('accounts-body').innerHTML = data.map(a =>
+            `<tr><td>${escapeHtml(a.name)}${a.exhausted ? ' <span class="badge bg-warning text-dark">quota</span>' : ''}</td>` +
+            `<td>${a.sent}</td><td>${a.remaining === null ? '-' : a.remaining}</td><td>${a.rate ? a.rate : '-'}</td>` +
+            `<td><button class="btn btn-sm btn-outline-danger" data-account="${escapeHtml(a.name)}" onclick="deleteToken(this.dataset.account)">Delete</button></td></tr>`
+        ).join('');
+    }
+    document.getElementById('auth-tab').addEventListener('shown.bs.tab', loadAccounts);
+
+    async function deleteToken(account) {
+        if(confirm(`Delete the token of ${account}? You will need to re-authenticate it.`)) {
+            await fetch('/api/delete_token', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({ account: account })
+            });
             alert("Token deleted.");
+            loadAccounts();
         }
     }
 </script>
@@ -240,39 +330,35 @@ HTML_TEMPLATE = """
 
 # --- 4. BACKEND LOGIC ---
 
-def run_async_process(target_func, args=()):
-    """Helper to run email sending in a background thread."""
-    thread = threading.Thread(target=target_func, args=args)
-    thread.daemon = True
-    thread.start()
-
-def task_send_sheet(sheet_id, sheet_name):
+def task_send_sheet(job, sheet_id, sheet_name):
     """Wrapper to call send_googlesheet logic."""
-    logging.info(f"--- Starting Batch from Sheet: {sheet_id} ---")
-    try:
-        data = send_googlesheet.get_sheet_data(sheet_id, sheet_name)
-        if data:
-            gmail_core.process_bulk_email(data)
-        else:
-            logging.error("No data found in sheet.")
-    except Exception as e:
-        logging.error(f"Task Failed: {e}")
+    logging.info(f"--- Starting Batch from Sheet: {sheet_id} (job {job.id}) ---")
+    data = send_googlesheet.get_sheet_data(sheet_id, sheet_name)
+    if data:
+        gmail_core.process_bulk_email(data, campaign=send_googlesheet.sheet_campaign(sheet_id, sheet_name),
+                                      **jobs.send_kwargs(job))
+    else:
+        logging.error("No data found in sheet.")
 
-def task_send_csv(filepath):
+def task_send_csv(job, filepath):
     """Wrapper to call send_csv logic."""
-    logging.info(f"--- Starting Batch from CSV: {filepath} ---")
+    logging.info(f"--- Starting Batch from CSV: {job.label} (job {job.id}) ---")
+    data = send_csv.get_csv_data_as_objects(filepath)
+    if data:
+        gmail_core.process_bulk_email(data, **jobs.send_kwargs(job))
+    else:
+        logging.error("No data found in CSV.")
+
+def count_csv_rows(filepath):
     try:
-        data = send_csv.get_csv_data_as_objects(filepath)
-        if data:
-            gmail_core.process_bulk_email(data)
-        else:
-            logging.error("No data found in CSV.")
-    except Exception as e:
-        logging.error(f"Task Failed: {e}")
-    finally:
-        # Clean up temp file
-        if os.path.exists(filepath):
-            os.remove(filepath)
+        with open(filepath, mode='r', encoding='utf-8') as f:
+            return max(0, sum(1 for _ in csv.reader(f)) - 1)
+    except Exception:
+        return None
+
+def remove_file(filepath):
+    if os.path.exists(filepath):
+        os.remove(filepath)
 
 # --- 5. ROUTES ---
 
@@ -290,19 +376,61 @@ def api_get_sheets():
     except Exception as e:
         return jsonify({"error": str(e)})
 
+def read_log_tail(max_bytes=LOG_TAIL_BYTES):
+    """Last max_bytes of process.log, starting at a line boundary."""
+    if not os.path.exists(LOG_FILE): return ""
+    with open(LOG_FILE, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - max_bytes))
+        data = f.read()
+    if size > max_bytes: data = data.split(b'\n', 1)[-1]
+    return data.decode('utf-8', errors='replace')
+
 @app.route('/api/logs')
 def api_logs():
-    """Returns content of log file starting from 'pos' byte."""
+    """Returns content of log file starting from 'pos' byte (a fresh load only gets the tail)."""
     pos = int(request.args.get('pos', 0))
     if not os.path.exists(LOG_FILE):
         return jsonify({"logs": "", "pos": 0})
     
-    with open(LOG_FILE, 'r') as f:
+    tail = pos == 0 and os.path.getsize(LOG_FILE) > LOG_TAIL_BYTES
+    if pos == 0: pos = max(0, os.path.getsize(LOG_FILE) - LOG_TAIL_BYTES)
+    with open(LOG_FILE, 'rb') as f:  # pos is a byte offset, which may fall inside a UTF-8 character
         f.seek(pos)
-        content = f.read()
-        new_pos = f.tell()
+        data = f.read()
+    data = data[:data.rfind(b'\n') + 1]  # Complete lines only; the rest is read on the next poll
+    new_pos = pos + len(data)
+    if tail: data = data.split(b'\n', 1)[-1]
     
-    return jsonify({"logs": content, "pos": new_pos})
+    return jsonify({"logs": data.decode('utf-8', errors='replace'), "pos": new_pos})
+
+@app.route('/api/events')
+def api_events():
+    """
+    Server-Sent Events stream of log lines and job progress, pushed from the event bus.
+    ?job=<id> limits it to one job. Reconnects resume from Last-Event-ID without a new snapshot.
+    """
+    job_id = request.args.get('job')
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+    since = int(last_id) if last_id and last_id.isdigit() else None
+
+    def stream():
+        start, tail, current = since, None, bus.last_id
+        if since is None or since > current:  # New client, or ids from before a server restart
+            if job_id:
+                job = jobs.get(job_id)
+                snapshot = {'jobs': [job.to_dict()] if job else [], 'log': ''}
+                start, tail = 0, EVENT_TAIL
+            else:
+                start = current
+                snapshot = {'jobs': jobs.list(), 'log': read_log_tail()}
+            # Carries the current id, so a reconnect resumes after it instead of replaying the snapshot
+            yield format_sse({'id': current, 'type': 'snapshot', 'data': snapshot})
+        for event in bus.subscribe(since=start, job_id=job_id, tail=tail):
+            yield format_sse(event)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/send_sheet', methods=['POST'])
 def api_send_sheet():
@@ -310,10 +438,8 @@ def api_send_sheet():
     sheet_id = data.get('sheet_id')
     sheet_name = data.get('sheet_name')
     
-    # Run in background
-    run_async_process(task_send_sheet, (sheet_id, sheet_name))
-    
-    return jsonify({"status": "started", "message": "Background task initiated"})
+    job = jobs.submit('sheet', sheet_name or sheet_id, task_send_sheet, sheet_id, sheet_name)
+    return jsonify({"status": "started", "message": "Background task initiated", "job_id": job.id})
 
 @app.route('/api/send_csv', methods=['POST'])
 def api_send_csv():
@@ -324,14 +450,102 @@ def api_send_csv():
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
         
-    # Save to a temp location
-    temp_path = os.path.join(parent_dir, 'temp_upload.csv')
+    # Save to a per-upload temp file so concurrent uploads don't overwrite each other
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    temp_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}.csv")
     file.save(temp_path)
     
-    # Run in background
-    run_async_process(task_send_csv, (temp_path,))
-    
-    return jsonify({"status": "started", "message": "CSV processing initiated"})
+    job = jobs.submit('csv', file.filename, task_send_csv, temp_path,
+                      total=count_csv_rows(temp_path), cleanup=lambda: remove_file(temp_path))
+    return jsonify({"status": "started", "message": "CSV processing initiated", "job_id": job.id})
+
+@app.route('/metrics')
+def api_metrics():
+    """Send pipeline counters and per-stage latency histograms in Prometheus text format."""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+_history_indexes = {}
+_history_indexes_lock = threading.Lock()
+
+def history_index(log):
+    """Sidecar offset index for the 'sent' or 'failed' log, opened on first use."""
+    with _history_indexes_lock:
+        if log not in _history_indexes:
+            if log == 'sent': _history_indexes[log] = LogIndex(gmail_core.HISTORY_PATH, SENT_FIELDS)
+            else: _history_indexes[log] = LogIndex(gmail_core.FAILED_PATH, FAILED_FIELDS)
+        return _history_indexes[log]
+
+@app.route('/api/history')
+def api_history():
+    """
+    Searches sent_history.log (?log=sent, default) or failed_history.log (?log=failed), newest first.
+    Filters: email, uid, subject (substring), since/until (YYYY-MM-DD or full timestamp). Paged by page/per_page.
+    """
+    log = request.args.get('log', 'sent')
+    if log not in ('sent', 'failed'):
+        return jsonify({"error": "log must be 'sent' or 'failed'"}), 400
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+        per_page = min(HISTORY_PAGE_MAX, max(1, int(request.args.get('per_page', 50))))
+    except ValueError:
+        return jsonify({"error": "page and per_page must be numbers"}), 400
+
+    total, entries = history_index(log).search(
+        email=request.args.get('email'), uid=request.args.get('uid'), subject=request.args.get('subject'),
+        since=request.args.get('since'), until=request.args.get('until'),
+        limit=per_page, offset=(page - 1) * per_page)
+    return jsonify({"log": log, "total": total, "page": page, "per_page": per_page, "entries": entries})
+
+@app.route('/tracker')
+@app.route('/tracker/tracker.php')
+def track_open():
+    """Tracking pixel: records the open (?id=<uid>&user=<email>) and returns a cached 1x1 GIF."""
+    ip = (request.headers.get('X-Forwarded-For') or '').split(',')[0].strip() or request.remote_addr or ''
+    tracker.open_tracker().record_query(request.query_string.decode('latin-1'), ip, request.headers.get('User-Agent', ''))
+    return Response(tracker.PIXEL, mimetype='image/gif', headers=tracker.PIXEL_HEADERS)
+
+_campaign_stats = None
+_campaign_stats_lock = threading.Lock()
+
+def campaign_stats():
+    """Analytics over the sent and tracking logs, opened on first use."""
+    global _campaign_stats
+    with _campaign_stats_lock:
+        if _campaign_stats is None: _campaign_stats = CampaignStats(gmail_core.HISTORY_PATH, tracker.TRACK_PATH)
+        return _campaign_stats
+
+@app.route('/api/stats')
+def api_stats():
+    """
+    Sent / opened / unique opens / open rate / average time to first open, per day (?by=day, default)
+    or per subject (?by=subject). Filters: since/until (YYYY-MM-DD), subject (substring); limit.
+    """
+    by = request.args.get('by', 'day')
+    if by not in ('day', 'subject'):
+        return jsonify({"error": "by must be 'day' or 'subject'"}), 400
+    try:
+        limit = min(HISTORY_PAGE_MAX, max(1, int(request.args.get('limit', 100))))
+    except ValueError:
+        return jsonify({"error": "limit must be a number"}), 400
+
+    stats = campaign_stats()
+    read = stats.refresh()
+    rows = stats.stats(by, since=request.args.get('since'), until=request.args.get('until'),
+                       subject=request.args.get('subject'), limit=limit)
+    return jsonify({"by": by, "totals": stats.totals(), "rows": rows, "new_lines": read})
+
+@app.route('/api/jobs')
+def api_jobs():
+    return jsonify(jobs.list())
+
+@app.route('/api/jobs/<job_id>/<action>', methods=['POST'])
+def api_job_action(job_id, action):
+    if action not in ('pause', 'resume', 'cancel'):
+        return jsonify({"error": "Unknown action"}), 400
+    job = jobs.action(job_id, action)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
 
 @app.route('/upload_auth', methods=['POST'])
 def upload_auth():
@@ -339,16 +553,42 @@ def upload_auth():
         return "No file", 400
     
     file = request.files['file']
-    if file.filename in ['credentials.json', 'token.json']:
-        file.save(os.path.join(parent_dir, file.filename))
+    account = request.form.get('account', '').strip() or gmail_core.DEFAULT_ACCOUNT
+    if file.filename == 'credentials.json':
+        file.save(CREDENTIALS_PATH)
+        gmail_core.reset_credentials()
+        return redirect('/')
+    elif file.filename == 'token.json':
+        if not gmail_core.valid_account_name(account):
+            return "Invalid account name. Use letters, digits, '.', '_', '@', '+' or '-'.", 400
+        token_path = gmail_core.account_token_path(account)
+        os.makedirs(os.path.dirname(token_path), exist_ok=True)
+        file.save(token_path)
+        gmail_core.reset_credentials(account)
         return redirect('/')
     else:
         return "Invalid filename. Must be credentials.json or token.json", 400
 
+@app.route('/api/accounts')
+def api_accounts():
+    """Authorized sending accounts with today's counters (for the accounts sharing the job queue)."""
+    pool = jobs.limiter
+    result = []
+    for name in gmail_core.list_accounts():
+        account = pool.get(name)
+        result.append(account.to_dict() if account else {'name': name, 'rate': round(pool.rate, 2), 'sent': 0, 'remaining': pool.daily_limit,
+                                                           'in_flight': 0, 'daily_limit': pool.daily_limit, 'exhausted': False})
+    return jsonify(result)
+
 @app.route('/api/delete_token', methods=['POST'])
 def delete_token():
-    if os.path.exists(TOKEN_PATH):
-        os.remove(TOKEN_PATH)
+    account = (request.get_json(silent=True) or {}).get('account') or gmail_core.DEFAULT_ACCOUNT
+    if not gmail_core.valid_account_name(account):
+        return jsonify({"error": "Invalid account name"}), 400
+    token_path = gmail_core.account_token_path(account)
+    if os.path.exists(token_path):
+        os.remove(token_path)
+        gmail_core.reset_credentials(account)
         return jsonify({"status": "deleted"})
     return jsonify({"status": "not_found"})
 
@@ -356,6 +596,12 @@ def delete_token():
 if __name__ == '__main__':
     # Ensure log directory exists
     os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+
+    # Log to process.log and publish every line to the dashboard's event stream
+    setup_logging()
+    bus_handler = BusLogHandler(bus)
+    bus_handler.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)s] %(message)s', '%Y-%m-%d %H:%M:%S'))
+    logging.getLogger().addHandler(bus_handler)
     
     print(f"Starting Server at http://localhost:5000")
     print(f"Working Directory: {parent_dir}")